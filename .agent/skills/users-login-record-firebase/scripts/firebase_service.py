@@ -12,8 +12,6 @@ import os
 from datetime import datetime, timezone
 from typing import Optional
 import json
-import firebase_admin
-from firebase_admin import credentials, firestore
 import requests
 
 
@@ -28,6 +26,15 @@ def _initialize_firebase():
     
     if _firebase_app is not None and _firestore_client is not None:
         return True
+
+    # Imported here rather than at module level: firebase_admin (and grpc behind it) is slow
+    # to import and the login page only needs it once a login event is written.
+    try:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+    except ImportError as e:
+        print(f"⚠️ firebase_admin not installed, login history disabled: {e}")
+        return False
     
 
 
@@ -0,0 +1,258 @@
+"""
+Cross-process cache for market data and FX fetches.
+
+@st.cache_data lives in one process's memory, so every Cloud Run instance or Pi restart
+refetches the same Yahoo history. Functions decorated with @shared_cache store their
+results in a backend selected by environment variables and shared by every worker:
+
+    MARKET_CACHE_BACKEND   'sqlite' (default), 'redis', 'memory' or 'none'
+    MARKET_CACHE_PATH      SQLite file (default .cache/market_data.sqlite)
+    MARKET_CACHE_URL       Redis URL, eg. redis://localhost:6379/0 (any Redis-compatible server)
+    MARKET_CACHE_MAX_MB    size budget; least recently used entries are evicted beyond it
+
+Values are pickled, so callers always get their own copy and may mutate it. A backend
+error never fails the wrapped call; it is logged and the function runs uncached.
+
+eg. @shared_cache("fx", ttl=3600)
+    def fetch_fx(pair, start): ...
+
+    set_cache_backend(MemoryBackend())   # in-process stand-in, eg. for tests
+"""
+
+import functools
+import hashlib
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    REDIS_AVAILABLE = False
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.realpath(__file__)), ".cache", "market_data.sqlite")
+DEFAULT_MAX_MB = 256
+
+
+class MemoryBackend:
+    """In-process LRU with TTLs; the stand-in for SQLite/Redis in a single process."""
+
+    def __init__(self, max_bytes: int = DEFAULT_MAX_MB << 20):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (expires_at or None, pickled value)
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Pickled value for `key`, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at is not None and expires_at <= time.time():
+                self._pop(key)
+                return None
+            self._entries.move_to_end(key)
+            return data
+
+    def set(self, key: str, data: bytes, ttl: float = None):
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (time.time() + ttl if ttl else None, data)
+            self._size += len(data)
+            while self._size > self.max_bytes and len(self._entries) > 1:
+                self._pop(next(iter(self._entries)))
+
+    def delete(self, key: str):
+        with self._lock:
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _pop(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[1])
+
+
+class SQLiteBackend:
+    """Disk cache shared by every process on the host, with TTLs and LRU eviction by size."""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_MB << 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL, accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)")
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] <= now:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, data: bytes, ttl: float = None):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(data), len(data), now + ttl if ttl else None, now)
+            )
+            self._evict(conn, now)
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """Drop expired entries, then the least recently used ones until under max_bytes."""
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        to_drop = []
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed_at"):
+            if total <= self.max_bytes:
+                break
+            to_drop.append((key,))
+            total -= size
+        conn.executemany("DELETE FROM cache WHERE key = ?", to_drop)
+
+    def delete(self, key: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM cache")
+
+
+class RedisBackend:
+    """Redis (or any Redis-compatible server) shared across hosts.
+
+    TTLs map to SET EX; size-based eviction is the server's job, eg. maxmemory with
+    maxmemory-policy allkeys-lru.
+    """
+
+    def __init__(self, url: str, prefix: str = "market_cache:"):
+        if not REDIS_AVAILABLE:
+            raise ImportError("MARKET_CACHE_BACKEND=redis needs the 'redis' package")
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key: str):
+        return self.client.get(self.prefix + key)
+
+    def set(self, key: str, data: bytes, ttl: float = None):
+        self.client.set(self.prefix + key, data, ex=int(ttl) if ttl else None)
+
+    def delete(self, key: str):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + "*"):
+            self.client.delete(key)
+
+
+def backend_from_env():
+    """Backend configured by MARKET_CACHE_* variables; None when caching is disabled."""
+    kind = os.environ.get("MARKET_CACHE_BACKEND", "sqlite").lower()
+    max_bytes = int(float(os.environ.get("MARKET_CACHE_MAX_MB", DEFAULT_MAX_MB)) * (1 << 20))
+    if kind in ("", "none", "off", "0"):
+        return None
+    if kind == "memory":
+        return MemoryBackend(max_bytes)
+    if kind == "redis":
+        return RedisBackend(os.environ.get("MARKET_CACHE_URL", "redis://localhost:6379/0"))
+    if kind == "sqlite":
+        return SQLiteBackend(os.environ.get("MARKET_CACHE_PATH", DEFAULT_CACHE_PATH), max_bytes)
+    raise ValueError(f"Unknown MARKET_CACHE_BACKEND {kind!r}, expected sqlite, redis, memory or none")
+
+
+_backend = None
+_backend_ready = False
+_backend_lock = threading.Lock()
+
+
+def get_cache_backend():
+    """Process-wide backend, created from the environment on first use."""
+    global _backend, _backend_ready
+    with _backend_lock:
+        if not _backend_ready:
+            try:
+                _backend = backend_from_env()
+            except Exception as e:
+                print(f"Market data cache disabled: {e}")
+                _backend = None
+            _backend_ready = True
+        return _backend
+
+
+def set_cache_backend(backend):
+    """Replace the process-wide backend (None disables caching)."""
+    global _backend, _backend_ready
+    with _backend_lock:
+        _backend, _backend_ready = backend, True
+
+
+def cache_key(namespace: str, *args, **kwargs) -> str:
+    digest = hashlib.blake2b(repr((args, sorted(kwargs.items()))).encode(), digest_size=16)
+    return f"{namespace}:{digest.hexdigest()}"
+
+
+def shared_cache(namespace: str, ttl=None):
+    """Cache a function's result in the shared backend, keyed by the repr of its arguments.
+
+    Args:
+        namespace: key prefix, eg. 'yahoo_v8'; bump it when the return format changes
+        ttl: seconds to keep a result, or a callable (*args, **kwargs) -> seconds; None keeps it until evicted
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            backend = get_cache_backend()
+            if backend is None:
+                return fn(*args, **kwargs)
+            key = cache_key(namespace, *args, **kwargs)
+            try:
+                data = backend.get(key)
+                if data is not None:
+                    return pickle.loads(data)
+            except Exception as e:
+                print(f"Cache read failed for {namespace}: {e}")
+            result = fn(*args, **kwargs)
+            try:
+                seconds = ttl(*args, **kwargs) if callable(ttl) else ttl
+                backend.set(key, pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL), seconds)
+            except Exception as e:
+                print(f"Cache write failed for {namespace}: {e}")
+            return result
+        return wrapper
+    return decorator
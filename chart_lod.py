@@ -0,0 +1,119 @@
+"""
+Level-of-detail downsampling for long time-series charts.
+
+Plotly ships every point of every trace to the browser, so a multi-year daily (or intraday)
+series is mostly points that land on the same pixel. Charts reduce each line to roughly
+one point per horizontal pixel before building traces:
+
+  - 'lttb' (Largest-Triangle-Three-Buckets) keeps the points that preserve the visual shape
+  - 'minmax' keeps each bucket's lowest and highest point, so spikes are never dropped
+
+Zooming in is served by passing a narrower x_range: the visible slice is downsampled to
+the same budget, i.e. more detail per day. Traces that still exceed WEBGL_THRESHOLD
+points (eg. with downsampling disabled) are drawn with Scattergl instead of SVG.
+
+eg. df_plot = lod_frame(df, 'Date', ['Portfolio Value (GBP)'], x_range=(start, end))
+    fig.add_trace(line_trace(df_plot['Date'], df_plot['Portfolio Value (GBP)'], name='My Portfolio'))
+"""
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+DEFAULT_PIXEL_BUDGET = 1200  # about the plot width of a wide Streamlit column
+WEBGL_THRESHOLD = 5000
+
+
+def _as_float(x) -> np.ndarray:
+    """Numeric x axis for area calculations (datetimes become nanoseconds)."""
+    x = pd.Series(x)
+    if pd.api.types.is_datetime64_any_dtype(x):
+        return x.astype('int64').to_numpy(dtype='float64')
+    if x.dtype == object:
+        return pd.to_datetime(x).astype('int64').to_numpy(dtype='float64')
+    return x.to_numpy(dtype='float64')
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Positions of the `n_out` points Largest-Triangle-Three-Buckets keeps (first and last included)."""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)  # n_out - 2 buckets between the end points
+    # average of every bucket, used as the third triangle vertex of the bucket before it
+    counts = np.diff(edges)
+    avg_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / counts
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - avg_x[i]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y[i] - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Positions of each bucket's minimum and maximum (n_out // 2 buckets), in order, ends included."""
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+    bucket = np.arange(n) * (n_out // 2) // n
+    s = pd.Series(y)
+    keep = np.concatenate([[0, n - 1], s.groupby(bucket).idxmin().to_numpy(), s.groupby(bucket).idxmax().to_numpy()])
+    return np.unique(keep)
+
+
+def in_x_range(x, x_range: tuple) -> np.ndarray:
+    """Mask of `x` within `x_range`; datetime ranges are whole days, so the end day is kept in full.
+
+    eg. in_x_range(timestamps, ('2025-01-01', '2025-01-31'))  -> every tick up to 2025-01-31 23:59:59.999
+    """
+    x, (start, end) = pd.Series(x), x_range
+    if pd.api.types.is_numeric_dtype(x):
+        return ((x >= start) & (x <= end)).to_numpy()
+    x, start, end = pd.to_datetime(x), pd.Timestamp(start), pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+    return ((x >= start) & (x < end)).to_numpy()
+
+
+DOWNSAMPLERS = {
+    'lttb': lambda x, y, n_out: lttb_indices(x, y, n_out),
+    'minmax': lambda x, y, n_out: minmax_indices(y, n_out),
+}
+
+
+def lod_frame(df: pd.DataFrame, x_col: str, y_cols: list, max_points: int = DEFAULT_PIXEL_BUDGET,
+              x_range: tuple = None, method: str = 'lttb') -> pd.DataFrame:
+    """Rows of `df` worth drawing: within `x_range`, at most about `max_points` per y column.
+
+    Args:
+        df: frame with the x column and one or more y columns
+        x_col: x axis column, eg. 'Date'
+        y_cols: columns that will be drawn as lines; the kept rows are the union over them
+        max_points: pixel budget per line; None disables downsampling
+        x_range: optional (start, end) inclusive slice of x, eg. the zoomed-in date range (see in_x_range)
+        method: key of DOWNSAMPLERS
+    """
+    if x_range is not None:
+        df = df[in_x_range(df[x_col], x_range)]
+    df = df.sort_values(x_col)
+    if max_points is None or len(df) <= max_points:
+        return df
+    x = _as_float(df[x_col])
+    keep = []
+    for col in y_cols:
+        y = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype='float64')
+        finite = np.flatnonzero(np.isfinite(y))
+        keep.append(finite[DOWNSAMPLERS[method](x[finite], y[finite], max_points)])
+    return df.iloc[np.unique(np.concatenate(keep))]
+
+
+def line_trace(x, y, **kwargs):
+    """go.Scatter line, or go.Scattergl once the trace is too long for SVG."""
+    trace = go.Scattergl if len(x) > WEBGL_THRESHOLD else go.Scatter
+    return trace(x=x, y=y, mode=kwargs.pop('mode', 'lines'), **kwargs)
@@ -0,0 +1,59 @@
+"""
+Process-wide memo of Plotly figures, keyed by a fingerprint of the builder's inputs.
+
+Streamlit reruns the whole script on every widget change, so every chart is rebuilt even
+when its data did not change. Builders decorated with @memoise_figure return the figure
+built last time for identical inputs (DataFrames and arrays are hashed by content, see
+session_dag.fingerprint), shared by every session in the process.
+
+Returned figures are shared: treat them as read-only, or copy with go.Figure(fig) before
+calling update_layout/add_trace on them.
+
+    @memoise_figure
+    def plot_cashflow(net_cashflow: dict): ...
+
+    figure_cache_stats()  -> {'hits': 12, 'misses': 3, 'size': 3}
+"""
+
+import functools
+import threading
+from collections import OrderedDict
+
+from session_dag import fingerprint
+
+MAX_FIGURES = 128
+
+_figures = OrderedDict()  # key -> figure, least recently used first
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+
+def memoise_figure(fn):
+    """Return the cached figure of `fn` for inputs with the same fingerprint, building it otherwise."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = fingerprint((fn.__module__, fn.__qualname__, args, kwargs))
+        with _lock:
+            fig = _figures.get(key)
+            if fig is not None:
+                _figures.move_to_end(key)
+                _stats['hits'] += 1
+                return fig
+            _stats['misses'] += 1
+        fig = fn(*args, **kwargs)
+        with _lock:
+            _figures[key] = fig
+            while len(_figures) > MAX_FIGURES:
+                _figures.popitem(last=False)
+        return fig
+    return wrapper
+
+
+def figure_cache_stats() -> dict:
+    with _lock:
+        return {**_stats, 'size': len(_figures)}
+
+
+def clear_figure_cache():
+    with _lock:
+        _figures.clear()
@@ -0,0 +1,411 @@
+"""
+Pre-aggregated rollups of FNZ New Relic performance exports.
+
+An export has one row per facet (endpoint) and hour with 'RecordCount', 'p95 (in ms)' and
+possibly other percentile columns (eg. 'p99 (in ms)').
+It is read in chunks of CHUNK_ROWS rows; each chunk is parsed, aggregated and folded into
+running rollups, so peak memory depends on the chunk size and the number of
+(service, facet, day) and (service, hour) keys, not on the size of the export. The rollups
+are stored as Parquet under .cache/fnz_rollups/<file hash>/:
+
+    hourly           (service, date)          RecordCount
+    daily            (service, facet, day)    RecordCount[, breach_records, breach_rows]
+    daily_sketches   (service, day, bucket)   count - latency sketches, see latency_sketch
+    hourly_sketches  (service, date, bucket)  count
+    breaches         raw rows over their SLA (only when an SLA table is given)
+
+Percentiles are never averaged: p95/p99 of a day, month or service come from merging the
+daily sketches, and the report queries these frames instead of the raw export. Sketch
+services are categorical and buckets int16, since with one percentile per row there are
+about as many sketch rows as hours of traffic per service. The hourly sketches are the
+largest rollup and are only used for the hourly chart of one service and day, so
+get_rollups() leaves them on disk and service_day_sketches() reads just those rows.
+When an SLA table
+({facet: SLA}, see load_sla_table) is given, rows whose p95 is over SLA * SLA_MS_PER_UNIT
+are counted as breaches; breach_counts() and breach_calendar() summarise them per day or week.
+
+Every ingested export is also filed into a MonthlyStore (.cache/fnz_rollups/months/<YYYY-MM>/),
+so month-over-month trends come from the stored aggregates without the raw exports.
+
+eg. rollups = get_rollups(uploaded_file.getvalue())
+    service_summary(rollups['daily'], rollups['daily_sketches'])                   -> total_counts, p95, p99 per service
+    service_daily(rollups['daily'], rollups['daily_sketches'], 'accountpayments')  -> RecordCount, p95/p99 per day
+    monthly_trend(store.load(), store.load(name='daily_sketches'))                 -> per service and month, with changes
+"""
+
+import hashlib
+import io
+import logging
+import os
+import re
+
+import pandas as pd
+
+import latency_sketch
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), ".cache", "fnz_rollups")
+MONTHS_DIR = os.path.join(ROLLUP_DIR, "months")
+DAILY_SKETCHES = 'daily_sketches'
+HOURLY_SKETCHES = 'hourly_sketches'
+ROLLUP_NAMES = ('hourly', 'daily', DAILY_SKETCHES, HOURLY_SKETCHES)
+QUERY_NAMES = ('hourly', 'daily', DAILY_SKETCHES)  # what get_rollups() returns; see service_day_sketches
+BREACHES = 'breaches'
+CHUNK_ROWS = 250_000
+
+DAY_FORMAT = '%d/%m/%y'
+HOUR_FORMAT = '%I:%M:%S %p'
+P95 = 'p95 (in ms)'
+P99 = 'p99 (in ms)'
+QUANTILES = (0.95, 0.99)
+BASE_COLUMNS = ['Date', 'Hour', 'facet', 'RecordCount']
+# the service is the first path segment after the API prefix, eg. .../v3/accountpayments/{id}
+SERVICE_PATTERN = re.compile(r'WebTransaction/ASP/api/distribution/v3/([^/]*)')
+SLA_PATH = "FNZlatencySLA.csv"  # columns 'FNZ DISTRIBUTION API' (facet) and 'SLA'
+SLA_MS_PER_UNIT = 1200  # p95 breaches when over SLA * 1200 ms
+DEFAULT_SLA = 10000  # facets without an SLA get one nothing breaches
+
+
+def add_service(df: pd.DataFrame) -> pd.DataFrame:
+    """Add 'service' from 'facet', falling back to the facet's last segment outside the API prefix."""
+    service = df['facet'].str.extract(SERVICE_PATTERN, expand=False)
+    df['service'] = service.fillna(df['facet'].str.split('/').str[-1])
+    return df
+
+
+def parse_dates(day: pd.Series, hour: pd.Series) -> pd.Series:
+    """Hourly timestamps from 'Date' (eg. 31/01/25) and 'Hour' (eg. 01:00:00 PM).
+
+    Days are parsed with to_datetime's cache of repeated values and the few distinct
+    hours once each, instead of parsing a concatenated string per row.
+    """
+    days = pd.to_datetime(day, format=DAY_FORMAT, cache=True)
+    hour_codes, hour_values = pd.factorize(hour)
+    offsets = pd.to_datetime(pd.Series(hour_values), format=HOUR_FORMAT) - pd.Timestamp('1900-01-01')
+    return days + pd.Series(offsets.to_numpy()[hour_codes], index=day.index)
+
+
+def _prepare(chunk: pd.DataFrame) -> pd.DataFrame:
+    chunk['date'] = parse_dates(chunk['Date'], chunk['Hour'])
+    return add_service(chunk)
+
+
+def parse_report(data: bytes) -> pd.DataFrame:
+    """Raw export rows with an hourly 'date' timestamp and 'service'."""
+    return _prepare(pd.read_csv(io.BytesIO(data)))
+
+
+def iter_report_chunks(data: bytes, chunksize: int = CHUNK_ROWS):
+    """Parsed export rows, `chunksize` at a time, reading only the columns rollups use."""
+    def usecols(col):
+        return col in BASE_COLUMNS or latency_sketch.PERCENTILE_PATTERN.match(col) is not None
+
+    with pd.read_csv(io.BytesIO(data), usecols=usecols, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield _prepare(chunk)
+
+
+def _aggregate(df: pd.DataFrame, keys: list, breach: pd.Series = None) -> pd.DataFrame:
+    aggs = dict(RecordCount=('RecordCount', 'sum'))
+    if breach is not None:
+        df = df.assign(breach_records=df['RecordCount'].where(breach, 0), breach_rows=breach.astype('int64'))
+        aggs.update(breach_records=('breach_records', 'sum'), breach_rows=('breach_rows', 'sum'))
+    return df.groupby(keys, observed=True).agg(**aggs).reset_index()
+
+
+def _compact_sketch(df: pd.DataFrame) -> pd.DataFrame:
+    """Sketch rows with a categorical service and int16 buckets (latency_sketch buckets fit easily)."""
+    return df.astype({'service': 'category', 'bucket': 'int16'})
+
+
+def load_sla_table(path: str = SLA_PATH) -> dict:
+    """{facet: SLA} from the SLA csv, eg. {'WebTransaction/ASP/api/distribution/v3/accountpayments': 2}"""
+    df_sla = pd.read_csv(path, usecols=['FNZ DISTRIBUTION API', 'SLA']).dropna()
+    return dict(zip(df_sla['FNZ DISTRIBUTION API'], df_sla['SLA'].astype('float64')))
+
+
+def facet_sla(facets: pd.Series, sla: dict) -> pd.Series:
+    """SLA of each facet, DEFAULT_SLA where the table has none."""
+    return facets.map(sla).fillna(DEFAULT_SLA).astype('float64')
+
+
+def sla_breaches(df: pd.DataFrame, sla: dict) -> pd.Series:
+    """True for rows whose p95 is over their facet's SLA (see SLA_MS_PER_UNIT)."""
+    return df[P95] > facet_sla(df['facet'], sla) * SLA_MS_PER_UNIT
+
+
+class RollupAccumulator:
+    """Running rollups: add() aggregates a chunk, and partials are re-summed as they pile up."""
+
+    COMPACT_EVERY = 16  # partial frames kept before they are folded together
+
+    def __init__(self, sla: dict = None):
+        self.sla = sla
+        self.names = ROLLUP_NAMES + ((BREACHES,) if sla is not None else ())
+        self._partials = {name: [] for name in self.names}
+
+    def add(self, chunk: pd.DataFrame):
+        breach = None
+        if self.sla is not None:
+            breach = sla_breaches(chunk, self.sla)
+            rows = chunk.loc[breach, ['date', 'service', 'facet', 'RecordCount', P95]]
+            self._partials[BREACHES].append(rows.assign(SLA=facet_sla(rows['facet'], self.sla)))
+        self._partials['hourly'].append(_aggregate(chunk, ['service', 'date']))
+        # facets are merged per service straight away; the report never asks for a facet's percentiles
+        hourly_sketches = latency_sketch.sketch_rows(chunk, ['service', 'date'], 'RecordCount')
+        daily_sketches = latency_sketch.merge(hourly_sketches.assign(day=hourly_sketches['date'].dt.normalize()),
+                                              ['service', 'day'])
+        self._partials[HOURLY_SKETCHES].append(_compact_sketch(hourly_sketches))
+        self._partials[DAILY_SKETCHES].append(_compact_sketch(daily_sketches))
+        self._partials['daily'].append(
+            _aggregate(chunk.assign(day=chunk['date'].dt.normalize()), ['service', 'facet', 'day'], breach)
+        )
+        if len(self._partials['daily']) >= self.COMPACT_EVERY:
+            for name in self.names:
+                self._partials[name] = [self._fold(name)]
+
+    def _fold(self, name: str) -> pd.DataFrame:
+        df = pd.concat(self._partials[name], ignore_index=True)
+        if name == BREACHES:
+            return df
+        if name == HOURLY_SKETCHES:
+            return _compact_sketch(latency_sketch.merge(df, ['service', 'date']))
+        if name == DAILY_SKETCHES:
+            return _compact_sketch(latency_sketch.merge(df, ['service', 'day']))
+        keys = ['service', 'date'] if name == 'hourly' else ['service', 'facet', 'day']
+        return df.groupby(keys, observed=True).sum().reset_index()
+
+    def result(self) -> dict:
+        rollups = {name: self._fold(name) for name in self.names}
+        # sorted by service so a read of one service's hourly sketches touches few row groups
+        rollups[HOURLY_SKETCHES] = rollups[HOURLY_SKETCHES].sort_values(['service', 'date'], ignore_index=True)
+        return rollups
+
+
+def build_rollups(df: pd.DataFrame, sla: dict = None) -> dict:
+    """{'hourly': ..., 'daily': ..., ...} from parsed export rows (see module docstring)."""
+    acc = RollupAccumulator(sla)
+    acc.add(df)
+    return acc.result()
+
+
+def ingest(data: bytes, sla: dict = None, chunksize: int = CHUNK_ROWS) -> dict:
+    """Rollups of a whole export, streamed through in chunks with bounded memory."""
+    acc = RollupAccumulator(sla)
+    for chunk in iter_report_chunks(data, chunksize):
+        acc.add(chunk)
+    return acc.result()
+
+
+def report_key(data: bytes, sla: dict = None) -> str:
+    """Content hash of the export, plus the SLA table's when breaches are counted."""
+    key = hashlib.sha256(data).hexdigest()[:16]
+    if sla is not None:
+        key += "-" + hashlib.sha256(repr(sorted(sla.items())).encode()).hexdigest()[:8]
+    return key
+
+
+class RollupStore:
+    """Parquet rollups per export, keyed by the export's content hash."""
+
+    def __init__(self, root: str = ROLLUP_DIR):
+        self.root = root
+
+    def _path(self, key: str, name: str) -> str:
+        return os.path.join(self.root, key, f"{name}.parquet")
+
+    def has(self, key: str, names: tuple = ROLLUP_NAMES) -> bool:
+        return all(os.path.exists(self._path(key, name)) for name in names)
+
+    def read(self, key: str, name: str, filters: list = None) -> pd.DataFrame:
+        """One stored rollup; `filters` (Parquet row filters) reads only the matching rows."""
+        return pd.read_parquet(self._path(key, name), filters=filters)
+
+    def load(self, key: str, names: tuple = ROLLUP_NAMES):
+        """Stored rollups for `key`, or None if any of `names` is missing."""
+        if not self.has(key, names):
+            return None
+        return {name: self.read(key, name) for name in names}
+
+    def save(self, key: str, rollups: dict):
+        os.makedirs(os.path.join(self.root, key), exist_ok=True)
+        for name, df in rollups.items():
+            tmp_path = self._path(key, name) + ".tmp"
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self._path(key, name))
+
+
+def get_rollups(data: bytes, sla: dict = None, store: RollupStore = None) -> dict:
+    """QUERY_NAMES rollups (and breaches) of an uploaded export, ingesting it only if this content was never seen before.
+
+    The hourly sketches stay on disk; read one service and day of them with service_day_sketches().
+    """
+    store = store or RollupStore()
+    key = report_key(data, sla)
+    breaches = (BREACHES,) if sla is not None else ()
+    if store.has(key, ROLLUP_NAMES + breaches):
+        return store.load(key, QUERY_NAMES + breaches)
+    rollups = ingest(data, sla)
+    store.save(key, rollups)
+    logger.info(f"Built FNZ rollups {key}: " + ", ".join(f"{n} {len(df)} rows" for n, df in rollups.items()))
+    return {name: rollups[name] for name in QUERY_NAMES + breaches}
+
+
+def service_day_sketches(key: str, service: str, day, store: RollupStore = None) -> pd.DataFrame:
+    """Hourly sketches of one service on one day, read from the stored rollups of report `key`.
+
+    eg. service_day_sketches(report_key(data, sla), 'accountpayments', '2025-01-31')
+    """
+    store = store or RollupStore()
+    day = pd.Timestamp(day).normalize()
+    filters = [('service', '==', service), ('date', '>=', day), ('date', '<', day + pd.Timedelta(days=1))]
+    return store.read(key, HOURLY_SKETCHES, filters)
+
+
+class MonthlyStore:
+    """Rollups filed by calendar month, eg. months/2025-01/daily.parquet, across every export ingested.
+
+    Saving replaces the stored rows of the days the new rollups cover and keeps the rest, so
+    re-uploading a month, or an export that straddles two months, never duplicates or drops days.
+    """
+
+    DAY_COLUMNS = {'hourly': 'date', 'daily': 'day', DAILY_SKETCHES: 'day', HOURLY_SKETCHES: 'date', BREACHES: 'date'}
+
+    def __init__(self, root: str = MONTHS_DIR):
+        self.root = root
+        self._store = RollupStore(root)  # one directory per month instead of per export
+
+    def _path(self, month: str, name: str) -> str:
+        return self._store._path(month, name)
+
+    def months(self) -> list:
+        """Stored months, oldest first, eg. ['2024-12', '2025-01']"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(m for m in os.listdir(self.root) if os.path.exists(self._path(m, 'daily')))
+
+    def _read(self, month: str, name: str):
+        path = self._path(month, name)
+        return pd.read_parquet(path) if os.path.exists(path) else None
+
+    def add(self, rollups: dict) -> list:
+        """File `rollups` under the months they cover; returns those months."""
+        months = rollups['daily']['day'].dt.to_period('M')
+        for month in months.unique():
+            key = str(month)
+            merged = {}
+            for name, df in rollups.items():
+                days = df[self.DAY_COLUMNS[name]].dt.normalize()
+                new_rows = df.loc[days.dt.to_period('M') == month]
+                stored = self._read(key, name)
+                if stored is not None:
+                    stored_days = stored[self.DAY_COLUMNS[name]].dt.normalize()
+                    stored = stored.loc[~stored_days.isin(days.unique())]
+                    new_rows = pd.concat([stored, new_rows], ignore_index=True)
+                merged[name] = new_rows.sort_values(self.DAY_COLUMNS[name], kind='stable')
+                if name in (DAILY_SKETCHES, HOURLY_SKETCHES):
+                    merged[name] = _compact_sketch(merged[name])  # concat of differing categories gives object
+            self._store.save(key, merged)
+        filed = [str(m) for m in months.unique()]
+        logger.info(f"Filed FNZ rollups under {', '.join(filed)}")
+        return filed
+
+    def load(self, months: list = None, name: str = 'daily') -> pd.DataFrame:
+        """One rollup (default 'daily') of the given months, all stored months by default."""
+        frames = [self._read(m, name) for m in (months or self.months())]
+        frames = [df for df in frames if df is not None]
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+
+# ─── Queries ──────────────────────────────────────────────────────────
+
+def _quantiles(sketches: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """p95 (in ms) and p99 (in ms) of the sketches merged per `keys`."""
+    merged = latency_sketch.merged_quantiles(sketches, keys, QUANTILES)
+    return merged.rename(columns={'p95': P95, 'p99': P99})
+
+
+def service_summary(daily: pd.DataFrame, sketches: pd.DataFrame) -> pd.DataFrame:
+    """Total hits and p95/p99 over the whole export per service, indexed by service; `sketches` are the daily ones."""
+    summary = daily.groupby('service')[['RecordCount']].sum().rename(columns={'RecordCount': 'total_counts'})
+    return summary.join(_quantiles(sketches, ['service']).rename(columns={P95: 'p95', P99: 'p99'}))
+
+
+def service_facets(daily: pd.DataFrame, service: str) -> list:
+    """Facets (endpoints) of a service, in order of first appearance."""
+    return daily.loc[daily['service'] == service].sort_values('day', kind='stable')['facet'].unique().tolist()
+
+
+def service_daily(daily: pd.DataFrame, sketches: pd.DataFrame, service: str) -> pd.DataFrame:
+    """RecordCount and p95/p99 per calendar day for one service, days without rows included; `sketches` are the daily ones."""
+    rows = daily.loc[daily['service'] == service]
+    agg = rows.groupby('day')[['RecordCount']].sum()
+    agg = agg.join(_quantiles(sketches.loc[sketches['service'] == service], ['day']))
+    days = pd.date_range(agg.index.min(), agg.index.max(), freq='D', name='date')
+    agg = agg.reindex(days)
+    agg['RecordCount'] = agg['RecordCount'].fillna(0)
+    return agg
+
+
+def service_hourly(hourly: pd.DataFrame, sketches: pd.DataFrame, service: str, day) -> pd.DataFrame:
+    """RecordCount and p95/p99 (over all the service's facets) per hour of `day` for one service.
+
+    `sketches` are hourly ones, eg. service_day_sketches(key, service, day).
+    """
+    day = pd.Timestamp(day)
+    rows = hourly.loc[(hourly['service'] == service) & (hourly['date'].dt.normalize() == day)]
+    service_sketches = sketches.loc[(sketches['service'] == service) & (sketches['date'].dt.normalize() == day)]
+    return rows.set_index('date')[['RecordCount']].join(_quantiles(service_sketches, ['date']))
+
+
+# ─── SLA breaches ─────────────────────────────────────────────────────
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+
+def breach_counts(daily: pd.DataFrame, freq: str = 'D') -> pd.DataFrame:
+    """Breaching queries (breach_records) and hourly rows (breach_rows) per day ('D') or week ('W-SUN').
+
+    Needs rollups built with an SLA table.
+    """
+    return daily.groupby(pd.Grouper(key='day', freq=freq))[['breach_records', 'breach_rows']].sum()
+
+
+def breach_calendar(daily: pd.DataFrame) -> dict:
+    """Calendar grid of breaching queries, one row per Monday-to-Sunday week of the report.
+
+    Returns:
+        dict with 'z' (weeks x 7 breach counts, NaN outside the report), 'text' (weeks x 7
+        dd/mm labels), 'x' (WEEKDAYS) and 'y' (week labels, eg. 'w/c 06/01/25')
+    """
+    per_day = breach_counts(daily)['breach_records']
+    first, last = daily['day'].min(), daily['day'].max()
+    start = first - pd.Timedelta(days=first.weekday())
+    end = last + pd.Timedelta(days=6 - last.weekday())
+    days = pd.date_range(start, end, freq='D')
+    z = per_day.reindex(days).to_numpy(dtype='float64')  # the grouper already fills report days with 0
+    return dict(
+        z=z.reshape(-1, 7),
+        text=days.strftime('%d/%m').to_numpy().reshape(-1, 7),
+        x=WEEKDAYS,
+        y=['w/c ' + d for d in days[::7].strftime('%d/%m/%y')],
+    )
+
+
+# ─── Trends ───────────────────────────────────────────────────────────
+
+def monthly_trend(daily: pd.DataFrame, sketches: pd.DataFrame) -> pd.DataFrame:
+    """RecordCount and p95/p99 per service and month from the daily rollup and sketches, with month-over-month changes.
+
+    Returns:
+        frame indexed by (service, month) with RecordCount, p95 (in ms), p99 (in ms),
+        traffic_change and p95_change (fractions, eg. 0.12 for +12%, NaN for a service's first month)
+    """
+    keys = [daily['service'], daily['day'].dt.to_period('M').rename('month')]
+    agg = daily.groupby(keys)[['RecordCount']].sum()
+    agg = agg.join(_quantiles(sketches.assign(month=sketches['day'].dt.to_period('M')), ['service', 'month']))
+    by_service = agg.groupby(level='service')
+    agg['traffic_change'] = by_service['RecordCount'].pct_change()
+    agg['p95_change'] = by_service[P95].pct_change()
+    return agg
@@ -2,11 +2,15 @@
 from time import sleep
 import miniEnc as enc
 import ast
+import os
+import threading
 import requests
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from market_data_api import OHLC_YahooFinance
 import streamlit as st
+from reference_data import TickerReferenceStore, get_ticker_store
 
 def chunks(l, n):
     ll = list(l)
@@ -87,48 +91,118 @@ def getEODpriceUK(L) -> dict:
 
 
 
-def getEODpriceISIN(isin_list : list) -> dict:
-    try:
-        k = st.secrets["api_keys"]
-        print(k)
-    except Exception as e:
-        # If st.secrets is not available (e.g. running as script)
-        # the function will likely fail or return early
-        print(e)
-        return {}
+EODHD_URL = "https://eodhd.com/api"
+# ISIN -> EODHD symbol; listings rarely move, so resolved mappings are kept on disk for good
+ISIN_SYMBOL_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "isin_to_eodhd_symbol.json")
+
+
+class IsinPriceResolver:
+    """Real-time EODHD prices for ISINs, with a permanent ISIN -> symbol cache.
+
+    Each ISIN costs one id-mapping request the first time it is seen and none afterwards;
+    price requests for all ISINs run concurrently on a bounded pool. The API token is sent
+    as a query parameter and never logged.
+
+    eg. resolver = get_isin_resolver()
+        resolver.prices(['US0378331005'])  -> {'US0378331005': 227.5}
+        resolver.stats                     -> {'symbol_hits': 0, 'symbol_misses': 1, ...}
+    """
+
+    def __init__(self, api_token: str, store: TickerReferenceStore = None, max_workers: int = 8, timeout: float = 10):
+        self.api_token = api_token
+        self.store = store or get_ticker_store(ISIN_SYMBOL_FILE)
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._stats_lock = threading.Lock()
+        self.stats = {'symbol_hits': 0, 'symbol_misses': 0, 'price_ok': 0, 'price_failed': 0}
+
+    def _count(self, key: str):
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _get_json(self, path: str, **params):
+        response = requests.get(f"{EODHD_URL}/{path}", params={**params, "api_token": self.api_token}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def lookup_symbol(self, isin: str):
+        """EODHD symbol (eg. 'AAPL.US') for an ISIN, or None if EODHD does not know it."""
+        r = self._get_json("id-mapping", **{"filter[isin]": isin})
+        data = r.get('data') if isinstance(r, dict) else None
+        return data[0]['symbol'] if data else None
+
+    def symbols(self, isin_list: list) -> dict:
+        """{isin: symbol} from the cache, looking up and saving unknown ISINs concurrently."""
+        mapping = self.store.mapping
+        isins = list(dict.fromkeys(i for i in isin_list if i))
+        known = {i: mapping[i] for i in isins if i in mapping}
+        unknown = [i for i in isins if i not in known]
+        with self._stats_lock:
+            self.stats['symbol_hits'] += len(known)
+            self.stats['symbol_misses'] += len(unknown)
+        if unknown:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(unknown))) as pool:
+                looked_up = dict(zip(unknown, pool.map(self._safe_lookup_symbol, unknown)))
+            resolved = {i: s for i, s in looked_up.items() if s}
+            if resolved:
+                self.store.update(resolved)
+            known.update(resolved)
+        return known
+
+    def _safe_lookup_symbol(self, isin: str):
+        try:
+            return self.lookup_symbol(isin)
+        except Exception as e:  # not cached, so the ISIN is retried next time
+            print(f"ISIN lookup failed for {isin}: {type(e).__name__}")
+            return None
 
-    eod_isin_price = {}
-    for i in isin_list:
-        url = f"https://eodhd.com/api/id-mapping?filter[isin]={i}&api_token={k.get('eodhd')}"
-        print(url)
-        response = requests.get(url)
-        print(response.text, response.status_code)
+    def _price(self, symbol: str):
         try:
-            response = requests.get(url)
-            if response.status_code == 200:
-                r = response.json()
-                if r.get('data'):
-                    ticker = r['data'][0]['symbol']
-                    
-                    price_url = f"https://eodhd.com/api/real-time/{ticker}?api_token={k.get('eodhd')}&fmt=json"
-                    price_response = requests.get(price_url)
-                    if price_response.status_code == 200:
-                        eod_isin_price[i] = price_response.json().get('close')
-                else:
-                    eod_isin_price[i] = None
-            else:
-                eod_isin_price[i] = None
+            close = self._get_json(f"real-time/{symbol}", fmt="json").get('close')
+            self._count('price_ok' if close is not None else 'price_failed')
+            return close
         except Exception as e:
-            print(e)
-            eod_isin_price[i] = None
-    
-    return eod_isin_price
-
-
-            
+            print(f"EODHD price failed for {symbol}: {type(e).__name__}")
+            self._count('price_failed')
+            return None
+
+    def prices(self, isin_list: list) -> dict:
+        """{isin: close} for every ISIN in `isin_list`; None where no price was found."""
+        isin_symbol = self.symbols(isin_list)
+        symbols = list(dict.fromkeys(isin_symbol.values()))
+        symbol_close = {}
+        if symbols:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(symbols))) as pool:
+                symbol_close = dict(zip(symbols, pool.map(self._price, symbols)))
+        return {i: symbol_close.get(isin_symbol.get(i)) for i in isin_list}
+
+
+_isin_resolver = None
+_isin_resolver_lock = threading.Lock()
+
+
+def get_isin_resolver():
+    """Process-wide resolver built from st.secrets["api_keys"]["eodhd"]; None without secrets."""
+    global _isin_resolver
+    with _isin_resolver_lock:
+        if _isin_resolver is None:
+            try:
+                token = st.secrets["api_keys"].get('eodhd')
+            except Exception as e:
+                # If st.secrets is not available (e.g. running as script)
+                print(f"No EODHD api key available: {type(e).__name__}")
+                return None
+            _isin_resolver = IsinPriceResolver(token)
+        return _isin_resolver
 
-        
 
+def getEODpriceISIN(isin_list : list) -> dict:
+    resolver = get_isin_resolver()
+    if resolver is None:
+        return {}
+    eod_isin_price = resolver.prices(isin_list)
+    print(f"getEODpriceISIN: {resolver.stats}")
+    return eod_isin_price
 
 
 def main():
@@ -8,11 +8,16 @@ import logging
 import os
 import json
 
+from ig_waits import AsyncWaits, log_wait_summary, visible_any
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Limit concurrent workers
+# Limit concurrent workers (one pre-warmed platform page each)
 CONCURRENCY_LIMIT = 5
+PLATFORM_URL = "https://trading.ig.com/common/latest/index.html"
+HEADLINE_SELECTOR = ".ig-news_headline"
+SEARCH_BOX_NAME = "Search by market name,"
 
 async def close_popups(page):
     """Attempt to close any blocking popups or promos."""
@@ -106,19 +111,24 @@ async def scrape_news_for_instrument(page, instrument: str, max_news_items=2, ex
     logger.info(f"Searching news for: {instrument}")
     if existing_headlines is None:
         existing_headlines = set()
+    waits = AsyncWaits(page)
     
     try:
         await page.get_by_role("listitem").filter(has_text="Search").locator("span").click()
     except:
         pass
-    await page.wait_for_timeout(1000)
     
-    search_box = page.get_by_role("textbox", name="Search by market name,")
+    search_box = page.get_by_role("textbox", name=SEARCH_BOX_NAME)
+    await waits.locator(search_box, "search box", timeout=5000)
     await search_box.fill("")
-    await page.wait_for_timeout(300)
     await search_box.fill(instrument)
+    # a page that searched before still shows those results until this search re-renders them
+    results = await waits.watch(HEADLINE_SELECTOR)
     await search_box.press("Enter")
-    await page.wait_for_timeout(3000)
+    if not await waits.changed(results, "search results re-rendered", timeout=5000):
+        logger.info(f"Search for {instrument} did not re-render the results, carrying on with the shown list")
+    await waits.selector(HEADLINE_SELECTOR, "search results", timeout=5000)
+    await waits.dom_settled("search results settled", quiet_ms=500, timeout=3000)
     
     news_items = []
     date_pattern = re.compile(r"(\d{1,2}\s*[./-]?\s*(?:Jan|Feb|Mar|Apr|May|Jun|Jul|Aug|Sep|Oct|Nov|Dec)[a-z]*\s*(?:[\'’]?\d{2,4})?)", re.IGNORECASE)
@@ -127,12 +137,12 @@ async def scrape_news_for_instrument(page, instrument: str, max_news_items=2, ex
     for i in range(max_news_items):
         try:
             await close_popups(page)
-            headlines = await page.locator(".ig-news_headline").all()
+            headlines = await page.locator(HEADLINE_SELECTOR).all()
             
             if i >= len(headlines):
                 await page.evaluate("window.scrollBy(0, 500)")
-                await page.wait_for_timeout(2000)
-                headlines = await page.locator(".ig-news_headline").all()
+                await waits.count_above(HEADLINE_SELECTOR, i, "more headlines after scroll", timeout=2000)
+                headlines = await page.locator(HEADLINE_SELECTOR).all()
                 if i >= len(headlines): break
             
             headline_el = headlines[i]
@@ -184,15 +194,13 @@ async def scrape_news_for_instrument(page, instrument: str, max_news_items=2, ex
             detail_date = ""
             modal = None
 
-            for _ in range(8):
-                all_modals = await page.locator(modal_selector).all()
-                for m in all_modals:
-                    if await m.is_visible():
-                        modal = m
-                        modal_found = True
-                        break
-                if modal_found: break
-                await page.wait_for_timeout(500)
+            if not row_popout_clicked:
+                await waits.selector(visible_any(modal_selector), "news modal", timeout=4000)
+            for m in await page.locator(modal_selector).all():
+                if await m.is_visible():
+                    modal = m
+                    modal_found = True
+                    break
             
             if modal_found:
                 # Basic Modal Extraction
@@ -205,7 +213,7 @@ async def scrape_news_for_instrument(page, instrument: str, max_news_items=2, ex
                         break
 
             await page.keyboard.press("Escape")
-            await page.wait_for_timeout(500)
+            await waits.dom_settled("news item closed", timeout=1000)
             
             final_date = detail_date if detail_date else list_date
             news_items.append({
@@ -240,34 +248,113 @@ def load_existing_news(filename):
         logger.error(f"Error reading existing CSV {filename}: {e}")
         return []
 
-async def process_instrument(browser, storage_state, instrument, output_dir, max_news_items, semaphore):
-    async with semaphore:
-        output_csv = os.path.join(output_dir, f"ig.news.{instrument}.csv")
-        existing_news = load_existing_news(output_csv)
-        existing_headlines = {item['headline'] for item in existing_news}
+class NewsPagePool:
+    """Long-lived browser contexts already on the platform's News panel, reused across instruments.
 
-        context = await browser.new_context(storage_state=storage_state)
-        page = await context.new_page()
+    Loading the platform costs every context ~12s, so the pool pays it once per slot up front
+    (all slots warm up concurrently) and workers check pages out instead of building their
+    own. The idle queue doubles as the concurrency limit. A page that failed is closed and
+    re-warmed by the next worker that checks its slot out.
+    """
+
+    def __init__(self, browser, storage_state, size=CONCURRENCY_LIMIT):
+        self.browser = browser
+        self.storage_state = storage_state
+        self.size = size
+        self._idle = asyncio.Queue()
+
+    async def _open_news_page(self):
+        context = await self.browser.new_context(storage_state=self.storage_state)
         try:
+            page = await context.new_page()
             await page.goto("https://www.ig.com/uk") # Base URL to ensure context loads
-            # Navigate to platform - logic simplified for concurrency
-            await page.goto("https://trading.ig.com/common/latest/index.html")
-            await page.wait_for_timeout(10000)
+            await page.goto(PLATFORM_URL)
+            waits = AsyncWaits(page)
+            await waits.locator(page.get_by_title("News"), "platform loaded", timeout=30000)
             await page.get_by_title("News").click()
-            await page.wait_for_timeout(2000)
-
-            new_news_items = await scrape_news_for_instrument(page, instrument, max_news_items, existing_headlines)
-            if new_news_items:
-                all_news = new_news_items + existing_news
-                save_to_csv(all_news, instrument, output_dir)
-                save_to_markdown(all_news, instrument, output_dir)
-                logger.info(f"Added {len(new_news_items)} new items for {instrument}.")
-            else:
-                logger.info(f"No new news items found for {instrument}.")
-        except Exception as e:
-            logger.error(f"Error processing {instrument}: {e}")
-        finally:
+            await waits.locator(page.get_by_role("listitem").filter(has_text="Search"), "news panel", timeout=10000)
+            return page
+        except Exception:
             await context.close()
+            raise
+
+    async def start(self):
+        started = datetime.now()
+        pages = await asyncio.gather(*(self._open_news_page() for _ in range(self.size)), return_exceptions=True)
+        for page in pages:
+            if isinstance(page, Exception):
+                logger.error(f"Failed to warm up a news page: {page}")
+                page = None
+            await self._idle.put(page)
+        warm = sum(not isinstance(p, Exception) for p in pages)
+        logger.info(f"News page pool ready: {warm}/{self.size} pages warm in {(datetime.now() - started).total_seconds():.1f}s")
+
+    async def acquire(self):
+        page = await self._idle.get()
+        if page is None:
+            try:
+                page = await self._open_news_page()
+            except Exception:
+                await self._idle.put(None)
+                raise
+        return page
+
+    async def _reset(self, page):
+        """Close any open item and clear the search text.
+
+        The previous results stay on screen until the next search runs (only Enter searches);
+        scrape_news_for_instrument waits for its own search to re-render them, so nothing
+        is waited for here.
+        """
+        await page.keyboard.press("Escape")
+        await page.get_by_role("textbox", name=SEARCH_BOX_NAME).fill("", timeout=5000)
+
+    async def release(self, page, healthy=True):
+        """Return a page to the pool with its search cleared; an unhealthy one is closed and its slot re-warmed on next use."""
+        if healthy:
+            try:
+                await self._reset(page)
+            except Exception:
+                healthy = False
+        if not healthy:
+            try:
+                await page.context.close()
+            except Exception:
+                pass
+            page = None
+        await self._idle.put(page)
+
+    async def close(self):
+        while not self._idle.empty():
+            page = self._idle.get_nowait()
+            if page is not None:
+                await page.context.close()
+
+async def process_instrument(pool, instrument, output_dir, max_news_items):
+    output_csv = os.path.join(output_dir, f"ig.news.{instrument}.csv")
+    existing_news = load_existing_news(output_csv)
+    existing_headlines = {item['headline'] for item in existing_news}
+
+    try:
+        page = await pool.acquire()
+    except Exception as e:
+        logger.error(f"Error processing {instrument}: no news page available, {e}")
+        return
+    healthy = True
+    try:
+        new_news_items = await scrape_news_for_instrument(page, instrument, max_news_items, existing_headlines)
+        if new_news_items:
+            all_news = new_news_items + existing_news
+            save_to_csv(all_news, instrument, output_dir)
+            save_to_markdown(all_news, instrument, output_dir)
+            logger.info(f"Added {len(new_news_items)} new items for {instrument}.")
+        else:
+            logger.info(f"No new news items found for {instrument}.")
+    except Exception as e:
+        logger.error(f"Error processing {instrument}: {e}")
+        healthy = False
+    finally:
+        await pool.release(page, healthy)
 
 def save_to_csv(news_items, instrument, output_dir):
     os.makedirs(output_dir, exist_ok=True)
@@ -295,7 +382,7 @@ async def run(playwright: Playwright, args, company_names):
     context = await browser.new_context()
     page = await context.new_page()
     await page.goto("https://www.ig.com/uk")
-    await page.wait_for_timeout(2000)
+    await AsyncWaits(page).locator(page.get_by_role("button", name="Accept"), "cookie banner", timeout=2000)
     if await page.get_by_role("button", name="Accept").is_visible():
         await page.get_by_role("button", name="Accept").click()
     await page.get_by_role("link", name="Log in").click()
@@ -307,13 +394,16 @@ async def run(playwright: Playwright, args, company_names):
     storage_state = await context.storage_state()
     await context.close()
 
-    semaphore = asyncio.Semaphore(CONCURRENCY_LIMIT)
+    pool = NewsPagePool(browser, storage_state, size=min(args.pool_size, len(company_names)) or 1)
+    await pool.start()
     tasks = [
-        process_instrument(browser, storage_state, name, args.output, args.max_news_items, semaphore)
+        process_instrument(pool, name, args.output, args.max_news_items)
         for name in company_names
     ]
     await asyncio.gather(*tasks)
+    await pool.close()
     await browser.close()
+    log_wait_summary(logger)
 
 def main():
     parser = argparse.ArgumentParser(description="Scrape IG News Concurrent")
@@ -323,6 +413,7 @@ def main():
     parser.add_argument("--output", type=str, default=".")
     parser.add_argument("--input", type=str, required=True)
     parser.add_argument("--max-news-items", type=int, default=5)
+    parser.add_argument("--pool-size", type=int, default=CONCURRENCY_LIMIT, help="browser contexts kept on the News panel")
     args = parser.parse_args()
 
     if args.input.endswith(".json"):
@@ -8,10 +8,16 @@ import logging
 import os
 import json
 
+from ig_waits import Waits, log_wait_summary, visible_any
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 # TODO: logging file handler, location, rotating logs, etc. for better debugging and record-keeping
 
+HEADLINE_SELECTOR = ".ig-news_headline"
+ARTICLE_SELECTOR = "article, .article-body, .news-article, div.content, .main-content"
+POPOUT_SELECTOR = "button:has-text('Open in new window'), a:has-text('Open in new window'), button.ig-news-article-header_new-window"
+
 
 def close_popups(page):
     """Attempt to close any blocking popups or promos."""
@@ -135,6 +141,7 @@ def extract_from_locator(locator):
 def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[dict]:
     """Scrape news items for a specific instrument."""
     logger.info(f"Searching news for: {instrument}")
+    waits = Waits(page)
     
     # Click Search tab to start a new search
     try:
@@ -142,17 +149,21 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
         page.get_by_role("listitem").filter(has_text="Search").locator("span").click()
     except:
         pass
-    page.wait_for_timeout(1000)
     
     # Fill the search box with the instrument name
     search_box = page.get_by_role("textbox", name="Search by market name,")
+    waits.locator(search_box, "search box", timeout=5000)
     search_box.fill("")
-    page.wait_for_timeout(300)
     search_box.fill(instrument)
+    # the page still shows the previous instrument's results until this search re-renders them
+    results = waits.watch(HEADLINE_SELECTOR)
     search_box.press("Enter")
     
-    # Wait for search results to load
-    page.wait_for_timeout(3000)
+    # Wait for the search to re-render the results, then for them to load and stop re-rendering
+    if not waits.changed(results, "search results re-rendered", timeout=5000):
+        logger.info(f"Search for {instrument} did not re-render the results, carrying on with the shown list")
+    waits.selector(HEADLINE_SELECTOR, "search results", timeout=5000)
+    waits.dom_settled("search results settled", quiet_ms=500, timeout=3000)
     
     news_items = []
     
@@ -168,13 +179,13 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
             close_popups(page)
             
             # Re-query headlines every time to handle DOM updates
-            headlines = page.locator(".ig-news_headline").all()
+            headlines = page.locator(HEADLINE_SELECTOR).all()
             
             if i >= len(headlines):
                 # Try scrolling if we ran out of visible items
                 page.evaluate("window.scrollBy(0, 500)")
-                page.wait_for_timeout(2000)
-                headlines = page.locator(".ig-news_headline").all()
+                waits.count_above(HEADLINE_SELECTOR, i, "more headlines after scroll", timeout=2000)
+                headlines = page.locator(HEADLINE_SELECTOR).all()
                 if i >= len(headlines):
                     logger.info(f"  No more items found after {i} items")
                     break
@@ -261,36 +272,23 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
             modal = None
             extracted_via_popout = False
             
-            # Try to find the visible modal for a few seconds
             # After opening the item (headline click), sometimes a global 'Open in new window' button appears
-            # Try to detect a global popout control before searching for modal/detail containers
+            # Wait for whichever shows up first: the popout control or a visible detail modal
+            waits.selector(visible_any(f"{POPOUT_SELECTOR}, {modal_selector}"), "news item opened", timeout=4000)
             try:
-                for _g in range(6):
-                    popout_global = None
-                    try:
-                        popout_global = page.locator("button:has-text('Open in new window'), a:has-text('Open in new window'), button.ig-news-article-header_new-window").first
-                    except:
-                        popout_global = None
-                    if popout_global:
-                        try:
-                            if popout_global.is_visible(timeout=500):
-                                logger.debug("  found global popout button after clicking headline")
-                                with page.context.expect_page(timeout=10000) as new_page_info:
-                                    popout_global.click()
-                                new_page = new_page_info.value
-                                new_page.wait_for_load_state('domcontentloaded')
-                                link = new_page.url
-                                detail_text = extract_from_page(new_page) or ""
-                                logger.debug(f"  extracted popout text length={len(detail_text)} preview=\n{(detail_text[:300] or '(empty)')}\n---")
-                                new_page.close()
-                                # We got content; mark and skip modal logic
-                                extracted_via_popout = True
-                                modal_found = False
-                                modal = None
-                                break
-                        except:
-                            pass
-                    page.wait_for_timeout(300)
+                popout_global = page.locator(POPOUT_SELECTOR).first
+                if popout_global.is_visible():
+                    logger.debug("  found global popout button after clicking headline")
+                    with page.context.expect_page(timeout=10000) as new_page_info:
+                        popout_global.click()
+                    new_page = new_page_info.value
+                    new_page.wait_for_load_state('domcontentloaded')
+                    link = new_page.url
+                    detail_text = extract_from_page(new_page) or ""
+                    logger.debug(f"  extracted popout text length={len(detail_text)} preview=\n{(detail_text[:300] or '(empty)')}\n---")
+                    new_page.close()
+                    # We got content; mark and skip modal logic
+                    extracted_via_popout = True
             except:
                 pass
 
@@ -300,7 +298,9 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
                 logger.debug(f"  initial modal_selector matched {len(sample_modals)} elements")
             except:
                 logger.debug("  modal_selector query failed")
-            for _ in range(8):
+            if not extracted_via_popout:
+                waits.selector(visible_any(modal_selector), "news modal", timeout=4000)
+            for _ in range(2):
                 all_modals = page.locator(modal_selector).all()
                 for idx_m, m in enumerate(all_modals):
                     try:
@@ -313,9 +313,9 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
                         modal = m
                         modal_found = True
                         break
-                if modal_found:
+                if modal_found or extracted_via_popout:
                     break
-                page.wait_for_timeout(500)
+                waits.dom_settled("news modal", timeout=500)
             
             if extracted_via_popout:
                 # Content was already extracted via popout/global popout; use that
@@ -389,8 +389,8 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
                         except:
                             pass
                     if closed:
-                        # Give the page a moment then try to find the actual news modal
-                        page.wait_for_timeout(800)
+                        # Let the promo animate away then try to find the actual news modal
+                        waits.dom_settled("promo closed", timeout=800)
                         modal_found = False
                         modal = None
                         for _r in range(6):
@@ -410,7 +410,7 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
                             if modal_found:
                                 logger.debug("  real news modal found after closing promo")
                                 break
-                            page.wait_for_timeout(300)
+                            waits.dom_settled("news modal after promo", quiet_ms=100, timeout=300)
                     # If we couldn't find a non-promo modal after closing, skip this item
                     if not modal_found:
                         logger.debug("  no article modal found after closing promo; skipping item")
@@ -453,12 +453,9 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
                         
                         # IMPORTANT: Wait for the network to be idle or specific selectors 
                         # to ensure the dynamic content has loaded.
-                        try:
-                            # Wait for the article body to appear
-                            new_page.wait_for_selector("article, .article-body, .news-article, div.content, .main-content", timeout=10000)
-                        except:
-                            # Fallback to a plain wait if selector not found
-                            new_page.wait_for_timeout(3000)
+                        if not Waits(new_page).selector(ARTICLE_SELECTOR, "popout article body", timeout=10000):
+                            # Fallback to whatever loaded once the network is quiet
+                            Waits(new_page).network_idle("popout article fallback", timeout=3000)
                         
                         # Get correct URL (the actual article source)
                         link = new_page.url
@@ -500,10 +497,8 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
                         try:
                             extra_page = page.context.new_page()
                             extra_page.goto(link, timeout=15000)
-                            try:
-                                extra_page.wait_for_selector("article, .article-body, .news-article, div.content, .main-content", timeout=10000)
-                            except:
-                                extra_page.wait_for_timeout(3000)
+                            if not Waits(extra_page).selector(ARTICLE_SELECTOR, "linked article body", timeout=10000):
+                                Waits(extra_page).network_idle("linked article fallback", timeout=3000)
                             extracted = extract_from_page(extra_page) or ""
                             if extracted and len(extracted) > len(detail_text or ""):
                                 detail_text = extracted
@@ -535,7 +530,7 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
             # Close the detail view
             try:
                 page.keyboard.press("Escape")
-                page.wait_for_timeout(300)
+                waits.selector(modal_selector, "news modal closed", timeout=1000, state="hidden")
                 
                 # If close button is still visible, click it (modal didn't close with escape?)
                 close_btn = page.locator("button[aria-label='Close'], [data-testid='close-button'], button.close-icon").first
@@ -544,7 +539,7 @@ def scrape_news_for_instrument(page, instrument: str, MAX_NEWS_ITEMS=2) -> list[
             except:
                 pass
                 
-            page.wait_for_timeout(500)
+            waits.dom_settled("news item closed", timeout=1000)
             
             # Finalize data
             final_date = detail_date if detail_date else list_date
@@ -640,7 +635,9 @@ def scrape_open_positions(page) -> list[str]:
     # Click on the Positions tab
     try:
         page.get_by_role("button", name="Positions").click()
-        page.wait_for_timeout(5000)  # wait for position rows to load
+        waits = Waits(page)
+        waits.selector('[data-automation="instrumentName"]', "position rows", timeout=5000)
+        waits.dom_settled("position rows settled", quiet_ms=500, timeout=3000)
     except Exception as e:
         logger.error(f"Could not navigate to Positions tab: {e}")
         return []
@@ -675,8 +672,9 @@ def run(playwright: Playwright, username, password, INSTRUMENTS, output_dir, MAX
     browser = playwright.chromium.launch(headless=headless)
     context = browser.new_context()
     page = context.new_page()
+    waits = Waits(page)
     page.goto("https://www.ig.com/uk")
-    page.wait_for_timeout(5000)
+    waits.locator(page.get_by_role("button", name="Accept"), "cookie banner", timeout=5000)
     if page.get_by_role("button", name="Accept").is_visible():
         page.get_by_role("button", name="Accept").click()
     page.get_by_role("link", name="Log in").click()
@@ -699,7 +697,8 @@ def run(playwright: Playwright, username, password, INSTRUMENTS, output_dir, MAX
     page.get_by_role("button", name="Open platform").first.click()
     
     # Wait for platform to fully load
-    page.wait_for_timeout(15000)
+    waits.locator(page.get_by_title("News"), "platform loaded", timeout=30000)
+    waits.dom_settled("platform settled", quiet_ms=500, timeout=5000)
     
 
     # Scrape open positions if INSTRUMENTS is None (no --input provided)
@@ -719,7 +718,7 @@ def run(playwright: Playwright, username, password, INSTRUMENTS, output_dir, MAX
 
     # Navigate to News section once (using the original selector that worked)
     page.get_by_title("News").click()
-    page.wait_for_timeout(2000)
+    waits.locator(page.get_by_role("listitem").filter(has_text="Search"), "news panel", timeout=10000)
     
     # Scrape news for each instrument
     total_instruments = len(INSTRUMENTS)
@@ -752,6 +751,7 @@ def run(playwright: Playwright, username, password, INSTRUMENTS, output_dir, MAX
     # ---------------------
     context.close()
     browser.close()
+    log_wait_summary(logger)
     logger.info("Done!")
 
 def main():
@@ -0,0 +1,210 @@
+"""
+Event-driven waits for the IG scrapers, replacing fixed wait_for_timeout() sleeps.
+
+Each wait returns as soon as its condition holds (a selector reaches a state, the network
+goes idle, or the DOM stops changing) and gives up quietly after its timeout, returning
+False instead of raising, since a scraper step can usually carry on either way. Every wait
+is timed and recorded under a name, so a run can log how long it really spent waiting:
+
+    waits = Waits(page)                       # AsyncWaits(page) for playwright.async_api
+    results = waits.watch(".ig-news_headline")   # just before the action, eg. pressing Enter in a search box
+    search_box.press("Enter")
+    waits.changed(results, "search results re-rendered", timeout=5000)
+    waits.selector(".ig-news_headline", "search results", timeout=5000)
+    waits.dom_settled("news list scrolled")
+    ...
+    log_wait_summary(logger)   # eg. "Wait 'search results': 12 waits, p50 0.41s, max 1.90s, total 6.2s, 0 timed out"
+"""
+
+import statistics
+import threading
+import time
+
+DEFAULT_TIMEOUT_MS = 10000
+DOM_QUIET_MS = 300
+
+COUNT_ABOVE_JS = "([selector, count]) => document.querySelectorAll(selector).length > count"
+# observes the page from now on; `changed` turns true once a `selector` match is added, removed
+# or has its content changed, so a re-render counts even when it shows the same text as before
+WATCH_JS = """selector => {
+    const state = {changed: false};
+    const relevant = node => node.nodeType === 1 && (node.matches(selector) || node.querySelector(selector) !== null);
+    state.observer = new MutationObserver(mutations => {
+        for (const m of mutations) {
+            const element = m.target.nodeType === 1 ? m.target : m.target.parentElement;
+            if ((element && element.closest(selector)) || [...m.addedNodes, ...m.removedNodes].some(relevant)) {
+                state.changed = true;
+                state.observer.disconnect();
+                return;
+            }
+        }
+    });
+    state.observer.observe(document.body || document.documentElement, {childList: true, subtree: true, characterData: true});
+    return state;
+}"""
+CHANGED_JS = "state => state.changed"
+UNWATCH_JS = "state => state.observer.disconnect()"
+# resolves true once the page went `quietMs` without a DOM mutation, false after `timeoutMs`
+DOM_SETTLED_JS = """([quietMs, timeoutMs]) => new Promise(resolve => {
+    let quiet;
+    const finish = settled => { observer.disconnect(); clearTimeout(quiet); clearTimeout(cap); resolve(settled); };
+    const observer = new MutationObserver(() => { clearTimeout(quiet); quiet = setTimeout(() => finish(true), quietMs); });
+    observer.observe(document.body || document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+    quiet = setTimeout(() => finish(true), quietMs);
+    const cap = setTimeout(() => finish(false), timeoutMs);
+})"""
+
+
+def visible_any(selector_list: str) -> str:
+    """Selector list matching only visible elements, so a wait is not held up by a hidden first match.
+
+    eg. visible_any("[role='dialog'], .news-detail") -> "[role='dialog']:visible, .news-detail:visible"
+    """
+    return ", ".join(f"{sel.strip()}:visible" for sel in selector_list.split(", "))
+
+
+class WaitRecorder:
+    """Durations of every wait by name; thread- and task-safe."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waits = {}  # name -> [(seconds, ok)]
+
+    def record(self, name: str, seconds: float, ok: bool):
+        with self._lock:
+            self._waits.setdefault(name, []).append((seconds, ok))
+
+    def summary(self) -> dict:
+        """{name: {'count', 'p50', 'max', 'total', 'timeouts'}} in seconds."""
+        with self._lock:
+            waits = {name: list(rows) for name, rows in self._waits.items()}
+        result = {}
+        for name, rows in waits.items():
+            seconds = [s for s, _ in rows]
+            result[name] = dict(
+                count=len(rows),
+                p50=statistics.median(seconds),
+                max=max(seconds),
+                total=sum(seconds),
+                timeouts=sum(not ok for _, ok in rows),
+            )
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._waits.clear()
+
+
+RECORDER = WaitRecorder()
+
+
+def log_wait_summary(logger, recorder: WaitRecorder = RECORDER):
+    """Log each wait's count, p50, max and timeouts, longest total first."""
+    summary = recorder.summary()
+    for name, s in sorted(summary.items(), key=lambda item: -item[1]['total']):
+        logger.info(f"Wait '{name}': {s['count']} waits, p50 {s['p50']:.2f}s, max {s['max']:.2f}s, "
+                    f"total {s['total']:.1f}s, {s['timeouts']} timed out")
+
+
+class Waits:
+    """Recorded waits on a playwright.sync_api Page."""
+
+    def __init__(self, page, recorder: WaitRecorder = RECORDER):
+        self.page = page
+        self.recorder = recorder
+
+    def _timed(self, name: str, wait) -> bool:
+        started = time.perf_counter()
+        try:
+            ok = wait() is not False
+        except Exception:
+            ok = False
+        self.recorder.record(name, time.perf_counter() - started, ok)
+        return ok
+
+    def selector(self, selector: str, name: str = None, timeout: int = DEFAULT_TIMEOUT_MS, state: str = "visible") -> bool:
+        """Wait until `selector` is attached/visible/hidden/detached (Playwright states)."""
+        return self._timed(name or selector, lambda: self.page.wait_for_selector(selector, state=state, timeout=timeout))
+
+    def locator(self, locator, name: str, timeout: int = DEFAULT_TIMEOUT_MS, state: str = "visible") -> bool:
+        """Wait on a Locator, eg. page.get_by_role("button", name="Accept")."""
+        return self._timed(name, lambda: locator.first.wait_for(state=state, timeout=timeout))
+
+    def count_above(self, selector: str, count: int, name: str, timeout: int = DEFAULT_TIMEOUT_MS) -> bool:
+        """Wait until more than `count` elements match, eg. lazy-loaded rows after a scroll."""
+        return self._timed(name, lambda: self.page.wait_for_function(COUNT_ABOVE_JS, arg=[selector, count], timeout=timeout))
+
+    def watch(self, selector: str):
+        """Start watching `selector` matches for a re-render; call just before the action and pass the result to changed()."""
+        return self.page.evaluate_handle(WATCH_JS, selector)
+
+    def changed(self, watch, name: str, timeout: int = DEFAULT_TIMEOUT_MS) -> bool:
+        """Wait until a match of the watched selector was added, removed or changed since watch()."""
+        try:
+            return self._timed(name, lambda: self.page.wait_for_function(CHANGED_JS, arg=watch, timeout=timeout))
+        finally:
+            try:
+                watch.evaluate(UNWATCH_JS)
+                watch.dispose()
+            except Exception:
+                pass
+
+    def network_idle(self, name: str, timeout: int = DEFAULT_TIMEOUT_MS) -> bool:
+        """Wait until there were no network connections for 500 ms."""
+        return self._timed(name, lambda: self.page.wait_for_load_state("networkidle", timeout=timeout))
+
+    def dom_settled(self, name: str, quiet_ms: int = DOM_QUIET_MS, timeout: int = DEFAULT_TIMEOUT_MS) -> bool:
+        """Wait until the DOM went `quiet_ms` without a mutation, eg. after typing into a live search."""
+        return self._timed(name, lambda: self.page.evaluate(DOM_SETTLED_JS, [quiet_ms, timeout]))
+
+
+class AsyncWaits:
+    """Recorded waits on a playwright.async_api Page."""
+
+    def __init__(self, page, recorder: WaitRecorder = RECORDER):
+        self.page = page
+        self.recorder = recorder
+
+    async def _timed(self, name: str, wait) -> bool:
+        started = time.perf_counter()
+        try:
+            ok = (await wait) is not False
+        except Exception:
+            ok = False
+        self.recorder.record(name, time.perf_counter() - started, ok)
+        return ok
+
+    async def selector(self, selector: str, name: str = None, timeout: int = DEFAULT_TIMEOUT_MS, state: str = "visible") -> bool:
+        """Wait until `selector` is attached/visible/hidden/detached (Playwright states)."""
+        return await self._timed(name or selector, self.page.wait_for_selector(selector, state=state, timeout=timeout))
+
+    async def locator(self, locator, name: str, timeout: int = DEFAULT_TIMEOUT_MS, state: str = "visible") -> bool:
+        """Wait on a Locator, eg. page.get_by_role("button", name="Accept")."""
+        return await self._timed(name, locator.first.wait_for(state=state, timeout=timeout))
+
+    async def count_above(self, selector: str, count: int, name: str, timeout: int = DEFAULT_TIMEOUT_MS) -> bool:
+        """Wait until more than `count` elements match, eg. lazy-loaded rows after a scroll."""
+        return await self._timed(name, self.page.wait_for_function(COUNT_ABOVE_JS, arg=[selector, count], timeout=timeout))
+
+    async def watch(self, selector: str):
+        """Start watching `selector` matches for a re-render; call just before the action and pass the result to changed()."""
+        return await self.page.evaluate_handle(WATCH_JS, selector)
+
+    async def changed(self, watch, name: str, timeout: int = DEFAULT_TIMEOUT_MS) -> bool:
+        """Wait until a match of the watched selector was added, removed or changed since watch()."""
+        try:
+            return await self._timed(name, self.page.wait_for_function(CHANGED_JS, arg=watch, timeout=timeout))
+        finally:
+            try:
+                await watch.evaluate(UNWATCH_JS)
+                await watch.dispose()
+            except Exception:
+                pass
+
+    async def network_idle(self, name: str, timeout: int = DEFAULT_TIMEOUT_MS) -> bool:
+        """Wait until there were no network connections for 500 ms."""
+        return await self._timed(name, self.page.wait_for_load_state("networkidle", timeout=timeout))
+
+    async def dom_settled(self, name: str, quiet_ms: int = DOM_QUIET_MS, timeout: int = DEFAULT_TIMEOUT_MS) -> bool:
+        """Wait until the DOM went `quiet_ms` without a mutation, eg. after typing into a live search."""
+        return await self._timed(name, self.page.evaluate(DOM_SETTLED_JS, [quiet_ms, timeout]))
@@ -0,0 +1,116 @@
+"""
+Typed ingestion of IG TradeHistory-*.csv and Transaction-*.csv exports.
+
+Each export is parsed once per content hash (st.cache_data hashes the raw bytes), with
+explicit dtypes, categorical low-cardinality columns and thousands separators handled by
+the parser, so every consumer on the page (positions, benchmarks, cash flow) shares the
+same parse instead of re-reading the upload.
+
+pyarrow's multithreaded CSV reader is used when installed; it has no `thousands` option,
+so amount columns it leaves as text are cleaned afterwards.
+"""
+
+import io
+
+import pandas as pd
+import streamlit as st
+
+try:
+    import pyarrow  # noqa: F401
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+TRADE_HISTORY_DATE_FORMAT = "%d/%m/%Y"  # IG writes TextDate day first, eg. 30/01/2025
+TRANSACTION_DATE_FORMAT = "ISO8601"
+
+TRADE_HISTORY_DTYPES = {
+    'Market': 'string',
+    'Activity': 'category',
+    'Direction': 'category',
+    'Currency': 'category',
+    'Settlement status': 'category',
+    'Order type': 'category',
+}
+TRADE_HISTORY_NUMERIC = ['Quantity', 'Price', 'Consideration', 'Commission', 'Charges', 'Cost/Proceeds', 'Conversion rate']
+
+TRANSACTION_DTYPES = {
+    'Summary': 'string',  # categorised after filling blanks and relabelling deposits
+    'MarketName': 'string',
+    'Transaction type': 'category',
+    'Currency': 'category',
+}
+TRANSACTION_NUMERIC = ['PL Amount']
+
+
+def _read_csv(data: bytes, dtypes: dict) -> pd.DataFrame:
+    """read_csv with pyarrow when available, falling back to the C parser."""
+    if PYARROW_AVAILABLE:
+        try:
+            return pd.read_csv(io.BytesIO(data), engine="pyarrow", dtype=dtypes)
+        except (ValueError, TypeError) as e:  # pyarrow.ArrowInvalid is a ValueError
+            print(f"pyarrow CSV parse failed ({e}), falling back to the C parser")
+    return pd.read_csv(io.BytesIO(data), dtype=dtypes, thousands=',')
+
+
+def _to_numeric(series: pd.Series) -> pd.Series:
+    """Float column; strips thousands separators the parser could not handle."""
+    if not pd.api.types.is_numeric_dtype(series):
+        series = series.astype('string').str.replace(',', '', regex=False)
+    return pd.to_numeric(series, errors='coerce').astype('float64')
+
+
+def _to_datetime(series: pd.Series, date_format: str, dayfirst: bool) -> pd.Series:
+    """Parse with the explicit export format; only fall back to inference if rows don't match it."""
+    parsed = pd.to_datetime(series, format=date_format, errors='coerce')
+    if parsed.isna().sum() > series.isna().sum():
+        parsed = pd.to_datetime(series, errors='coerce', dayfirst=dayfirst)
+    return parsed
+
+
+@st.cache_data(show_spinner=False)
+def read_trade_history(data: bytes) -> pd.DataFrame:
+    """Parse an IG TradeHistory export and add a datetime 'Date' column from 'TextDate'.
+
+    Args:
+        data: raw bytes of the upload (eg. UploadedFile.getvalue())
+
+    Returns:
+        DataFrame with numeric amount columns as float64 and low-cardinality columns as category
+    """
+    df = _read_csv(data, TRADE_HISTORY_DTYPES)
+    for col in TRADE_HISTORY_NUMERIC:
+        if col in df.columns:
+            df[col] = _to_numeric(df[col])
+    df['Date'] = _to_datetime(df['TextDate'], TRADE_HISTORY_DATE_FORMAT, dayfirst=True)
+    return df
+
+
+@st.cache_data(show_spinner=False)
+def read_transactions(data: bytes) -> pd.DataFrame:
+    """Parse an IG Transaction export.
+
+    Blank 'Summary' rows are platform costs net of cash interest, and bank deposits are
+    relabelled 'Cash In' so deposits can be selected with a single Summary filter.
+
+    Args:
+        data: raw bytes of the upload (eg. UploadedFile.getvalue())
+
+    Returns:
+        DataFrame with datetime 'TextDate', float 'PL Amount' and categorical 'Summary'
+    """
+    df = _read_csv(data, TRANSACTION_DTYPES)
+    for col in TRANSACTION_NUMERIC:
+        df[col] = _to_numeric(df[col])
+    df['TextDate'] = _to_datetime(df['TextDate'], TRANSACTION_DATE_FORMAT, dayfirst=False)
+    if 'Cash transaction' in df.columns:
+        df['Cash transaction'] = df['Cash transaction'].astype('boolean')
+    summary = df['Summary'].fillna('Cash Interest - Platform Cost')
+    summary = summary.mask(df['MarketName'] == 'Bank Deposit', 'Cash In')
+    df['Summary'] = summary.astype('category')
+    return df
+
+
+def cash_in(df_transactions: pd.DataFrame) -> pd.DataFrame:
+    """Deposit rows of a parsed Transaction export."""
+    return df_transactions[df_transactions['Summary'] == 'Cash In']
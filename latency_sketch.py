@@ -0,0 +1,103 @@
+"""
+Mergeable latency sketches (DDSketch-style log buckets) kept as plain DataFrames.
+
+Percentiles cannot be averaged: the mean of 24 hourly p95s is not the day's p95, and it hides
+the tail. A sketch instead counts requests per logarithmic bucket, bucket i covering
+(GAMMA**(i-1), GAMMA**i] ms, so any value read back is within RELATIVE_ACCURACY of the truth.
+Sketches of hours, facets or services merge by adding counts per bucket, and a quantile of
+the merge is a cumulative sum over its buckets - no raw rows are scanned again.
+
+New Relic exports only carry a few percentiles per row (eg. 'p95 (in ms)', maybe 'p50' or
+'p99'), so a row's RecordCount is spread over them: the requests between two known
+percentiles are spread evenly, in log scale, between their latencies; those below the lowest
+known percentile are put at it, and those above the highest at it as well. With p95 alone the
+merged p95 is the traffic-weighted p95 of the rows' p95s and p99 is a lower bound; every extra
+percentile column sharpens both.
+
+eg. sketch = sketch_rows(df, ['facet', 'date'], 'RecordCount')
+    merged_quantiles(sketch, ['facet'], (0.95, 0.99))   -> p95, p99 per facet
+"""
+
+import re
+
+import numpy as np
+import pandas as pd
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+MIN_VALUE_MS = 0.1  # smaller (or zero) latencies share the lowest bucket
+SEGMENT_POINTS = 8  # points the requests between two known percentiles are spread over
+PERCENTILE_PATTERN = re.compile(r'^p(\d+(?:\.\d+)?) \(in ms\)$')  # eg. 'p95 (in ms)', 'p99.9 (in ms)'
+
+
+def percentile_columns(columns) -> dict:
+    """{column: quantile} of the percentile columns present, eg. {'p95 (in ms)': 0.95}"""
+    found = {c: float(m.group(1)) / 100 for c in columns if (m := PERCENTILE_PATTERN.match(c))}
+    return dict(sorted(found.items(), key=lambda item: item[1]))
+
+
+def bucket_of(values_ms) -> np.ndarray:
+    """Bucket index of each latency."""
+    values = np.maximum(np.asarray(values_ms, dtype='float64'), MIN_VALUE_MS)
+    return np.ceil(np.log(values) / np.log(GAMMA)).astype('int64')
+
+
+def bucket_value(buckets) -> np.ndarray:
+    """Representative latency of each bucket, within RELATIVE_ACCURACY of anything in it."""
+    return 2 * GAMMA ** np.asarray(buckets, dtype='float64') / (GAMMA + 1)
+
+
+def sketch_rows(df: pd.DataFrame, keys: list, count_col: str, pct_cols: dict = None) -> pd.DataFrame:
+    """Sketch of every `keys` group of `df`, as rows of keys, 'bucket' and 'count'.
+
+    Args:
+        df: rows with a request count and one or more percentile columns
+        keys: columns the sketches are kept per, eg. ['facet', 'date']
+        count_col: requests each row stands for, eg. 'RecordCount'
+        pct_cols: {column: quantile}; defaults to percentile_columns(df.columns)
+    """
+    pct_cols = pct_cols or percentile_columns(df.columns)
+    quantiles = np.array(list(pct_cols.values()))
+    values = np.log(np.maximum(df[list(pct_cols)].to_numpy(dtype='float64'), MIN_VALUE_MS))
+    counts = df[count_col].to_numpy(dtype='float64')
+
+    # (log latency, share of the row's requests) of the points each row is spread over
+    points = [(values[:, 0], quantiles[0])]
+    steps = (np.arange(SEGMENT_POINTS) + 0.5) / SEGMENT_POINTS
+    for i in range(1, len(quantiles)):
+        share = (quantiles[i] - quantiles[i - 1]) / SEGMENT_POINTS
+        points += [(values[:, i - 1] + t * (values[:, i] - values[:, i - 1]), share) for t in steps]
+    points.append((values[:, -1], 1 - quantiles[-1]))
+
+    parts = []
+    for log_value, share in points:
+        valid = ~np.isnan(log_value)
+        part = df.loc[valid, keys].copy()
+        part['bucket'] = bucket_of(np.exp(log_value[valid]))
+        part['count'] = counts[valid] * share
+        parts.append(part)
+    return merge(pd.concat(parts, ignore_index=True), keys)
+
+
+def merge(sketches: pd.DataFrame, keys: list) -> pd.DataFrame:
+    """Sketches summed per `keys` (eg. per day from hourly ones); O(rows of the sketches)."""
+    return sketches.groupby(list(keys) + ['bucket'], observed=True, sort=False)['count'].sum().reset_index()
+
+
+def merged_quantiles(sketches: pd.DataFrame, keys: list, quantiles=(0.95, 0.99)) -> pd.DataFrame:
+    """Quantiles of the sketches merged per `keys`, indexed by keys, eg. columns 'p95', 'p99'.
+
+    Empty `keys` merges everything into a single row.
+    """
+    by = list(keys) or ['_all']
+    merged = merge(sketches.assign(_all=0), by).sort_values(by + ['bucket'])
+    grouped = merged.groupby(by, observed=True)['count']
+    cum = grouped.cumsum()
+    total = grouped.transform('sum')
+    result = {}
+    for q in quantiles:
+        # first bucket whose cumulative count reaches q of the group's total
+        first = merged.loc[cum >= q * total * (1 - 1e-9)].groupby(by, observed=True)['bucket'].first()
+        result[f"p{q * 100:g}"] = pd.Series(bucket_value(first), index=first.index)
+    out = pd.DataFrame(result)
+    return out if keys else out.reset_index(drop=True)
@@ -0,0 +1,272 @@
+"""
+Unified cross-broker trade ledger.
+
+Every source (IG TradeHistory exports, Trading 212 CSV exports, Trading 212 API orders,
+manual entries) is converted by an adapter into one schema, LEDGER_COLUMNS, and stored
+as a Parquet file per user. Valuation then goes through portfolio_engine, which only
+needs the ledger's ['Date', 'Ticker', 'Quantity', 'Currency'] columns, so adding a
+broker means writing one adapter and registering it in ADAPTERS.
+
+Conventions:
+  - Ticker is the Yahoo Finance symbol (e.g. 'AAPL', 'VOD.L', 'SAP.DE')
+  - Quantity is signed: positive for buys, negative for sells
+  - Price is in the quote currency; 'GBX' (and IG's 'GBP') means a London listing quoted in pence
+  - Cost GBP is the signed cash impact in GBP: negative for buys, positive for sells
+"""
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+import portfolio_engine
+
+LEDGER_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), "ledgers")
+
+LEDGER_COLUMNS = {
+    'Source': 'string',     # 'ig', 't212_csv', 't212_api', 'manual'
+    'Account': 'string',
+    'TradeID': 'string',    # unique within (Source, Account); re-imports replace rather than duplicate
+    'Date': 'datetime64[ns]',
+    'Ticker': 'string',
+    'Name': 'string',
+    'ISIN': 'string',
+    'Quantity': 'float64',
+    'Price': 'float64',
+    'Currency': 'string',
+    'Cost GBP': 'float64',
+}
+KEY_COLUMNS = ['Source', 'Account', 'TradeID']
+
+T212_TRADE_ACTIONS = ['Market buy', 'Market sell', 'Limit buy', 'Limit sell', 'Stop buy', 'Stop sell']
+# Trading 212 API tickers look like 'AAPL_US_EQ' or 'VODl_EQ'; the lower-case letter is the venue
+T212_VENUE_SUFFIX = {'l': '.L', 'd': '.DE', 'p': '.PA', 'a': '.AS', 'm': '.MI', 'e': '.MC'}
+
+
+def _finalise(df: pd.DataFrame, source: str, account: str, dropped: list = None) -> pd.DataFrame:
+    """Coerce an adapter's output to LEDGER_COLUMNS, filling TradeID where the source has none.
+
+    Rows with an unparseable Date or no Ticker (eg. an IG company name without a mapping yet)
+    cannot be valued; they are left out, reported, and appended to `dropped` with a 'Reason'.
+    """
+    df = df.copy()
+    df['Source'] = source
+    df['Account'] = account
+    for col in LEDGER_COLUMNS:
+        if col not in df.columns:
+            df[col] = None
+    dates = pd.to_datetime(df['Date'], errors='coerce', utc=True).dt.tz_localize(None)
+    usable = dates.notna() & df['Ticker'].notna()
+    if not usable.all():
+        rejected = df.loc[~usable].assign(Reason=np.where(dates[~usable].isna(), 'unparseable date', 'no ticker'))
+        print(f"Ledger {source}:{account}: left out {len(rejected)} trade(s) with an unparseable date or no ticker")
+        if dropped is not None:
+            dropped.append(rejected)
+    df['Date'] = dates
+    df = df[usable]
+    if df['TradeID'].isna().any():
+        # deterministic id from the trade itself, numbered when identical trades repeat
+        content = pd.util.hash_pandas_object(df[['Date', 'Ticker', 'Quantity', 'Price']], index=False).astype(str)
+        generated = content + '-' + content.groupby(content).cumcount().astype(str)
+        df['TradeID'] = df['TradeID'].where(df['TradeID'].notna(), generated)
+    return df[list(LEDGER_COLUMNS)].astype(LEDGER_COLUMNS).reset_index(drop=True)
+
+
+def empty_ledger() -> pd.DataFrame:
+    return pd.DataFrame({col: pd.Series(dtype=dtype) for col, dtype in LEDGER_COLUMNS.items()})
+
+
+# ─── Adapters ─────────────────────────────────────────────────────────
+
+def from_ig(df_trade_history: pd.DataFrame, account: str, dropped: list = None) -> pd.DataFrame:
+    """IG TradeHistory rows with a resolved 'Ticker' (see rewrite_tab_1.read_ig_trade_history)."""
+    df = df_trade_history
+    cost = df['Cost/Proceeds'] + df.get('Charges', 0) + df.get('Commission', 0)
+    return _finalise(pd.DataFrame({
+        'TradeID': df['ID'].astype('string') if 'ID' in df.columns else None,
+        'Date': df['Date'],
+        'Ticker': df['Ticker'],
+        'Name': df['Market'],
+        'Quantity': pd.to_numeric(df['Quantity'], errors='coerce'),
+        'Price': pd.to_numeric(df['Price'], errors='coerce'),
+        'Currency': df['Currency'].astype('string'),
+        'Cost GBP': pd.to_numeric(cost, errors='coerce'),
+    }), 'ig', account, dropped)
+
+
+def t212_yahoo_ticker(ticker: pd.Series, isin: pd.Series, currency: pd.Series) -> pd.Series:
+    """Yahoo symbol for Trading 212 CSV tickers, inferred from ISIN prefix and quote currency."""
+    isin = isin.fillna('').astype(str)
+    currency = currency.fillna('').astype(str)
+    suffix = np.select(
+        [
+            currency.isin(['GBX', 'GBP']) | (isin.str.startswith('GB') & ~currency.isin(['USD', 'EUR'])),
+            currency.eq('EUR'),
+            isin.str.startswith('US') | isin.str.startswith('CA'),
+            isin.str.startswith('IE'),
+        ],
+        ['.L', '.DE', '', '.L'],
+        default=''
+    )
+    return ticker.where(ticker.isna(), ticker.astype(str) + suffix)
+
+
+def from_t212_csv(df_history: pd.DataFrame, account: str = 'trading212', dropped: list = None) -> pd.DataFrame:
+    """Trading 212 'from_*.csv' export; non-trade rows (deposits, interest, ...) are skipped."""
+    df = df_history[df_history['Action'].isin(T212_TRADE_ACTIONS)]
+    sign = np.where(df['Action'].str.contains('sell', case=False), -1.0, 1.0)
+    currency = df['Currency (Price / share)']
+    return _finalise(pd.DataFrame({
+        'TradeID': df['ID'].astype('string') if 'ID' in df.columns else None,
+        'Date': df['Time'],
+        'Ticker': t212_yahoo_ticker(df['Ticker'], df.get('ISIN', pd.Series('', index=df.index)), currency),
+        'Name': df.get('Name'),
+        'ISIN': df.get('ISIN'),
+        'Quantity': sign * pd.to_numeric(df['No. of shares'], errors='coerce'),
+        'Price': pd.to_numeric(df['Price / share'], errors='coerce'),
+        'Currency': currency,
+        'Cost GBP': -sign * pd.to_numeric(df['Total'], errors='coerce'),
+    }), 't212_csv', account, dropped)
+
+
+def t212_api_yahoo_ticker(t212_ticker: str, ticker_map: dict = None) -> str:
+    """Yahoo symbol for a Trading 212 API ticker; saved mappings win over the venue suffix rule."""
+    if ticker_map and t212_ticker in ticker_map:
+        return ticker_map[t212_ticker]
+    parts = t212_ticker.split('_')
+    if len(parts) >= 3 and parts[1] == 'US':
+        return parts[0]
+    symbol = parts[0]
+    if symbol and symbol[-1] in T212_VENUE_SUFFIX:
+        return symbol[:-1] + T212_VENUE_SUFFIX[symbol[-1]]
+    return symbol
+
+
+def from_t212_orders(all_orders: list, ticker_map: dict = None, account: str = 'trading212_api',
+                     dropped: list = None) -> pd.DataFrame:
+    """Filled orders from Trading212API.get_historical_orders, one ledger row per fill."""
+    rows = []
+    for item in all_orders or []:
+        order = item.get("order", {})
+        if order.get("status") != "FILLED":
+            continue
+        fill = item.get("fill", {})
+        instrument = order.get("instrument", {})
+        sign = -1.0 if order.get("side") == "SELL" else 1.0
+        rows.append({
+            'TradeID': str(fill.get("id") or order.get("id")),
+            'Date': fill.get("filledAt", order.get("createdAt")),
+            'Ticker': t212_api_yahoo_ticker(order.get("ticker", ""), ticker_map),
+            'Name': instrument.get("name"),
+            'ISIN': instrument.get("isin"),
+            'Quantity': sign * abs(fill.get("quantity", order.get("filledQuantity", order.get("quantity", 0))) or 0),
+            'Price': fill.get("price"),
+            'Currency': instrument.get("currency", order.get("currency")),
+            'Cost GBP': -sign * abs(fill.get("walletImpact", {}).get("netValue", 0) or 0),
+        })
+    # several orders can report the same fill; keep one row per fill id
+    df = pd.DataFrame(rows, columns=['TradeID', 'Date', 'Ticker', 'Name', 'ISIN', 'Quantity', 'Price', 'Currency', 'Cost GBP'])
+    return _finalise(df.drop_duplicates(subset=['TradeID']), 't212_api', account, dropped)
+
+
+def from_manual(df_entries: pd.DataFrame, account: str = 'manual', dropped: list = None) -> pd.DataFrame:
+    """Manually entered trades with at least ['Date', 'Ticker', 'Quantity', 'Price', 'Currency']."""
+    return _finalise(df_entries, 'manual', account, dropped)
+
+
+ADAPTERS = {
+    'ig': from_ig,
+    't212_csv': from_t212_csv,
+    't212_api': from_t212_orders,
+    'manual': from_manual,
+}
+
+
+# ─── Storage ──────────────────────────────────────────────────────────
+
+class LedgerStore:
+    """Parquet-backed ledger for one user.
+
+    upsert() replaces rows with the same (Source, Account, TradeID), so re-uploading an
+    export that overlaps an earlier one does not double count trades.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def load(self) -> pd.DataFrame:
+        if not os.path.exists(self.path):
+            return empty_ledger()
+        return pd.read_parquet(self.path).astype(LEDGER_COLUMNS)
+
+    def upsert(self, *frames: pd.DataFrame) -> pd.DataFrame:
+        """Merge ledger frames into the store and return the full ledger."""
+        with self._lock:
+            df_ledger = pd.concat([self.load(), *frames], ignore_index=True)
+            df_ledger = df_ledger.drop_duplicates(subset=KEY_COLUMNS, keep='last')
+            df_ledger = df_ledger.sort_values(['Date', 'Source', 'Account']).reset_index(drop=True)
+            self._write(df_ledger)
+        return df_ledger
+
+    def delete(self, source: str, account: str = None) -> pd.DataFrame:
+        """Remove every row of a source (optionally one account of it) and return the ledger."""
+        with self._lock:
+            df_ledger = self.load()
+            drop = df_ledger['Source'] == source
+            if account is not None:
+                drop &= df_ledger['Account'] == account
+            df_ledger = df_ledger[~drop].reset_index(drop=True)
+            self._write(df_ledger)
+        return df_ledger
+
+    def _write(self, df_ledger: pd.DataFrame):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        df_ledger.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_ledger_store(owner: str = None) -> LedgerStore:
+    """Ledger of one user (e.g. their login email); the file name is a hash of it."""
+    owner_id = hashlib.sha256((owner or "default").lower().encode()).hexdigest()[:16]
+    with _stores_lock:
+        if owner_id not in _stores:
+            _stores[owner_id] = LedgerStore(os.path.join(LEDGER_DIR, f"{owner_id}.parquet"))
+        return _stores[owner_id]
+
+
+# ─── Valuation ────────────────────────────────────────────────────────
+
+def ledger_accounts(df_ledger: pd.DataFrame) -> dict:
+    """{'source:account': trades} in the shape portfolio_engine values."""
+    return {
+        f"{source}:{account}": trades
+        for (source, account), trades in df_ledger.groupby(['Source', 'Account'], sort=True)
+    }
+
+
+def combined_positions(df_ledger: pd.DataFrame) -> pd.DataFrame:
+    """Open positions per ticker summed over every broker and account."""
+    g = df_ledger.groupby('Ticker')
+    positions = pd.DataFrame({
+        'Name': g['Name'].last(),
+        'Quantity': g['Quantity'].sum(),
+        'Currency': g['Currency'].last(),
+        'Cost GBP': g['Cost GBP'].sum(),
+        'Held at': g['Source'].agg(lambda s: ', '.join(sorted(s.unique()))),
+    })
+    return positions[positions['Quantity'].abs() > 1e-9]
+
+
+def combined_value_series(df_ledger: pd.DataFrame, df_market_historical_data, fx_rates: dict) -> pd.DataFrame:
+    """GBP value per 'source:account' plus 'Total' for every trading day, in one engine pass."""
+    values = portfolio_engine.value_accounts(ledger_accounts(df_ledger), df_market_historical_data, fx_rates)
+    values[portfolio_engine.TOTAL_COLUMN] = values.sum(axis=1)
+    return values
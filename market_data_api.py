@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import miniEnc as enc
 import threading
@@ -6,6 +7,7 @@ import requests
 import json
 from datetime import datetime
 import io
+from cache_backend import shared_cache
 
 class Finage:
     def __init__(self, api_key) -> None:     
@@ -53,6 +55,21 @@ class Finage:
         finally:
             self.dl_semaphore.release()
 
+def _yahoo_chart_ttl(url, end_date, interval, headers=None) -> int:
+    """Closed date ranges do not change; ones reaching today are refreshed hourly (intraday every 5 minutes)."""
+    if str(end_date) < datetime.now().strftime('%Y-%m-%d'):
+        return 7 * 24 * 3600
+    return 3600 if interval in ("1d", "5d", "1wk", "1mo") else 300
+
+
+@shared_cache("yahoo_v8", ttl=_yahoo_chart_ttl)
+def _yahoo_chart_v8(url, end_date, interval, headers=None) -> str:
+    """Raw chart JSON, shared across processes through cache_backend (FX pairs included)."""
+    r = requests.get(url, headers=headers)
+    r.raise_for_status()  # raises HTTPError for bad status codes
+    return r.text
+
+
 class OHLC_YahooFinance:
     ''' yahoo queries copied from OHCLData class
     eg. MSCI = OHLCData("MSCI", "2022-08-08") # end date default to "today" and interval default to "1d"
@@ -94,9 +111,7 @@ class OHLC_YahooFinance:
         url = f"{baseurl}?period1={start_epoch}&period2={end_epoch}&interval={self.interval}&events=history"
       
         try:
-            r = requests.get(url, headers=self.header)
-            r.raise_for_status()  # raises HTTPError for bad status codes
-            return self.convert_json_to_df(r.text)
+            return self.convert_json_to_df(_yahoo_chart_v8(url, self.end_date, self.interval, headers=self.header))
         except requests.RequestException as e:
             print(f"API request failed: {e}")
             raise  # re-raise so caller knows it failed
@@ -116,17 +131,56 @@ class OHLC_YahooFinance:
     #         print(e)
     #         return None
     
+# ─── Synthetic prices ─────────────────────────────────────────────────
+# Each interpolator gets the trade knots as business-day positions (ascending, unique) with
+# their prices, plus the position of the last business day up to today, and returns the
+# positions it covers and a price for each. Register new methods in SYNTHETIC_INTERPOLATORS.
+
+def _business_days_between(knot_x: np.ndarray, end_x: int) -> np.ndarray:
+    return np.arange(knot_x[0], max(knot_x[-1], end_x) + 1)
+
+
+def interpolate_linear(knot_x: np.ndarray, knot_y: np.ndarray, today_x: int):
+    """Straight line between consecutive trades, first to last trade."""
+    x = _business_days_between(knot_x, knot_x[-1])
+    return x, np.interp(x, knot_x, knot_y)
+
+
+def interpolate_step(knot_x: np.ndarray, knot_y: np.ndarray, today_x: int):
+    """Price of the most recent trade, first to last trade."""
+    x = _business_days_between(knot_x, knot_x[-1])
+    return x, knot_y[np.searchsorted(knot_x, x, side='right') - 1]
+
+
+def interpolate_last_trade(knot_x: np.ndarray, knot_y: np.ndarray, today_x: int):
+    """Price of the most recent trade, carried forward to today."""
+    x = _business_days_between(knot_x, today_x)
+    return x, knot_y[np.searchsorted(knot_x, x, side='right') - 1]
+
+
+SYNTHETIC_INTERPOLATORS = {
+    'linear': interpolate_linear,
+    'step': interpolate_step,
+    'last_trade': interpolate_last_trade,
+}
+
+
 class HistoricalMarketData:
     """Fetch historical market data from Yahoo Finance, with synthetic fallback for unavailable tickers."""
     
-    def __init__(self, market_data_collections: pd.DataFrame, trade_history: pd.DataFrame):
+    def __init__(self, market_data_collections: pd.DataFrame, trade_history: pd.DataFrame,
+                 synthetic_method: str = 'linear'):
         """
         Args:
             market_data_collections: DataFrame with columns ['Ticker', 'FirstBuyDate', 'LastDate']
             trade_history: DataFrame with trade history including ['Ticker', 'Date', 'Price']
+            synthetic_method: key of SYNTHETIC_INTERPOLATORS used when Yahoo has no data
         """
+        if synthetic_method not in SYNTHETIC_INTERPOLATORS:
+            raise ValueError(f"Unknown synthetic_method {synthetic_method!r}, expected one of {list(SYNTHETIC_INTERPOLATORS)}")
         self.market_data_collections = market_data_collections
         self.trade_history = trade_history
+        self.synthetic_method = synthetic_method
     
     def fetch_all(self) -> pd.DataFrame:
         """Fetch historical data for all tickers in market_data_collections.
@@ -134,8 +188,6 @@ class HistoricalMarketData:
         Returns:
             DataFrame with columns ['Date', 'Ticker', 'open', 'high', 'low', 'close', 'volume']
         """
-        import numpy as np
-        
         all_data = [
             self._fetch_ticker_data(row['Ticker'], row['FirstBuyDate'], row['LastDate'])
             for _, row in self.market_data_collections.iterrows()
@@ -160,28 +212,110 @@ class HistoricalMarketData:
             return self._generate_synthetic_data(ticker)
     
     def _generate_synthetic_data(self, ticker: str) -> pd.DataFrame:
-        """Generate interpolated price data from trade history when Yahoo data is unavailable."""
-        import numpy as np
-        
-        ticker_trades = self.trade_history[self.trade_history['Ticker'] == ticker].copy()
-        ticker_trades = ticker_trades.sort_values(by='Date').reset_index(drop=True)
-        
-        rows = []
-        for i in range(len(ticker_trades) - 1):
-            start_date, end_date = ticker_trades.at[i, 'Date'], ticker_trades.at[i + 1, 'Date']
-            start_price, end_price = ticker_trades.at[i, 'Price'], ticker_trades.at[i + 1, 'Price']
-            business_days = pd.bdate_range(start=start_date, end=end_date)
-            prices = np.linspace(start_price, end_price, num=len(business_days))
-
-            rows.extend({
-                "high": np.nan, "low": np.nan, "open": np.nan,
-                "close": price / 100,  # Convert pence to pounds
-                "volume": 0,
-                "Date": date,
-                "ticker": ticker
-            } for date, price in zip(business_days, prices))
-
-        return pd.DataFrame(rows).drop_duplicates(subset=['Date'], keep='first').reset_index(drop=True)
+        """Generate interpolated price data from trade history when Yahoo data is unavailable.
+
+        Trades are knots on a business-day axis interpolated with self.synthetic_method. The
+        first trade of a day sets that day's price, and a weekend trade pins both the Friday
+        before and the Monday after. Prices are in pence and converted to pounds.
+        """
+        ticker_trades = self.trade_history.loc[self.trade_history['Ticker'] == ticker, ['Date', 'Price']]
+        trade_days = pd.to_datetime(ticker_trades['Date']).dt.normalize()
+        prices = pd.to_numeric(ticker_trades['Price'], errors='coerce')
+        first_of_day = prices.groupby(trade_days).first().dropna()
+        if first_of_day.empty:
+            return pd.DataFrame(columns=['high', 'low', 'open', 'close', 'volume', 'Date', 'ticker'])
+
+        days = first_of_day.index.to_numpy().astype('datetime64[D]')
+        origin = np.busday_offset(days[0], 0, roll='forward')
+        # each pair of consecutive trades is a segment from the business day on/after the first
+        # to the business day on/before the second; a day shared by two segments keeps the earlier one
+        starts = np.busday_count(origin, np.busday_offset(days[:-1], 0, roll='forward'))
+        ends = np.busday_count(origin, np.busday_offset(days[1:], 0, roll='backward'))
+        price = first_of_day.to_numpy(dtype='float64')
+        segment = starts <= ends  # eg. a Saturday then a Sunday trade span no business day
+        if segment.any():
+            knot_x = np.column_stack([starts, ends])[segment].ravel()
+            knot_y = np.column_stack([price[:-1], price[1:]])[segment].ravel()
+            knot_x, first = np.unique(knot_x, return_index=True)
+            knot_y = knot_y[first]
+        else:
+            knot_x, knot_y = np.array([0]), price[-1:]
+
+        today_x = int(np.busday_count(origin, np.busday_offset(np.datetime64('today', 'D'), 0, roll='backward')))
+        x, y = SYNTHETIC_INTERPOLATORS[self.synthetic_method](knot_x, knot_y, today_x)
+        n = len(x)
+        return pd.DataFrame({
+            "high": np.full(n, np.nan), "low": np.full(n, np.nan), "open": np.full(n, np.nan),
+            "close": y / 100,  # Convert pence to pounds
+            "volume": np.zeros(n, dtype='int64'),
+            "Date": pd.to_datetime(np.busday_offset(origin, x)).astype("datetime64[ns]"),
+            "ticker": ticker,
+        })
+
+
+class CompactMarketData:
+    """Read-only, memory-compact copy of a long market data frame (one row per Date and Ticker).
+
+    Tickers are categorical codes, dates numpy datetime64[D] and OHLC/volume float32, with
+    rows sorted by (date, ticker) so a single date or date range is two binary searches
+    instead of a full-column comparison.
+
+    eg. market = CompactMarketData(df_market_historical_data)
+        market.on_date(date(2025, 1, 31))   -> DataFrame ['Ticker', 'open', 'high', 'low', 'close', 'volume']
+        market.memory_usage()               -> bytes held
+    """
+
+    VALUE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+    def __init__(self, df_market_historical_data: pd.DataFrame, price_dtype: str = 'float32'):
+        """
+        Args:
+            df_market_historical_data: DataFrame with ['Date', 'Ticker'] and any of VALUE_COLUMNS
+            price_dtype: dtype for the value columns; 'float64' keeps full precision
+        """
+        df = df_market_historical_data
+        days = pd.to_datetime(df['Date']).to_numpy().astype('datetime64[D]')
+        tickers = pd.Categorical(df['Ticker'])
+        order = np.lexsort((tickers.codes, days))
+        self.days = days[order]
+        self.tickers = tickers[order]
+        self.values = {
+            col: pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=price_dtype)[order]
+            for col in self.VALUE_COLUMNS if col in df.columns
+        }
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def memory_usage(self) -> int:
+        return (self.days.nbytes + self.tickers.codes.nbytes + self.tickers.categories.memory_usage(deep=True)
+                + sum(v.nbytes for v in self.values.values()))
+
+    def _slice(self, i: int, j: int, with_date: bool) -> pd.DataFrame:
+        data = {'Ticker': np.asarray(self.tickers[i:j], dtype=object)}
+        if with_date:
+            data['Date'] = self.days[i:j].astype('datetime64[ns]')
+        data.update({col: v[i:j] for col, v in self.values.items()})
+        return pd.DataFrame(data)
+
+    def on_date(self, day) -> pd.DataFrame:
+        """Rows of a single day (date, datetime or Timestamp; any time of day is ignored)."""
+        day = np.datetime64(pd.Timestamp(day).date(), 'D')
+        i = np.searchsorted(self.days, day, side='left')
+        j = np.searchsorted(self.days, day, side='right')
+        return self._slice(i, j, with_date=False)
+
+    def between(self, start, end) -> pd.DataFrame:
+        """Rows from `start` to `end` inclusive, with a datetime 'Date' column."""
+        i = np.searchsorted(self.days, np.datetime64(pd.Timestamp(start).date(), 'D'), side='left')
+        j = np.searchsorted(self.days, np.datetime64(pd.Timestamp(end).date(), 'D'), side='right')
+        return self._slice(i, j, with_date=True)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Long frame with a datetime 'Date' column and categorical 'Ticker'."""
+        df = self._slice(0, len(self), with_date=True)
+        df['Ticker'] = self.tickers
+        return df[['Date', 'Ticker', *self.values]]
 
 
 class nasdaq_data_link:
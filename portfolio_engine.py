@@ -0,0 +1,198 @@
+"""
+Vectorised valuation of one or more accounts (IG exports, or any source in ledger.py).
+
+All accounts share a single market data set (fetched once for the union of their
+tickers, as a long DataFrame or a market_data_api.CompactMarketData) and are valued in one pass:
+
+    value[day, account] = sum over tickers of position[day, account, ticker]
+                          * close[day, ticker] * fx_to_gbp[day, ticker currency]
+
+where positions are cumulative trade quantities carried forward to every trading day.
+The household total is the row sum, so valuing N accounts costs about the same as one.
+
+Results are persisted per account in user_portfolio_values.json ({account_id: {date: GBP value}}),
+and dates already in that cache are not recomputed.
+"""
+
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+VALUE_CACHE_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'user_portfolio_values.json')
+TOTAL_COLUMN = 'Total'
+
+
+def market_frame(df_market_historical_data) -> pd.DataFrame:
+    """Long frame with plain string tickers from a DataFrame or a CompactMarketData.
+
+    The compact container is what the app keeps in session state; the long frame only
+    lives for the duration of one valuation.
+    """
+    if isinstance(df_market_historical_data, pd.DataFrame):
+        return df_market_historical_data
+    df = df_market_historical_data.to_frame()
+    df['Ticker'] = df['Ticker'].astype(object)
+    return df
+
+
+def valuation_days(df_market_historical_data) -> pd.DatetimeIndex:
+    """Dates where at least one US ticker has real data.
+
+    Synthetic prices (see HistoricalMarketData._generate_synthetic_data) have NaN 'high',
+    so weekends and holidays interpolated from trades are not valued.
+    """
+    df_market_historical_data = market_frame(df_market_historical_data)
+    is_us_ticker = ~df_market_historical_data['Ticker'].str.contains(r'\.', na=False)
+    has_real_data = df_market_historical_data['high'].notnull()
+    days = pd.to_datetime(df_market_historical_data.loc[is_us_ticker & has_real_data, 'Date'].unique())
+    return pd.DatetimeIndex(days).sort_values()
+
+
+def union_trades(accounts: dict) -> pd.DataFrame:
+    """Concatenate every account's trade history with an 'Account' column."""
+    return pd.concat(
+        [df.assign(Account=account_id) for account_id, df in accounts.items()],
+        ignore_index=True
+    )
+
+
+def positions_by_day(df_trades: pd.DataFrame, days: pd.DatetimeIndex) -> pd.DataFrame:
+    """Quantity held at the end of each day in `days`, columns (Account, Ticker).
+
+    Args:
+        df_trades: trades with ['Account', 'Date', 'Ticker', 'Quantity']
+        days: sorted dates to report positions for
+    """
+    trade_day = pd.to_datetime(df_trades['Date']).dt.normalize()
+    quantity = pd.to_numeric(df_trades['Quantity'], errors='coerce').fillna(0)
+    daily_change = quantity.groupby([trade_day, df_trades['Account'], df_trades['Ticker']]).sum().unstack(['Account', 'Ticker'])
+    held = daily_change.fillna(0).sort_index().cumsum()
+    # carry the last trade day's position forward to every valuation day
+    return held.reindex(held.index.union(days)).ffill().reindex(days).fillna(0)
+
+
+def _fx_to_gbp(currencies: pd.Series, days: pd.DatetimeIndex, fx_rates: dict) -> pd.DataFrame:
+    """Multiplier turning one unit of close price into GBP, per day and (Account, Ticker) column.
+
+    London closes are in pence (IG labels them GBP, Trading 212 GBX); other currencies are valued at 0.
+    """
+    def rate_on(series):
+        # same as series.asof(day) for every day: last valid rate on or before it
+        series = series.dropna().sort_index()
+        series.index = pd.to_datetime(series.index)
+        return series[~series.index.duplicated(keep='last')].reindex(days, method='ffill').to_numpy()
+
+    per_currency = {
+        'USD': 1 / rate_on(fx_rates['GBPUSD']),
+        'EUR': 1 / rate_on(fx_rates['GBPEUR']),
+        'GBP': np.full(len(days), 0.01),
+        'GBX': np.full(len(days), 0.01),
+    }
+    zeros = np.zeros(len(days))
+    return pd.DataFrame(
+        np.column_stack([per_currency.get(c, zeros) for c in currencies]) if len(currencies) else np.empty((len(days), 0)),
+        index=days, columns=currencies.index
+    )
+
+
+def value_accounts(accounts: dict, df_market_historical_data, fx_rates: dict,
+                   days: pd.DatetimeIndex = None) -> pd.DataFrame:
+    """GBP value of every account on every valuation day, in one vectorised pass.
+
+    Args:
+        accounts: {account_id: trade history with ['Date', 'Ticker', 'Quantity', 'Currency']}
+        df_market_historical_data: OHLC rows with ['Date', 'Ticker', 'close', 'high'] for the union of tickers,
+            or a CompactMarketData of them
+        fx_rates: Dict with 'GBPUSD' and 'GBPEUR' as pd.Series with date index
+        days: dates to value (defaults to valuation_days(df_market_historical_data))
+
+    Returns:
+        DataFrame indexed by Date with one GBP value column per account
+    """
+    df_market_historical_data = market_frame(df_market_historical_data)
+    if days is None:
+        days = valuation_days(df_market_historical_data)
+    df_trades = union_trades(accounts)
+    positions = positions_by_day(df_trades, days)
+
+    closes = df_market_historical_data.assign(Date=pd.to_datetime(df_market_historical_data['Date']))
+    closes = closes.groupby(['Date', 'Ticker'])['close'].last().unstack('Ticker')
+    tickers = positions.columns.get_level_values('Ticker')
+    prices = closes.reindex(index=days, columns=tickers.unique()).reindex(columns=tickers).to_numpy()
+
+    currencies = df_trades.groupby(['Account', 'Ticker'])['Currency'].last().astype(str).reindex(positions.columns)
+    fx = _fx_to_gbp(currencies, days, fx_rates).to_numpy()
+
+    # a position with no close on that day contributes nothing, like a missing merge row
+    position_values = pd.DataFrame(positions.to_numpy() * prices * fx, index=days, columns=positions.columns)
+    values = position_values.T.groupby(level='Account').sum().T
+    values = values.reindex(columns=list(accounts), fill_value=0.0)
+    values.index.name = 'Date'
+    return values
+
+
+def load_value_cache(cache_file: str = VALUE_CACHE_FILE) -> dict:
+    if os.path.exists(cache_file):
+        with open(cache_file, 'r') as f:
+            return json.load(f)
+    return {}
+
+
+def save_value_cache(new_values: dict, cache_file: str = VALUE_CACHE_FILE):
+    """Merge {account_id: {date: value}} into the cache file, leaving other accounts untouched."""
+    all_accounts_cache = load_value_cache(cache_file)
+    for account_id, account_values in new_values.items():
+        all_accounts_cache.setdefault(account_id, {}).update(account_values)
+    tmp_path = cache_file + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(all_accounts_cache, f, indent=2)
+    os.replace(tmp_path, cache_file)
+    print(f"Saved portfolio values to {cache_file}")
+
+
+def portfolio_value_history(accounts: dict, df_market_historical_data, fx_rates: dict,
+                            cache_file: str = VALUE_CACHE_FILE) -> pd.DataFrame:
+    """Per-account and consolidated value series, computing only dates missing from the cache.
+
+    Args:
+        accounts: {account_id: trade history}, e.g. one entry per uploaded TradeHistory file
+        df_market_historical_data: OHLC rows (or a CompactMarketData) for the union of all accounts' tickers
+        fx_rates: Dict with 'GBPUSD' and 'GBPEUR' as pd.Series
+        cache_file: Path to the JSON valuation cache
+
+    Returns:
+        DataFrame indexed by Date with one GBP column per account plus 'Total'
+    """
+    all_accounts_cache = load_value_cache(cache_file)
+    df_market_historical_data = market_frame(df_market_historical_data)
+    days = valuation_days(df_market_historical_data)
+    day_keys = days.strftime('%Y-%m-%d')
+
+    # value only the days some account has not cached yet; one pass covers every account
+    missing = np.zeros(len(days), dtype=bool)
+    for account_id in accounts:
+        missing |= ~day_keys.isin(list(all_accounts_cache.get(account_id, {})))
+    new_values = {}
+    if missing.any():
+        print(f"Calculating portfolio values for {int(missing.sum())} new dates across {len(accounts)} account(s)...")
+        computed = value_accounts(accounts, df_market_historical_data, fx_rates, days[missing])
+        computed_keys = computed.index.strftime('%Y-%m-%d')
+        for account_id in accounts:
+            cached = all_accounts_cache.get(account_id, {})
+            new_values[account_id] = {
+                key: float(value) for key, value in zip(computed_keys, computed[account_id]) if key not in cached
+            }
+        save_value_cache(new_values, cache_file)
+
+    series = {}
+    for account_id in accounts:
+        account_values = {**all_accounts_cache.get(account_id, {}), **new_values.get(account_id, {})}
+        series[account_id] = pd.Series(account_values, dtype='float64')
+    values = pd.DataFrame(series)
+    values.index = pd.to_datetime(values.index)
+    values = values.sort_index()
+    values.index.name = 'Date'
+    values[TOTAL_COLUMN] = values[list(accounts)].sum(axis=1)
+    return values
@@ -0,0 +1,136 @@
+import json
+import os
+import stat
+import tempfile
+import threading
+
+try:
+    import fcntl  # POSIX only; on Windows writes are still serialised within the process
+except ImportError:
+    fcntl = None
+
+DEFAULT_TICKER_MAP_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "company_name_to_ticker.json")
+
+
+class TickerReferenceStore:
+    """Process-wide, concurrency-safe view of company_name_to_ticker.json.
+
+    The JSON is parsed once and only re-read when its mtime/size changes on disk, so a
+    Streamlit rerun costs a single os.stat. Writes take a process lock plus an flock on a
+    sidecar lock file, re-read the file, merge the new entries on top and atomically
+    replace it, so two sessions saving at the same time both keep their mappings.
+
+    eg. store = get_ticker_store()
+        store.mapping['Apple Inc'] -> 'AAPL'
+        store.names_for('AAPL')   -> {'Apple Inc', 'Apple Inc (All Sessions)'}
+    """
+
+    def __init__(self, path: str = DEFAULT_TICKER_MAP_FILE):
+        self.path = path
+        self._lock = threading.RLock()
+        self._signature = None
+        self._mapping = {}
+        self._reverse = {}
+
+    def _disk_signature(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _read_disk(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _install(self, mapping: dict, signature):
+        """Swap in a new mapping; readers holding the old dict keep a consistent snapshot."""
+        reverse = {}
+        for name, ticker in mapping.items():
+            reverse.setdefault(ticker, set()).add(name)
+        self._mapping, self._reverse, self._signature = mapping, reverse, signature
+
+    def refresh(self) -> bool:
+        """Reload from disk if the file changed since the last load. Returns True if reloaded."""
+        signature = self._disk_signature()
+        if signature == self._signature:
+            return False
+        with self._lock:
+            signature = self._disk_signature()
+            if signature != self._signature:
+                self._install(self._read_disk(), signature)
+                return True
+        return False
+
+    @property
+    def mapping(self) -> dict:
+        """Current name -> ticker dict. Treat as read-only; use update() to change it."""
+        self.refresh()
+        return self._mapping
+
+    def names_for(self, ticker: str) -> set:
+        """All names mapped to `ticker` (O(1) reverse lookup)."""
+        self.refresh()
+        return self._reverse.get(ticker, set())
+
+    def is_ticker(self, value: str) -> bool:
+        """True if `value` appears as a ticker (a mapping value), in O(1)."""
+        self.refresh()
+        return value in self._reverse
+
+    def resolve(self, name_or_ticker: str):
+        """Map a name to its ticker, following one chained hop; tickers map to themselves."""
+        mapping = self.mapping
+        if name_or_ticker in self._reverse:
+            return name_or_ticker
+        ticker = mapping.get(name_or_ticker)
+        # check if the ticker itself is a key in the map (chained mapping)
+        return mapping.get(ticker, ticker)
+
+    def update(self, new_mappings: dict) -> dict:
+        """Merge `new_mappings` into the file atomically and return the merged mapping."""
+        with self._lock:
+            lock_file = open(self.path + ".lock", "a")
+            try:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                # merge on top of what is on disk *now*, not what this process loaded earlier
+                merged = {**self._read_disk(), **new_mappings}
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        json.dump(merged, f, indent=2)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    # mkstemp creates 0600; keep the mode the file had (0644 for a new one)
+                    try:
+                        mode = stat.S_IMODE(os.stat(self.path).st_mode)
+                    except FileNotFoundError:
+                        mode = 0o644
+                    os.chmod(tmp_path, mode)
+                    os.replace(tmp_path, self.path)
+                except BaseException:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                    raise
+                self._install(merged, self._disk_signature())
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+        return merged
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_ticker_store(path: str = DEFAULT_TICKER_MAP_FILE) -> TickerReferenceStore:
+    """Return the single store instance for `path`, shared by every session in this process."""
+    path = os.path.realpath(path)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = TickerReferenceStore(path)
+        return _stores[path]
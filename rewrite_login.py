@@ -1,3 +1,5 @@
+import startup_profile
+startup_profile.install()  # per-module import timing when STARTUP_PROFILE=1
 import streamlit as st
 import os
 import sys
@@ -10,11 +12,9 @@ st.set_page_config(
 # Import Firebase service for login logging and email/password auth
 sys.path.append(os.path.join(os.getcwd(), ".agent/skills/users-login-record-firebase/scripts"))
 
-try:
-    from firebase_service import log_login_event, sign_in_with_email_password, sign_up_with_email_password
-    FIREBASE_AVAILABLE = True
-except ImportError:
-    FIREBASE_AVAILABLE = False
+# Not needed to draw the login page, so it is imported on first use (sign in / login logging)
+FIREBASE_AVAILABLE = startup_profile.is_available("firebase_service") and startup_profile.is_available("firebase_admin")
+firebase_service = startup_profile.lazy_import("firebase_service")
 
 # Import streamlit-oauth for GitHub (custom OAuth flow)
 try:
@@ -86,7 +86,7 @@ except Exception:
 def log_user_login(provider: str, email: str = None, user_name: str = None, user_id: str = None):
     """Log successful login to Firebase if available."""
     if FIREBASE_AVAILABLE:
-        log_login_event(
+        firebase_service.log_login_event(
             user_email=email or getattr(st.user, 'email', 'unknown'),
             user_name=user_name or getattr(st.user, 'name', None),
             provider=provider,
@@ -132,9 +132,9 @@ def handle_email_auth():
                 st.error("Password must be at least 6 characters.")
             else:
                 if st.session_state.auth_mode == "signin":
-                    result = sign_in_with_email_password(email, password)
+                    result = firebase_service.sign_in_with_email_password(email, password)
                 else:
-                    result = sign_up_with_email_password(email, password)
+                    result = firebase_service.sign_up_with_email_password(email, password)
                 
                 if result["success"]:
                     # Store user info in session state
@@ -473,6 +473,8 @@ if not is_user_logged_in():
             unsafe_allow_html=True # Keep for classes but use markdown for link
         )
 
+    startup_profile.mark("login_page_rendered")
+
 
 else:
     # User is logged in
@@ -497,5 +499,8 @@ else:
         if st.button("🚪 Logout", width="stretch"):
             logout()
     
-    # Execute the main dashboard
-    exec(open("rewrite_tab_1.py").read())
+    # Import the dashboard only after authentication, so the login page never pays for
+    # pandas/plotly. The module is compiled once per process; render() runs every rerun.
+    import rewrite_tab_1
+    rewrite_tab_1.render(user=get_current_user())
+    startup_profile.mark("dashboard_rendered")
@@ -1,16 +1,28 @@
 import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
+import numpy as np
 import pandas as pd
 
+from chart_lod import DEFAULT_PIXEL_BUDGET, WEBGL_THRESHOLD, in_x_range, lod_frame, line_trace
+from figure_cache import memoise_figure
+
+def cost_in_gbp(df, exchange_rate: dict):
+    """'Cost/Proceeds' converted to GBP: USD and EUR rows at the given rates, anything else as is."""
+    currency = df['Currency'].astype(str)
+    divisor = np.select(
+        [currency.eq('USD'), currency.eq('EUR')],
+        [exchange_rate['GBPUSD=X'], exchange_rate['GBPEUR=X']],
+        default=1.0,
+    )
+    return df['Cost/Proceeds'] / divisor
+
+
+@memoise_figure
 def plot_portfolio_weights(df, weights: list, exchange_rate: dict):
+    """Pies of current market value and GBP cost per instrument; `df` is not modified."""
     company_list = df['Market']
-    # calculate cost in GBP if df['Currency'] is USD, use exchange_rate['GBPUSD=X'], else if EUR use exchange_rate['GBPEUR=X']
-    df['Cost in GBP'] = df.apply(
-        lambda row: row['Cost/Proceeds'] / exchange_rate['GBPUSD=X'] 
-        if row['Currency'] == 'USD' else (row['Cost/Proceeds'] / exchange_rate['GBPEUR=X'] 
-        if row['Currency'] == 'EUR' else row['Cost/Proceeds']), axis=1)
-    
+    cost_gbp = cost_in_gbp(df, exchange_rate)
 
     fig = make_subplots(rows=1, cols=2, specs=[[{"type": "domain"}, {"type": "domain"}]]) # specs explained in https://plotly.com/python/subplots/
     fig.add_trace(go.Pie(
@@ -21,7 +33,7 @@ def plot_portfolio_weights(df, weights: list, exchange_rate: dict):
         ), 1, 1)
     fig.add_trace(go.Pie(
             labels = company_list,
-            values = abs(df['Cost in GBP']),
+            values = cost_gbp.abs(),
             pull = weights, 
             name = "Investment",
         ), 1, 2)
@@ -35,6 +47,7 @@ def plot_portfolio_weights(df, weights: list, exchange_rate: dict):
 #              dict(text='£ invested', x=0.82, y=0.5, font_size=20, showarrow=False)])
 
 
+@memoise_figure
 def plot_cashflow(net_cashflow: dict):
         # 1. Define the Data
     
@@ -98,13 +111,22 @@ def plot_cashflow(net_cashflow: dict):
 
     return fig
 
-def portfolio_value_over_time(df, account_id, benchmark_values: dict = None):
+@memoise_figure
+def portfolio_value_over_time(df, account_id, benchmark_values: dict = None,
+                              x_range: tuple = None, max_points: int = DEFAULT_PIXEL_BUDGET):
+    """Account value line, optionally with benchmark lines.
+
+    Every line is cut to `x_range` (a zoomed-in date range) and downsampled to `max_points`,
+    see chart_lod.
+    """
+    df = lod_frame(df, 'Date', ['Portfolio Value (GBP)'], max_points, x_range)
     fig_portfolio = px.line(
                 df,
                 x='Date',
                 y='Portfolio Value (GBP)',
                 title=f'Portfolio Value Over Time (Account: {account_id})',
                 labels={'Portfolio Value (GBP)': 'Value (£)'},
+                render_mode='webgl' if len(df) > WEBGL_THRESHOLD else 'auto',
             )
     fig_portfolio.update_traces(name='My Portfolio', line_color='#00C853', line_width=2, showlegend=True)
     
@@ -123,9 +145,9 @@ def portfolio_value_over_time(df, account_id, benchmark_values: dict = None):
             color = benchmark_colors.get(label, fallback_colors[color_idx % len(fallback_colors)])
             color_idx += 1
 
-            fig_portfolio.add_trace(go.Scatter(
-                x=df_bench_val['Date'], y=df_bench_val['Value'],
-                mode='lines',
+            df_bench_val = lod_frame(df_bench_val, 'Date', ['Value'], max_points, x_range)
+            fig_portfolio.add_trace(line_trace(
+                df_bench_val['Date'], df_bench_val['Value'],
                 name=f'If bought {label}',
                 line=dict(color=color, width=2, dash='dot'),
                 hovertemplate='%{x|%Y-%m-%d}<br>£%{y:,.0f}<extra>' + label + '</extra>',
@@ -146,6 +168,38 @@ def portfolio_value_over_time(df, account_id, benchmark_values: dict = None):
     )
     return fig_portfolio
 
+@memoise_figure
+def accounts_value_over_time(df_values, total_column: str = 'Total', title: str = 'Portfolio Value Over Time (All IG Accounts)'):
+    """Stacked value of each account with the consolidated total on top.
+
+    Args:
+        df_values: DataFrame indexed by Date with one GBP column per account plus `total_column`
+    """
+    fig = go.Figure()
+    for account_id in df_values.columns.drop(total_column):
+        fig.add_trace(go.Scatter(
+            x=df_values.index, y=df_values[account_id].fillna(0),
+            mode='lines',
+            name=account_id,
+            stackgroup='accounts',
+            hovertemplate='%{x|%Y-%m-%d}<br>£%{y:,.0f}<extra>' + account_id + '</extra>',
+        ))
+    fig.add_trace(go.Scatter(
+        x=df_values.index, y=df_values[total_column],
+        mode='lines',
+        name='Total',
+        line=dict(color='#00C853', width=3),
+        hovertemplate='%{x|%Y-%m-%d}<br>£%{y:,.0f}<extra>Total</extra>',
+    ))
+    fig.update_layout(
+        title=title,
+        hovermode='x unified',
+        yaxis_tickformat=',.0f',
+        yaxis_tickprefix='£',
+    )
+    return fig
+
+@memoise_figure
 def pie_chart_equity_by_currency(USD_market_value_in_gbp, EUR_market_value_in_gbp, GBP_market_value_in_gbp, Total_market_value_gbp):
     fig = px.pie(
         names=['USD', 'EUR', 'GBP'],
@@ -155,7 +209,46 @@ def pie_chart_equity_by_currency(USD_market_value_in_gbp, EUR_market_value_in_gb
     return fig
 
 
-def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: str = ""):
+def group_trade_markers(df_trades, qty_col: str = 'Quantity', price_col: str = 'Price',
+                        label_col: str = None, date_col: str = 'Date'):
+    """One marker row per trading day, for buy or sell markers on a chart.
+
+    Trades are grouped by normalised date once; the per-fill hover lines are built with
+    vectorised string ops and joined per day.
+
+    Args:
+        df_trades: trades of one side (all buys or all sells)
+        qty_col: quantity column (sign ignored)
+        price_col: fill price column
+        label_col: optional column prefixed to each fill line, eg. the ticker
+        date_col: trade date column
+
+    Returns:
+        DataFrame indexed by normalised date with 'Quantity' (total), 'Price'
+        (quantity-weighted average), 'Trades' (fill count) and 'Details' ('<br>'-joined fills)
+    """
+    day = pd.to_datetime(df_trades[date_col]).dt.normalize()
+    qty = pd.to_numeric(df_trades[qty_col], errors='coerce').abs()
+    price = pd.to_numeric(df_trades[price_col], errors='coerce')
+    line = qty.map('{:.2f}'.format).astype(str) + ' @ ' + price.map('{:.2f}'.format).astype(str)
+    if label_col is not None:
+        line = df_trades[label_col].astype(str) + ': ' + line
+
+    g = pd.DataFrame({'qty': qty, 'notional': qty * price, 'price': price, 'line': line}).groupby(day, sort=True)
+    total_qty = g['qty'].sum()
+    markers = pd.DataFrame({
+        'Quantity': total_qty,
+        'Price': (g['notional'].sum() / total_qty).fillna(g['price'].mean()),
+        'Trades': g.size(),
+        'Details': g['line'].agg('<br>'.join),
+    })
+    markers.index.name = 'Date'
+    return markers
+
+
+@memoise_figure
+def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: str = "",
+                                   x_range: tuple = None, max_points: int = DEFAULT_PIXEL_BUDGET):
     """Create a line chart of close price with buy/sell trade markers.
 
     Args:
@@ -163,15 +256,19 @@ def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: st
         df_trades: Trade history DataFrame with columns ['Date', 'Direction', 'Price', 'Quantity']
         ticker: The ticker symbol (used in the title)
         currency: The currency of the price (e.g. 'USD', 'GBP')
+        x_range: optional (start, end) dates to show
+        max_points: close price points after min/max downsampling (None draws every point)
     """
     fig = go.Figure()
 
-    # ── Close price line with subtle fill ──
+    # ── Close price line with subtle fill (min/max keeps intraday spikes) ──
+    df_close = lod_frame(df_ohlc[['Date', 'close']], 'Date', ['close'], max_points, x_range, method='minmax')
+    if x_range is not None:
+        df_trades = df_trades[in_x_range(df_trades['Date'], x_range)]
     fig.add_trace(
-        go.Scatter(
-            x=df_ohlc['Date'],
-            y=df_ohlc['close'],
-            mode='lines',
+        line_trace(
+            df_close['Date'],
+            df_close['close'],
             line=dict(color='#64B5F6', width=2.5),
             fill='tozeroy',
             fillcolor='rgba(100, 181, 246, 0.08)',
@@ -180,12 +277,14 @@ def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: st
         )
     )
 
-    # ── Buy markers ──
-    buys = df_trades[df_trades['Direction'].str.upper() == 'BUY']
+    direction = df_trades['Direction'].astype(str).str.upper()
+
+    # ── Buy markers (one per day; price is the quantity-weighted average) ──
+    buys = group_trade_markers(df_trades[direction == 'BUY'])
     if not buys.empty:
         fig.add_trace(
             go.Scatter(
-                x=buys['Date'],
+                x=buys.index,
                 y=buys['Price'],
                 mode='markers+text',
                 marker=dict(
@@ -194,7 +293,8 @@ def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: st
                     color='#00E676',
                     line=dict(width=1.5, color='white'),
                 ),
-                text=[f"BUY {q}" for q in buys['Quantity']],
+                text='BUY ' + buys['Quantity'].map('{:g}'.format),
+                customdata=buys['Details'],
                 textposition='top center',
                 textfont=dict(size=10, color='#00E676'),
                 name='Buy',
@@ -202,17 +302,18 @@ def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: st
                     '<b>BUY</b><br>'
                     'Date: %{x|%Y-%m-%d}<br>'
                     'Price: %{y:,.2f}<br>'
+                    '%{customdata}'
                     '<extra></extra>'
                 ),
             )
         )
 
     # ── Sell markers ──
-    sells = df_trades[df_trades['Direction'].str.upper() == 'SELL']
+    sells = group_trade_markers(df_trades[direction == 'SELL'])
     if not sells.empty:
         fig.add_trace(
             go.Scatter(
-                x=sells['Date'],
+                x=sells.index,
                 y=sells['Price'],
                 mode='markers+text',
                 marker=dict(
@@ -221,7 +322,8 @@ def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: st
                     color='#FF5252',
                     line=dict(width=1.5, color='white'),
                 ),
-                text=[f"SELL {q}" for q in sells['Quantity']],
+                text='SELL ' + sells['Quantity'].map('{:g}'.format),
+                customdata=sells['Details'],
                 textposition='bottom center',
                 textfont=dict(size=10, color='#FF5252'),
                 name='Sell',
@@ -229,6 +331,7 @@ def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: st
                     '<b>SELL</b><br>'
                     'Date: %{x|%Y-%m-%d}<br>'
                     'Price: %{y:,.2f}<br>'
+                    '%{customdata}'
                     '<extra></extra>'
                 ),
             )
@@ -275,16 +378,20 @@ def ticker_price_chart_with_trades(df_ohlc, df_trades, ticker: str, currency: st
 
 
 
-def t212_portfolio_value_over_time(df_all_trades, market_values):
-    dates = market_values.index.normalize()  # strip time component
-    values = market_values['total_value']
+@memoise_figure
+def t212_portfolio_value_over_time(df_all_trades, market_values,
+                                   x_range: tuple = None, max_points: int = DEFAULT_PIXEL_BUDGET):
+    df_line = pd.DataFrame({
+        'Date': market_values.index.normalize(),  # strip time component
+        'total_value': market_values['total_value'].to_numpy(),
+    })
+    df_line = lod_frame(df_line, 'Date', ['total_value'], max_points, x_range)
 
     fig = go.Figure()
 
     # Portfolio value line
-    fig.add_trace(go.Scatter(
-        x=dates, y=values,
-        mode='lines',
+    fig.add_trace(line_trace(
+        df_line['Date'], df_line['total_value'],
         name='Portfolio Value (GBP)',
         line=dict(color='royalblue', width=2),
     ))
@@ -298,20 +405,17 @@ def t212_portfolio_value_over_time(df_all_trades, market_values):
         ('Sell', sells, 'red',   'triangle-down'),
     ]:
         # Match trade dates to portfolio value; skip if date not in index
-        trade_dates = subset['Date'].dt.normalize()
-        matched_values = market_values['total_value'].reindex(trade_dates).dropna()
+        markers = group_trade_markers(subset, qty_col='Signed_Qty', label_col='Ticker_T212')
+        if x_range is not None:
+            markers = markers[in_x_range(markers.index, x_range)]
+        matched_values = market_values['total_value'].reindex(markers.index).dropna()
 
         if not matched_values.empty:
-            # Build hover text
-            hover = []
-            for d in matched_values.index:
-                trades_on_date = subset[subset['Date'].dt.normalize() == d]
-                parts = [f"{row['Ticker_T212']}: {abs(row['Signed_Qty']):.2f} @ {row['Price']:.2f}"
-                        for _, row in trades_on_date.iterrows()]
-                hover.append(f"{label}<br>{d.strftime('%Y-%m-%d')}<br>" + "<br>".join(parts))
+            details = markers['Details'].reindex(matched_values.index).to_numpy()
+            hover = (f"{label}<br>" + matched_values.index.strftime('%Y-%m-%d') + "<br>" + details).tolist()
 
             fig.add_trace(go.Scatter(
-                x=matched_values.index.normalize(),
+                x=matched_values.index,
                 y=matched_values.values,
                 mode='markers',
                 name=label,
@@ -336,22 +440,26 @@ def t212_portfolio_value_over_time(df_all_trades, market_values):
     
 
 
-def portfolio_vs_benchmarks(df_portfolio, benchmark_values: dict):
+@memoise_figure
+def portfolio_vs_benchmarks(df_portfolio, benchmark_values: dict,
+                            x_range: tuple = None, max_points: int = DEFAULT_PIXEL_BUDGET):
     """Plot portfolio value vs pre-calculated benchmark simulations.
 
     Args:
         df_portfolio: DataFrame with columns ['Date', 'Portfolio Value (GBP)']
         benchmark_values: dict of {label: DataFrame} where each DF has ['Date', 'Value']
+        x_range: optional (start, end) dates to show
+        max_points: points per line after downsampling (None draws every point)
     """
     fig = go.Figure()
 
     # ── Portfolio line (actual £ values) ──
-    df_p = df_portfolio.sort_values('Date').copy()
+    df_p = df_portfolio.copy()
     df_p['Date'] = pd.to_datetime(df_p['Date'])
+    df_p = lod_frame(df_p, 'Date', ['Portfolio Value (GBP)'], max_points, x_range)
 
-    fig.add_trace(go.Scatter(
-        x=df_p['Date'], y=df_p['Portfolio Value (GBP)'],
-        mode='lines',
+    fig.add_trace(line_trace(
+        df_p['Date'], df_p['Portfolio Value (GBP)'],
         name='My Portfolio',
         line=dict(color='#00E676', width=3),
         hovertemplate='%{x|%Y-%m-%d}<br>£%{y:,.0f}<extra>My Portfolio</extra>',
@@ -372,9 +480,9 @@ def portfolio_vs_benchmarks(df_portfolio, benchmark_values: dict):
         color = benchmark_colors.get(label, fallback_colors[color_idx % len(fallback_colors)])
         color_idx += 1
 
-        fig.add_trace(go.Scatter(
-            x=df_bench_val['Date'], y=df_bench_val['Value'],
-            mode='lines',
+        df_bench_val = lod_frame(df_bench_val, 'Date', ['Value'], max_points, x_range)
+        fig.add_trace(line_trace(
+            df_bench_val['Date'], df_bench_val['Value'],
             name=f'If bought {label}',
             line=dict(color=color, width=2, dash='dot'),
             hovertemplate='%{x|%Y-%m-%d}<br>£%{y:,.0f}<extra>' + label + '</extra>',
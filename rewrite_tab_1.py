@@ -1,15 +1,20 @@
 import pandas as pd
 import streamlit as st
 import numpy as np
-import json
 import os
 import time
 from datetime import datetime, timedelta
-from rewrite_ticker_resolution import use_sec_site
+from rewrite_ticker_resolution import use_sec_site, get_sec_resolver
 from getEODprice import getEODpriceUK, getEODpriceUSA, getEODpriceISIN
-import rewrite_plot_portfolio_weights as ppw # TODO: rename to make it more intuitive
-from market_data_api import OHLC_YahooFinance, HistoricalMarketData
+from startup_profile import lazy_import
+ppw = lazy_import("rewrite_plot_portfolio_weights") # TODO: rename to make it more intuitive; lazy so plotly loads with the first chart
+from market_data_api import OHLC_YahooFinance, HistoricalMarketData, CompactMarketData
 from trading212_api import Trading212API
+from reference_data import get_ticker_store
+from session_dag import SessionDAG
+import ig_ingest
+import portfolio_engine
+import ledger
 from urllib.parse import urlparse, parse_qs
 
 
@@ -21,15 +26,13 @@ def get_current_price(tickers: list) -> dict:
     eu_tickers_positions = getEODpriceUK(eu_tickers)
     return {**us_tickers_positions, **eu_tickers_positions}
 
-def convert_to_gbp(row):
+def convert_to_gbp(row, gbpusd_rate, gbpeur_rate):
     if row.name.endswith('.L'):
         return row['Market Value']  # already in GBP
     elif row.name.endswith('.DE'):
-        eur_to_gbp = GBPEUR.iloc[-1]
-        return row['Market Value'] / eur_to_gbp  # convert EUR to GBP
+        return row['Market Value'] / gbpeur_rate  # convert EUR to GBP
     else:
-        usd_to_gbp = GBPUSD.iloc[-1]
-        return row['Market Value'] / usd_to_gbp  # convert USD to GBP
+        return row['Market Value'] / gbpusd_rate  # convert USD to GBP
 
 def color_green_red(val):
     color = 'green' if val > 0 else 'red'
@@ -159,7 +162,7 @@ def historical_market_data_yahoo(market_data_collections: pd.DataFrame, df_trade
 def calculate_portfolio_value_on_date(
     target_date: datetime,
     df_trade_history: pd.DataFrame,
-    df_market_historical_data: pd.DataFrame,
+    df_market_historical_data,
     fx_rates: dict  # {'GBPUSD': pd.Series, 'GBPEUR': pd.Series}
 ) -> float:
     """Calculate total portfolio value in GBP for a specific date.
@@ -167,7 +170,8 @@ def calculate_portfolio_value_on_date(
     Args:
         target_date: The date to calculate portfolio value for
         df_trade_history: Trade history with columns ['Date', 'Ticker', 'Quantity', 'Currency']
-        df_market_historical_data: Historical OHLC data with columns ['Date', 'Ticker', 'close']
+        df_market_historical_data: CompactMarketData (binary-searched by date), or a
+            historical OHLC DataFrame with columns ['Date', 'Ticker', 'close']
         fx_rates: Dict with 'GBPUSD' and 'GBPEUR' as pd.Series with date index
     
     Returns:
@@ -185,10 +189,13 @@ def calculate_portfolio_value_on_date(
         df_positions = df_positions.reset_index()
     
     # Filter market data for target date
-    target_date_normalized = pd.Timestamp(target_date).date()
-    df_market_on_date = df_market_historical_data[
-        df_market_historical_data['Date'] == target_date_normalized
-    ].copy()
+    if isinstance(df_market_historical_data, CompactMarketData):
+        df_market_on_date = df_market_historical_data.on_date(target_date)
+    else:
+        target_date_normalized = pd.Timestamp(target_date).date()
+        df_market_on_date = df_market_historical_data[
+            df_market_historical_data['Date'] == target_date_normalized
+        ].copy()
     
     # Merge positions with market data
     df_positions = pd.merge(df_positions, df_market_on_date, on='Ticker', how='left')
@@ -215,19 +222,20 @@ def calculate_portfolio_value_on_date(
 def get_portfolio_value_history(
     account_id: str,
     df_trade_history: pd.DataFrame,
-    df_market_historical_data: pd.DataFrame,
+    df_market_historical_data,
     fx_rates: dict,
     cache_file: str = 'user_portfolio_values.json'
 ) -> dict:
     """Get or compute historical portfolio values for all trading days.
     
     Caches results to JSON file keyed by account_id. Only computes values for
-    dates not already in the cache.
+    dates not already in the cache. Several accounts can be valued in one pass
+    with portfolio_engine.portfolio_value_history.
     
     Args:
         account_id: Unique identifier for the account (e.g., 'QX2B3')
         df_trade_history: Trade history DataFrame
-        df_market_historical_data: Historical OHLC data with 'Date' column
+        df_market_historical_data: CompactMarketData, or historical OHLC data with 'Date' column
         fx_rates: Dict with 'GBPUSD' and 'GBPEUR' as pd.Series
         cache_file: Path to the JSON cache file
     
@@ -236,48 +244,10 @@ def get_portfolio_value_history(
     """
     pwd = os.path.dirname(os.path.realpath(__file__))
     cache_path = os.path.join(pwd, cache_file)
-    
-    # Load existing cache or create empty structure
-    if os.path.exists(cache_path):
-        with open(cache_path, 'r') as f:
-            all_accounts_cache = json.load(f)
-    else:
-        all_accounts_cache = {}
-    
-    # Get or create cache for this account
-    account_cache = all_accounts_cache.get(account_id, {})
-    
-    # Filter to only include dates where at least one US ticker has real data.
-    # We identify real data by checking if 'high' is not NaN (synthetic data has NaN high).
-    is_us_ticker = ~df_market_historical_data['Ticker'].str.contains(r'\.', na=False)
-    has_real_data = df_market_historical_data['high'].notnull()
-    trading_days = df_market_historical_data[is_us_ticker & has_real_data]['Date'].unique()
-    
-    # Find dates that need calculation (not already cached)
-    cached_dates = set(account_cache.keys())
-    dates_to_calculate = [d for d in trading_days if str(d) not in cached_dates]
-    
-    # Calculate values for missing dates
-    if dates_to_calculate:
-        print(f"Calculating portfolio values for {len(dates_to_calculate)} new dates...")
-        for date in dates_to_calculate:
-            # Convert to datetime for the calculation function
-            target_date = pd.Timestamp(date)
-            value = calculate_portfolio_value_on_date(
-                target_date=target_date,
-                df_trade_history=df_trade_history,
-                df_market_historical_data=df_market_historical_data,
-                fx_rates=fx_rates
-            )
-            account_cache[str(date)] = value
-        
-        # Save updated cache
-        all_accounts_cache[account_id] = account_cache
-        with open(cache_path, 'w') as f:
-            json.dump(all_accounts_cache, f, indent=2)
-        print(f"Saved portfolio values to {cache_path}")
-    
-    return account_cache
+    df_values = portfolio_engine.portfolio_value_history(
+        {account_id: df_trade_history}, df_market_historical_data, fx_rates, cache_path
+    )
+    return {date.strftime('%Y-%m-%d'): value for date, value in df_values[account_id].dropna().items()}
 
 # ─── Helper: paginate through all API results ─────────────────────────
 def fetch_all_paginated(api_func, label="data", delay=1.0, **kwargs):
@@ -314,13 +284,13 @@ def fetch_all_paginated(api_func, label="data", delay=1.0, **kwargs):
     return all_items
 
 
-def t212_convert_to_gbp(row):
+def t212_convert_to_gbp(row, gbpusd_rate, gbpeur_rate):
     if row['Currency'] == 'GBX' or row.name.endswith('.L'):
         return row['Market Value']
     elif row['Currency'] == 'EUR' or row.name.endswith('.DE'):
-        return row['Market Value'] / t212_GBPEUR.iloc[-1]
+        return row['Market Value'] / gbpeur_rate
     else:  # USD
-        return row['Market Value'] / t212_GBPUSD.iloc[-1]
+        return row['Market Value'] / gbpusd_rate
 
 @st.cache_data(ttl=3600, show_spinner=True)
 def get_cached_t212_all_orders(api_key, api_secret):
@@ -328,863 +298,991 @@ def get_cached_t212_all_orders(api_key, api_secret):
     return fetch_all_paginated(client.get_historical_orders, label="all orders", delay=10.0)
 
 
-st.title("Portfolio Management Dashboard and Analytics")
-
-# Load company name → Yahoo ticker mapping once, at the top level,
-# so it is available in both the CSV-upload section and the API section.
-_pwd = os.path.dirname(os.path.realpath(__file__))
-_reference_data_json_file = _pwd + '/company_name_to_ticker.json'
-if os.path.exists(_reference_data_json_file):
-    with open(_reference_data_json_file, 'r') as _jf:
-        company_name_to_ticker = json.load(_jf)
-else:
-    company_name_to_ticker = {}
-
-
-st.header("Upload Trade/Transaction History")
-uploaded_file = st.file_uploader('''\
-Upload your trade/transaction history in CSV format. Filename must be in the format of: \n
-1. trade file must have filename start with Trade*.csv \n
-2. transaction file must have filename start with Transaction*.csv''', type=["csv"], accept_multiple_files=True)
-if uploaded_file is not None:
-    for f in uploaded_file:
-        if f.name.startswith("Trade") and f.name.endswith(".csv"):
-            # Extract account identifier from filename (e.g., 'QX2B3' from 'TradeHistory-QX2B3-(...).csv')
-            filename_parts = f.name.split('-')
-            account_id = filename_parts[1] if len(filename_parts) > 1 else 'default'
-            
-            f.seek(0)
-            df_trade_history = pd.read_csv(f)
-            df_trade_history['Date'] = pd.to_datetime(df_trade_history['TextDate'], errors='coerce', dayfirst=True)
-            
-            # add ticker to trade history table
-            pwd = os.path.dirname(os.path.realpath(__file__))
-            reference_data_json_file = pwd + '/company_name_to_ticker.json'
-            df_trade_history['Ticker'] = df_trade_history['Market'].map(company_name_to_ticker)
-            
-            ## find missing symbols
-            missing_symbols = df_trade_history[~df_trade_history['Market'].isin(company_name_to_ticker.keys())]['Market'].unique()
-            if len(missing_symbols) > 0:
-                print("The following company names are not recognized and have no Ticker assigned:")
-                for symbol in missing_symbols:
-                    print(f"• {symbol}") 
-                print("Attempting to resolve missing company names using SEC data...")
-                resolved_symbols = use_sec_site(missing_symbols.tolist())
-                # compare resolved_symbols with missing_symbols, if there is still missing, add them as None to allow user to add them manually
-                if len(missing_symbols) != len(resolved_symbols): # TODO: find another way to resolve symbols
-                    for ms in missing_symbols:
-                        if ms not in resolved_symbols:
-                            resolved_symbols[ms] = None
-                st.write(f"Resolved Symbols: {resolved_symbols}")
-                st.write(f"unresolved Symbols: {[k for k,v in resolved_symbols.items() if v is None]}")
-
-                # Allow user to edit resolved symbols
-                st.subheader("Review and edit resolved mappings:")
-                edited_symbols = {}
-                
-                for market_name, ticker in resolved_symbols.items():
-                    col1, col2, col3 = st.columns([2, 2, 1])
-                    col1.write(f"**{market_name}**")
-                    # User can edit the ticker in text_input
-                    edited_ticker = col2.text_input(
-                        label="Ticker",
-                        value=ticker if ticker else "",
-                        key=f"ticker_{market_name}",
-                        label_visibility="collapsed"
-                    )
-                    edited_symbols[market_name] = edited_ticker
-                    # Checkbox to confirm inclusion
-                    if col3.checkbox("✓ Include", key=f"include_{market_name}", value=True):
-                        pass  # will be saved if checked
-                
-                # Save confirmed mappings
-                col_save, col_cancel = st.columns(2)
-                if col_save.button("✅ Save to company_name_to_ticker.json"):
-                    # Filter: only save if checkbox is checked AND ticker is not empty
-                    confirmed_mappings = {
-                        market_name: ticker 
-                        for market_name, ticker in edited_symbols.items() 
-                        if ticker.strip() and st.session_state.get(f"include_{market_name}", False)
-                    }
-                    
-                    if confirmed_mappings:
-                        company_name_to_ticker.update(confirmed_mappings)
-                        with open(reference_data_json_file, 'w') as json_file:
-                            json.dump(company_name_to_ticker, json_file, indent=2)
-                        st.success(f"✅ Saved {len(confirmed_mappings)} new mappings!")
-                        st.rerun()
-                        # check if trade history dataframe has no missing tickers now
-                        if df_trade_history['Ticker'].isnull().any():
-                            st.write("There are still unresolved tickers in trade history:")
-                            st.table(df_trade_history[df_trade_history['Ticker'].isnull()])
-                    else:
-                        st.error("No valid mappings to save (empty tickers or unchecked items).")
-                
-                if col_cancel.button("❌ Cancel"):
-                    st.info("Cancelled. No changes made.")
+# ─── IG upload stages (memoised per session by SessionDAG in render()) ─────────
+def read_ig_trade_history(data: bytes, company_name_to_ticker: dict) -> pd.DataFrame:
+    """Parsed IG TradeHistory export with the mapped 'Ticker' column."""
+    df_trade_history = ig_ingest.read_trade_history(data)
+    df_trade_history['Ticker'] = df_trade_history['Market'].map(company_name_to_ticker)
+    return df_trade_history
 
 
+def read_ig_cash_in(data: bytes) -> pd.DataFrame:
+    """'Cash In' rows of an IG Transaction export."""
+    return ig_ingest.cash_in(ig_ingest.read_transactions(data))
 
 
-            
-            # print trade history this quarter
-            st.subheader("Trade History This Quarter")
-            today = datetime.now()
-            current_quarter = pd.Period(today, freq='Q')
-            current_quarter_trade_history = df_trade_history[(df_trade_history['Date'].dt.to_period('Q') == current_quarter) & (df_trade_history['Activity']=="TRADE")] # type: ignore[attr-defined]
-            st.dataframe(current_quarter_trade_history)
-
-
-            # remove df_trade_history row that Ticker is null
-            df_trade_history_not_null = df_trade_history[df_trade_history['Ticker'].notnull()]
-            if len(df_trade_history_not_null) != len(df_trade_history):
-                st.warning(f"⚠️ {len(df_trade_history) - len(df_trade_history_not_null)} rows with unresolved Ticker were excluded from analysis.Result might not be accurate.")
-            
-            # update ticker
-            df_trade_history_ticker_updated = df_trade_history_not_null.copy()
-            df_trade_history_ticker_updated['Ticker'] = df_trade_history_ticker_updated['Ticker'].replace(company_name_to_ticker)
-
-            # calculate current positions
-            df_current_positions = df_trade_history_ticker_updated.groupby('Ticker').agg({'Quantity':'sum', 'Market': 'last', 'Cost/Proceeds': 'sum', 'Charges': 'sum', 'Commission': 'sum', 'Currency': 'last'})
-            df_current_positions = df_current_positions[df_current_positions['Quantity'] != 0]
-            df_current_positions['Costs'] = df_current_positions['Cost/Proceeds'] + df_current_positions['Charges'] + df_current_positions['Commission']
-            current_prices = get_current_price(df_current_positions.index.tolist())
-            df_current_positions['Current Price'] = df_current_positions.index.map(current_prices) # add EOD price to current price TODO: change when market open
-            df_current_positions['Quantity'] = pd.to_numeric(df_current_positions['Quantity'], errors='coerce')
-            df_current_positions['Current Price'] = pd.to_numeric(df_current_positions['Current Price'], errors='coerce')
-            df_current_positions['Market Value'] = df_current_positions['Quantity'] * df_current_positions['Current Price']
-            GBPUSD = get_historical_fx(df_trade_history_ticker_updated['Date'].min().strftime('%Y-%m-%d'))['GBPUSD=X']
-            GBPEUR = get_historical_fx(df_trade_history_ticker_updated['Date'].min().strftime('%Y-%m-%d'))['GBPEUR=X']
-            df_current_positions['Market Value GBP'] = df_current_positions.apply(convert_to_gbp, axis=1)
-
-            Total_market_value_gbp = df_current_positions['Market Value GBP'].sum()
-            USD_market_value_in_gbp = df_current_positions[df_current_positions['Currency']=='USD']['Market Value GBP'].sum()
-            EUR_market_value_in_gbp = df_current_positions[df_current_positions['Currency']=='EUR']['Market Value GBP'].sum()
-            GBP_market_value_in_gbp = df_current_positions[df_current_positions['Currency']=='GBP']['Market Value GBP'].sum()
-            
-            st.plotly_chart(ppw.pie_chart_equity_by_currency(USD_market_value_in_gbp, EUR_market_value_in_gbp, GBP_market_value_in_gbp, Total_market_value_gbp))
-            df_current_positions['PandL GBP'] = df_current_positions['Market Value GBP'] + df_current_positions['Costs']
-            df_present_positions = df_current_positions[['Market', 'Quantity', 'Current Price', 'Market Value GBP', 'PandL GBP']]
-            st.dataframe(df_present_positions.style.format({
-                'Market Value GBP': '£{:,.2f}',
-                'PandL GBP': '£{:,.2f}'
-            }).map(color_green_red, subset=['PandL GBP']), height=800)
+def ig_current_positions(df_trade_history_ticker_updated: pd.DataFrame, gbpusd_rate: float, gbpeur_rate: float) -> pd.DataFrame:
+    """Open positions with current price, market value and P&L in GBP."""
+    df_current_positions = df_trade_history_ticker_updated.groupby('Ticker').agg({'Quantity':'sum', 'Market': 'last', 'Cost/Proceeds': 'sum', 'Charges': 'sum', 'Commission': 'sum', 'Currency': 'last'})
+    df_current_positions = df_current_positions[df_current_positions['Quantity'] != 0].copy()
+    df_current_positions['Costs'] = df_current_positions['Cost/Proceeds'] + df_current_positions['Charges'] + df_current_positions['Commission']
+    current_prices = get_current_price(df_current_positions.index.tolist())
+    df_current_positions['Current Price'] = df_current_positions.index.map(current_prices) # add EOD price to current price TODO: change when market open
+    df_current_positions['Quantity'] = pd.to_numeric(df_current_positions['Quantity'], errors='coerce')
+    df_current_positions['Current Price'] = pd.to_numeric(df_current_positions['Current Price'], errors='coerce')
+    df_current_positions['Market Value'] = df_current_positions['Quantity'] * df_current_positions['Current Price']
+    df_current_positions['Market Value GBP'] = df_current_positions.apply(lambda r: convert_to_gbp(r, gbpusd_rate, gbpeur_rate), axis=1)
+    df_current_positions['PandL GBP'] = df_current_positions['Market Value GBP'] + df_current_positions['Costs']
+    return df_current_positions
 
-            
-            # single ticker trade history section TODO: instead of using selectbox, use a search box with autocomplete to allow user to search for the ticker or company name, and show the trade history for the selected ticker
-            trade_history_search_options1 = df_trade_history_ticker_updated['Market'].unique()
-            trade_history_search_options2 = df_trade_history_ticker_updated['Ticker'].unique()
-            trade_history_search_options = trade_history_search_options1.tolist() + trade_history_search_options2.tolist() 
-            selected_company = st.selectbox(
-                label="Select an instrument to see trade history",
-                options=trade_history_search_options,
-                key="select_company_ticker"
-            )
 
-            if selected_company in company_name_to_ticker.values():
-                selected_ticker = selected_company
-            else:
-                selected_ticker = company_name_to_ticker[selected_company]
-                # check if the ticker itself is a key in the map (chained mapping)
-                if selected_ticker in company_name_to_ticker:
-                     selected_ticker = company_name_to_ticker[selected_ticker]
-                print(selected_ticker)
-    
-            if selected_company:
-                df_ticker_trade_history = df_trade_history_ticker_updated[
-                    (df_trade_history_ticker_updated['Ticker'] == selected_ticker) & 
-                    (df_trade_history_ticker_updated['Activity'] == "TRADE")
-                ].sort_values(by='Date', ascending=False)
-        
-                st.subheader(f"Trade History for {selected_company} ({selected_ticker})")
-                st.table(df_ticker_trade_history[['Market', 'Ticker', 'Date', 'Direction', 'Quantity','Price', 'Currency']])
+def ig_account_id(filename: str) -> str:
+    """Account identifier from an IG export filename, e.g. 'QX2B3' from 'TradeHistory-QX2B3-(...).csv'."""
+    filename_parts = filename.split('-')
+    return filename_parts[1] if len(filename_parts) > 1 else 'default'
 
-                # ── Historical price chart with buy/sell markers ──
-                try:
-                    first_trade_date = df_ticker_trade_history['Date'].min()
-                    start_date_str = first_trade_date.strftime('%Y-%m-%d')
-                    df_ohlc = OHLC_YahooFinance(selected_ticker, start_date_str).yahooDataV8()
-                    df_ohlc['Date'] = pd.to_datetime(df_ohlc['Date'])
-
-                    # Prepare trade markers (ensure numeric Price & datetime Date)
-                    df_trades_for_chart = df_ticker_trade_history[['Date', 'Direction', 'Price', 'Quantity']].copy()
-                    df_trades_for_chart['Date'] = pd.to_datetime(df_trades_for_chart['Date'])
-                    df_trades_for_chart['Price'] = pd.to_numeric(df_trades_for_chart['Price'], errors='coerce')
-                    df_trades_for_chart['Quantity'] = pd.to_numeric(df_trades_for_chart['Quantity'], errors='coerce').abs()
-
-                    # IG quotes prices in pence/cents and are NOT split-adjusted;
-                    # Yahoo returns split-adjusted data in pounds/dollars.
-                    # Per-trade normalisation: compare each trade's price to the nearest
-                    # Yahoo close and divide by the rounded ratio. This simultaneously
-                    # handles cents→dollars conversion AND stock-split discrepancies.
-                    for idx, row in df_trades_for_chart.iterrows():
-                        nearest_idx = (df_ohlc['Date'] - row['Date']).abs().idxmin()
-                        nearest_close = df_ohlc.loc[nearest_idx, 'close']
-                        if nearest_close > 0 and row['Price'] > 0:
-                            ratio = row['Price'] / nearest_close
-                            if ratio > 5:
-                                df_trades_for_chart.at[idx, 'Price'] = row['Price'] / round(ratio)
-
-                    trade_currency = df_ticker_trade_history['Currency'].iloc[0] if not df_ticker_trade_history.empty else ''
-                    fig_ticker = ppw.ticker_price_chart_with_trades(
-                        df_ohlc, df_trades_for_chart, selected_ticker, currency=trade_currency
-                    )
-                    st.plotly_chart(fig_ticker, use_container_width=True)
-                except Exception as e:
-                    st.warning(f"⚠️ Could not load market data chart for {selected_ticker}: {e}")
 
-            # plot portfolio weights TODO: buggy, eg use any symbol highlight won't work
-            standout = [0.0] * len(df_current_positions)  # selected instrument highlight
-            instruments_list = df_current_positions['Market'].tolist()
-            if selected_company in instruments_list:
-                idx = instruments_list.index(selected_company)
-                standout[idx] = 0.5
-            current_GBP_rate = {'GBPUSD=X': GBPUSD.iloc[-1], 'GBPEUR=X': GBPEUR.iloc[-1]}
-            fig = ppw.plot_portfolio_weights(df_current_positions, standout, current_GBP_rate)
-            st.plotly_chart(fig, width="stretch")
+def market_data_for_accounts(accounts: dict) -> CompactMarketData:
+    """Historical market data for the union of every account's tickers, fetched once.
 
+    Only the compact container is returned (and kept in session state); the long frame
+    it is built from is dropped here.
+    """
+    df_all_trades = portfolio_engine.union_trades(accounts)
+    market_data_collections = symbol_trading_summary(df_all_trades)
+    return CompactMarketData(historical_market_data_yahoo(market_data_collections, df_all_trades))
+
+
+def ig_benchmark_value(symbol: str, df_cash_in: pd.DataFrame) -> pd.DataFrame:
+    """Value series of buying `symbol` with every cash deposit."""
+    benchmark_start = df_cash_in['TextDate'].min().strftime('%Y-%m-%d')
+    return calculate_benchmark_value(OHLC_YahooFinance(symbol, benchmark_start).yahooDataV8(), df_cash_in)
+
+
+def ig_ticker_chart(selected_ticker: str, df_ticker_trade_history: pd.DataFrame):
+    """Close price chart for one ticker with the account's buy/sell markers."""
+    first_trade_date = df_ticker_trade_history['Date'].min()
+    start_date_str = first_trade_date.strftime('%Y-%m-%d')
+    df_ohlc = OHLC_YahooFinance(selected_ticker, start_date_str).yahooDataV8()
+    df_ohlc['Date'] = pd.to_datetime(df_ohlc['Date'])
+
+    # Prepare trade markers (ensure numeric Price & datetime Date)
+    df_trades_for_chart = df_ticker_trade_history[['Date', 'Direction', 'Price', 'Quantity']].copy()
+    df_trades_for_chart['Date'] = pd.to_datetime(df_trades_for_chart['Date'])
+    df_trades_for_chart['Price'] = pd.to_numeric(df_trades_for_chart['Price'], errors='coerce')
+    df_trades_for_chart['Quantity'] = pd.to_numeric(df_trades_for_chart['Quantity'], errors='coerce').abs()
+
+    # IG quotes prices in pence/cents and are NOT split-adjusted;
+    # Yahoo returns split-adjusted data in pounds/dollars.
+    # Per-trade normalisation: compare each trade's price to the nearest
+    # Yahoo close and divide by the rounded ratio. This simultaneously
+    # handles cents→dollars conversion AND stock-split discrepancies.
+    for idx, row in df_trades_for_chart.iterrows():
+        nearest_idx = (df_ohlc['Date'] - row['Date']).abs().idxmin()
+        nearest_close = df_ohlc.loc[nearest_idx, 'close']
+        if nearest_close > 0 and row['Price'] > 0:
+            ratio = row['Price'] / nearest_close
+            if ratio > 5:
+                df_trades_for_chart.at[idx, 'Price'] = row['Price'] / round(ratio)
+
+    trade_currency = df_ticker_trade_history['Currency'].iloc[0] if not df_ticker_trade_history.empty else ''
+    return ppw.ticker_price_chart_with_trades(
+        df_ohlc, df_trades_for_chart, selected_ticker, currency=trade_currency
+    )
 
-            # ============ PORTFOLIO VALUE OVER TIME WIDGET ============
-            st.subheader("Portfolio Value Over Time")
-            
-            # Get historical market data and FX rates for the chart
-            market_data_collections = symbol_trading_summary(df_trade_history_not_null)
-            df_market_historical_data = historical_market_data_yahoo(market_data_collections, df_trade_history_not_null)
-            df_market_historical_data['Date'] = pd.to_datetime(df_market_historical_data['Date']).dt.date
+
+def ledger_sources(ig_accounts: dict, t212_csv_histories: dict, t212_api_orders: list, ticker_map: dict) -> dict:
+    """Every loaded source as ledger rows.
+
+    Returns:
+        {'frames': [ledger frame per source], 'dropped': trades left out for an unparseable date or no ticker}
+    """
+    dropped = []
+    frames = [ledger.from_ig(df, account_id, dropped=dropped) for account_id, df in ig_accounts.items()]
+    frames += [ledger.from_t212_csv(df, dropped=dropped) for df in t212_csv_histories.values()]
+    if t212_api_orders:
+        frames.append(ledger.from_t212_orders(t212_api_orders, ticker_map, dropped=dropped))
+    return {'frames': frames, 'dropped': pd.concat(dropped, ignore_index=True) if dropped else pd.DataFrame()}
+
+
+def sync_ledger(owner: str, sources: dict) -> pd.DataFrame:
+    """Merge the ledger_sources() frames into the user's stored ledger and return it."""
+    store = ledger.get_ledger_store(owner)
+    return store.upsert(*sources['frames']) if sources['frames'] else store.load()
+
+
+def render(user: dict = None):
+    """Render the dashboard page.
+
+    rewrite_login.py imports this module once per process and calls render() on every
+    rerun after authentication, so the functions above (and their st.cache_data caches)
+    are defined only once.
+
+    Args:
+        user: the logged-in user (rewrite_login.get_current_user()); scopes the stored ledger
+    """
+    st.title("Portfolio Management Dashboard and Analytics")
+
+    # Company name → Yahoo ticker mapping, shared by both the CSV-upload section and the API section.
+    # The store parses the JSON once per process and only reloads it when the file changes on disk.
+    ticker_store = get_ticker_store()
+    company_name_to_ticker = ticker_store.mapping
+
+
+    st.header("Upload Trade/Transaction History")
+    uploaded_file = st.file_uploader(
+        "Upload your trade/transaction history in CSV format. Filename must be in the format of: \n\n"
+        "1. trade file must have filename start with Trade*.csv \n\n"
+        "2. transaction file must have filename start with Transaction*.csv", type=["csv"], accept_multiple_files=True)
+    # sources collected for the combined (all brokers) ledger at the bottom of the page
+    ig_accounts = {}
+    t212_csv_histories = {}
+    t212_api_orders = None
+
+    if uploaded_file is not None:
+        # ─── IG accounts: every uploaded TradeHistory is valued together ───
+        # The union of tickers is fetched once and all accounts are valued in one vectorised
+        # pass, so the household total costs no more than a single account.
+        # Each stage only recomputes when its inputs change, so e.g. changing the
+        # instrument selectbox no longer re-parses, re-prices or re-values the accounts.
+        for f in uploaded_file:
+            if f.name.startswith("Trade") and f.name.endswith(".csv"):
+                dag = SessionDAG(st.session_state, f"ig_{ig_account_id(f.name)}")
+                df_trade_history = dag.stage("trade_history", read_ig_trade_history, f.getvalue(), company_name_to_ticker)
+                df_trade_history_not_null = dag.stage("not_null", lambda df: df[df['Ticker'].notnull()], df_trade_history)
+                ig_accounts[ig_account_id(f.name)] = dag.stage(
+                    "ticker_updated",
+                    lambda df, mapping: df.assign(Ticker=df['Ticker'].replace(mapping)),
+                    df_trade_history_not_null, company_name_to_ticker
+                )
+
+        if ig_accounts:
+            household = SessionDAG(st.session_state, "ig_household")
+            first_trade_date = min(df['Date'].min() for df in ig_accounts.values())
+            fx = household.stage("fx", get_historical_fx, first_trade_date.strftime('%Y-%m-%d'))
+            GBPUSD = fx['GBPUSD=X']
+            GBPEUR = fx['GBPEUR=X']
             fx_rates = {'GBPUSD': GBPUSD, 'GBPEUR': GBPEUR}
-            
-            # Get cached or calculate portfolio value history
-            portfolio_values_dict = get_portfolio_value_history(
-                account_id=account_id,
-                df_trade_history=df_trade_history_ticker_updated,
-                df_market_historical_data=df_market_historical_data,
-                fx_rates=fx_rates
+            market_compact = household.stage("market_data", market_data_for_accounts, ig_accounts)
+            df_account_values = household.stage(
+                "values", portfolio_engine.portfolio_value_history, ig_accounts, market_compact, fx_rates
             )
-            
-            # Convert to DataFrame for plotting
-            df_portfolio_history = pd.DataFrame([
-                {'Date': pd.to_datetime(date), 'Portfolio Value (GBP)': value}
-                for date, value in portfolio_values_dict.items()
-            ]).sort_values('Date')
-            
-            # --- Check for benchmarks from Transaction file if uploaded ---
-            benchmark_values = {}
-            df_cashIn_for_bench = None
-            for tmp_f in uploaded_file:
-                if tmp_f.name.startswith("Transaction") and tmp_f.name.endswith(".csv"):
-                    tmp_f.seek(0)  # Ensure we read from the start
-                    tmp_df = pd.read_csv(tmp_f)
-                    tmp_f.seek(0)  # Reset pointer for later processing
-                    tmp_df['Summary'] = tmp_df['Summary'].fillna('Cash Interest - Platform Cost')
-                    tmp_df['PL Amount'] = tmp_df['PL Amount'].str.replace(',', '')
-                    type_dict = {'TextDate': 'datetime64[s]', 'PL Amount': 'float', 'Summary': 'category', 'Transaction type': 'category', 'Cash transaction': 'boolean', 'MarketName': 'string'}
-                    tmp_df = tmp_df.astype(type_dict)
-                    tmp_df.loc[tmp_df['MarketName'] == 'Bank Deposit', 'Summary'] = 'Cash In'
-                    df_cashIn_for_bench = tmp_df[tmp_df['Summary'] == 'Cash In']
-                    break
-            
-            if df_cashIn_for_bench is not None and not df_cashIn_for_bench.empty:
-                st.write("Compare with benchmarks:")
-                col_sp500, col_ndx = st.columns(2)
-                show_sp500 = col_sp500.checkbox("S&P 500", value=False)
-                show_ndx = col_ndx.checkbox("Nasdaq 100", value=False)
-                
-                benchmark_start = df_cashIn_for_bench['TextDate'].min().strftime('%Y-%m-%d')
-                
-                if show_sp500:
-                    try:
-                        sp500_ohlc = OHLC_YahooFinance("^SPX", benchmark_start).yahooDataV8()
-                        benchmark_values['S&P 500'] = calculate_benchmark_value(sp500_ohlc, df_cashIn_for_bench)
-                    except Exception as e:
-                        st.warning(f"⚠️ Could not fetch S&P 500 data: {e}")
-                
-                if show_ndx:
+
+        for f in uploaded_file:
+            if f.name.startswith("Trade") and f.name.endswith(".csv"):
+                account_id = ig_account_id(f.name)
+                dag = SessionDAG(st.session_state, f"ig_{account_id}")
+                df_trade_history = dag.stage("trade_history", read_ig_trade_history, f.getvalue(), company_name_to_ticker)
+
+                ## find missing symbols
+                missing_symbols = df_trade_history[~df_trade_history['Market'].isin(company_name_to_ticker.keys())]['Market'].unique()
+                if len(missing_symbols) > 0:
+                    print("The following company names are not recognized and have no Ticker assigned:")
+                    for symbol in missing_symbols:
+                        print(f"• {symbol}") 
+                    print("Attempting to resolve missing company names using SEC data...")
+                    # every missing name comes back, None where no SEC title scored well enough
+                    resolved_symbols = dag.stage("sec_best", use_sec_site, missing_symbols.tolist())
+                    ranked_candidates = dag.stage("sec_ranked", lambda names: get_sec_resolver().resolve(names, limit=3), missing_symbols.tolist())
+                    st.write(f"Resolved Symbols: {resolved_symbols}")
+                    st.write(f"unresolved Symbols: {[k for k,v in resolved_symbols.items() if v is None]}")
+
+                    # Allow user to edit resolved symbols
+                    st.subheader("Review and edit resolved mappings:")
+                    edited_symbols = {}
+
+                    for market_name, ticker in resolved_symbols.items():
+                        col1, col2, col3 = st.columns([2, 2, 1])
+                        col1.write(f"**{market_name}**")
+                        candidates = ranked_candidates.get(market_name, [])
+                        # User can edit the ticker in text_input
+                        edited_ticker = col2.text_input(
+                            label="Ticker",
+                            value=ticker if ticker else "",
+                            key=f"ticker_{market_name}",
+                            label_visibility="collapsed",
+                            help="SEC candidates: " + ", ".join(f"{t} ({title}, {score:.2f})" for t, title, score in candidates) if candidates else None
+                        )
+                        edited_symbols[market_name] = edited_ticker
+                        # Checkbox to confirm inclusion
+                        if col3.checkbox("✓ Include", key=f"include_{market_name}", value=True):
+                            pass  # will be saved if checked
+
+                    # Save confirmed mappings
+                    col_save, col_cancel = st.columns(2)
+                    if col_save.button("✅ Save to company_name_to_ticker.json"):
+                        # Filter: only save if checkbox is checked AND ticker is not empty
+                        confirmed_mappings = {
+                            market_name: ticker 
+                            for market_name, ticker in edited_symbols.items() 
+                            if ticker.strip() and st.session_state.get(f"include_{market_name}", False)
+                        }
+
+                        if confirmed_mappings:
+                            ticker_store.update(confirmed_mappings)
+                            st.success(f"✅ Saved {len(confirmed_mappings)} new mappings!")
+                            st.rerun()
+                            # check if trade history dataframe has no missing tickers now
+                            if df_trade_history['Ticker'].isnull().any():
+                                st.write("There are still unresolved tickers in trade history:")
+                                st.table(df_trade_history[df_trade_history['Ticker'].isnull()])
+                        else:
+                            st.error("No valid mappings to save (empty tickers or unchecked items).")
+
+                    if col_cancel.button("❌ Cancel"):
+                        st.info("Cancelled. No changes made.")
+
+
+
+
+
+                # print trade history this quarter
+                st.subheader("Trade History This Quarter")
+                today = datetime.now()
+                current_quarter = pd.Period(today, freq='Q')
+                current_quarter_trade_history = df_trade_history[(df_trade_history['Date'].dt.to_period('Q') == current_quarter) & (df_trade_history['Activity']=="TRADE")] # type: ignore[attr-defined]
+                st.dataframe(current_quarter_trade_history)
+
+
+                # rows with a null Ticker were removed before valuation
+                unresolved_rows = df_trade_history['Ticker'].isnull().sum()
+                if unresolved_rows:
+                    st.warning(f"⚠️ {unresolved_rows} rows with unresolved Ticker were excluded from analysis.Result might not be accurate.")
+                df_trade_history_ticker_updated = ig_accounts[account_id]
+
+                # calculate current positions
+                df_current_positions = dag.stage("positions", ig_current_positions, df_trade_history_ticker_updated, GBPUSD.iloc[-1], GBPEUR.iloc[-1])
+
+                Total_market_value_gbp = df_current_positions['Market Value GBP'].sum()
+                USD_market_value_in_gbp = df_current_positions[df_current_positions['Currency']=='USD']['Market Value GBP'].sum()
+                EUR_market_value_in_gbp = df_current_positions[df_current_positions['Currency']=='EUR']['Market Value GBP'].sum()
+                GBP_market_value_in_gbp = df_current_positions[df_current_positions['Currency']=='GBP']['Market Value GBP'].sum()
+
+                st.plotly_chart(ppw.pie_chart_equity_by_currency(USD_market_value_in_gbp, EUR_market_value_in_gbp, GBP_market_value_in_gbp, Total_market_value_gbp))
+                df_present_positions = df_current_positions[['Market', 'Quantity', 'Current Price', 'Market Value GBP', 'PandL GBP']]
+                st.dataframe(df_present_positions.style.format({
+                    'Market Value GBP': '£{:,.2f}',
+                    'PandL GBP': '£{:,.2f}'
+                }).map(color_green_red, subset=['PandL GBP']), height=800)
+
+
+                # single ticker trade history section TODO: instead of using selectbox, use a search box with autocomplete to allow user to search for the ticker or company name, and show the trade history for the selected ticker
+                trade_history_search_options1 = df_trade_history_ticker_updated['Market'].unique()
+                trade_history_search_options2 = df_trade_history_ticker_updated['Ticker'].unique()
+                trade_history_search_options = trade_history_search_options1.tolist() + trade_history_search_options2.tolist() 
+                selected_company = st.selectbox(
+                    label="Select an instrument to see trade history",
+                    options=trade_history_search_options,
+                    key=f"select_company_ticker_{account_id}"
+                )
+
+                selected_ticker = ticker_store.resolve(selected_company)
+
+                if selected_company:
+                    df_ticker_trade_history = df_trade_history_ticker_updated[
+                        (df_trade_history_ticker_updated['Ticker'] == selected_ticker) & 
+                        (df_trade_history_ticker_updated['Activity'] == "TRADE")
+                    ].sort_values(by='Date', ascending=False)
+
+                    st.subheader(f"Trade History for {selected_company} ({selected_ticker})")
+                    st.table(df_ticker_trade_history[['Market', 'Ticker', 'Date', 'Direction', 'Quantity','Price', 'Currency']])
+
+                    # ── Historical price chart with buy/sell markers ──
                     try:
-                        nasdaq100_ohlc = OHLC_YahooFinance("^NDX", benchmark_start).yahooDataV8()
-                        benchmark_values['Nasdaq 100'] = calculate_benchmark_value(nasdaq100_ohlc, df_cashIn_for_bench)
+                        fig_ticker = dag.stage("ticker_chart", ig_ticker_chart, selected_ticker, df_ticker_trade_history)
+                        st.plotly_chart(fig_ticker, use_container_width=True)
                     except Exception as e:
-                        st.warning(f"⚠️ Could not fetch Nasdaq 100 data: {e}")
-
-            fig_portfolio = ppw.portfolio_value_over_time(df_portfolio_history, account_id, benchmark_values)
-            st.plotly_chart(fig_portfolio, width="stretch")
-
-            # Date Range Slider
-            # today_date = datetime.now().date()
-            # one_year_ago = today_date - pd.DateOffset(years=1)
-            # two_years_ago = today_date - pd.DateOffset(years=2)
-
-            # selected_date_range = st.slider(
-            #     "Select Date Range",
-            #     min_value=two_years_ago.date(),
-            #     max_value=today_date,
-            #     value=(one_year_ago.date(), today_date),
-            #     format="YYYY-MM-DD"
-            # )
-            # start_date_selected, end_date_selected = selected_date_range
-            # st.write(f"Showing data from {start_date_selected} to {end_date_selected}")
-            
+                        st.warning(f"⚠️ Could not load market data chart for {selected_ticker}: {e}")
 
+                # plot portfolio weights TODO: buggy, eg use any symbol highlight won't work
+                standout = [0.0] * len(df_current_positions)  # selected instrument highlight
+                instruments_list = df_current_positions['Market'].tolist()
+                if selected_company in instruments_list:
+                    idx = instruments_list.index(selected_company)
+                    standout[idx] = 0.5
+                current_GBP_rate = {'GBPUSD=X': GBPUSD.iloc[-1], 'GBPEUR=X': GBPEUR.iloc[-1]}
+                fig = dag.stage("weights_chart", ppw.plot_portfolio_weights, df_current_positions, standout, current_GBP_rate)
+                st.plotly_chart(fig, width="stretch")
 
-            selected_date = None
-            st.write("Select a time period to view portfolio value on that date:")
-            left1, left2, middle1, middle2, right1, right2 = st.columns(6)
-            if left1.button("1y", width="stretch"):
-                selected_date = calculate_past_date("1y")
-            if left2.button("6m", width="stretch"):
-                selected_date = calculate_past_date("6m")
-            if middle1.button("3m", width="stretch"):
-                selected_date = calculate_past_date("3m")
-            if middle2.button("1m", width="stretch"):
-                selected_date = calculate_past_date("1m")
-            if right1.button("1w", width="stretch"):
-                selected_date = calculate_past_date("1w")
-            if right2.button("1d", width="stretch"):
-                selected_date = calculate_past_date("1d")
-            
-            if selected_date:
-                Total_value_in_GBP_selected_date = calculate_portfolio_value_on_date(
-                target_date=selected_date,
-                df_trade_history=df_trade_history_ticker_updated,
-                df_market_historical_data=df_market_historical_data,
-                fx_rates=fx_rates
+
+                # ============ PORTFOLIO VALUE OVER TIME WIDGET ============
+                st.subheader("Portfolio Value Over Time")
+
+                # this account's column of the shared valuation
+                df_portfolio_history = (
+                    df_account_values[account_id].dropna().rename('Portfolio Value (GBP)').reset_index()
                 )
-                
-                diff = Total_market_value_gbp - Total_value_in_GBP_selected_date
-                st.markdown(f"Total value in GBP on {selected_date.date()}: **£{Total_value_in_GBP_selected_date:,.2f}**, value today: **£{Total_market_value_gbp:,.2f}**")
-                st.markdown(f"Value difference between {selected_date.date()} and today: **<span style='color:{'green' if diff > 0 else 'red'}'>£{diff:,.2f}</span>**", unsafe_allow_html=True)
-        
-        elif f.name.startswith("Transaction") and f.name.endswith(".csv"):
-            f.seek(0)
-            df_transactions = pd.read_csv(f)
-            df_transactions['Summary'] = df_transactions['Summary'].fillna('Cash Interest - Platform Cost')
-            type_dict = {'TextDate': 'datetime64[s]', 'PL Amount': 'float', 'Summary': 'category', 'Transaction type': 'category', 'Cash transaction': 'boolean', 'MarketName': 'string'}
-            df_transactions['PL Amount'] = df_transactions['PL Amount'].str.replace(',','')
-            df_transactions = df_transactions.astype(type_dict)
-            df_transactions.loc[df_transactions['MarketName'] == 'Bank Deposit', 'Summary'] = 'Cash In'
-            df_cashIn = df_transactions[df_transactions['Summary']=='Cash In' ]
-            st.metric(label="Total Cash Invested", value=f"£{df_cashIn['PL Amount'].sum():,.2f}")
-            net_cashflow = {}
-            for i in df_transactions['Summary'].unique():
-                net_cashflow[i] = df_transactions[df_transactions['Summary'] == i]['PL Amount'].sum()
-            st.write(net_cashflow)
-            fig = ppw.plot_cashflow(net_cashflow)
-            st.plotly_chart(fig, width="stretch")
-
-
-
-
-        # ============ TRADING 212 analyze manually downloaded history file ============
-        elif f.name.startswith("from") and f.name.endswith(".csv"):
-            df_trading212_history = pd.read_csv(f)
-            print(df_trading212_history.head())
-            print(df_trading212_history.tail())
-
-            # ============ TRADING 212 PORTFOLIO POSITIONS & CURRENT VALUE ============
-            st.subheader("Trading 212 Portfolio Positions")
-
-            # Filter to trade actions only (buy/sell)
-            trade_actions = ['Market buy', 'Market sell', 'Limit buy', 'Limit sell']
-            df_t212_trades = df_trading212_history[df_trading212_history['Action'].isin(trade_actions)].copy()
-
-            if not df_t212_trades.empty:
-                # calculate total invested cash & interest from unfiltered history
-                total_deposit = df_trading212_history.loc[df_trading212_history['Action'] == 'Deposit', 'Total'].sum()
-                interest = df_trading212_history.loc[df_trading212_history['Action'] == 'Interest on cash', 'Total'].sum()
-
-                # Assign signed quantity: buys are positive, sells are negative
-                df_t212_trades['Signed Shares'] = df_t212_trades['No. of shares']
-                sell_mask = df_t212_trades['Action'].isin(['Market sell', 'Limit sell'])
-                df_t212_trades.loc[sell_mask, 'Signed Shares'] = -df_t212_trades.loc[sell_mask, 'No. of shares']
-
-                # Calculate current positions by grouping on Ticker
-                df_t212_positions = df_t212_trades.groupby('Ticker').agg({
-                    'Signed Shares': 'sum',
-                    'Name': 'last',
-                    'Total': 'sum',
-                    'Currency (Price / share)': 'last',
-                    'ISIN': 'last'
-                }).rename(columns={
-                    'Signed Shares': 'Quantity',
-                    'Total': 'Total Cost',
-                    'Currency (Price / share)': 'Currency'
-                })
-
-                # Keep only positions with non-zero quantity (still held)
-                df_t212_positions = df_t212_positions[df_t212_positions['Quantity'].abs() > 1e-9]
-
-                if not df_t212_positions.empty:
-                    us_tickers = df_t212_positions[df_t212_positions['Currency'] == 'USD'].index.tolist()
-                    uk_tickers = df_t212_positions[df_t212_positions['Currency'] == 'GBX'].index.tolist()
-                    eu_tickers = df_t212_positions[df_t212_positions['Currency'] == 'EUR'].index.tolist()
-
-                    uk_tickers = [ticker+'.L' for ticker in uk_tickers]
-
-                    us_prices = getEODpriceUSA(us_tickers)
-                    uk_prices = getEODpriceUK(uk_tickers)
-                    # eu_prices = getEODpriceEU(eu_tickers)
-
-                    # Fallback: if getEODpriceUSA failed for any US ticker, retry via getEODpriceISIN
-                    failed_us_tickers = [t for t in us_tickers if us_prices.get(t) is None]
-                    if failed_us_tickers:
-                        print(f"getEODpriceUSA failed for {failed_us_tickers}, retrying with getEODpriceISIN...")
-                        failed_isins = df_t212_positions.loc[failed_us_tickers, 'ISIN'].tolist()
-                        fallback_prices = getEODpriceISIN(failed_isins)
-                        # Map ISIN-based prices back to ticker
-                        for ticker in failed_us_tickers:
-                            isin = df_t212_positions.loc[ticker, 'ISIN']
-                            if fallback_prices.get(isin) is not None:
-                                us_prices[ticker] = fallback_prices[isin]
-
-                    # Merge all prices by ticker (strip .L suffix from uk_prices keys to match index)
-                    uk_prices_remapped = {k.replace('.L', ''): v for k, v in uk_prices.items()}
-                    # all_prices = {**us_prices, **uk_prices_remapped, **eu_prices}
-                    all_prices = {**us_prices, **uk_prices_remapped}
-                    df_t212_positions['Current Price'] = pd.to_numeric(df_t212_positions.index.map(all_prices), errors='coerce')
-                    df_t212_positions['Market Value'] = df_t212_positions['Quantity'] * df_t212_positions['Current Price']
-
-                    # Convert market value to GBP
-                    # Fetch FX rates if not already available
-                    t212_min_date = pd.to_datetime(df_t212_trades['Time']).min().strftime('%Y-%m-%d')
-                    t212_fx = get_historical_fx(t212_min_date)
-                    t212_GBPUSD = t212_fx['GBPUSD=X']
-                    t212_GBPEUR = t212_fx['GBPEUR=X']
-
-
-                    df_t212_positions['Market Value GBP'] = df_t212_positions.apply(t212_convert_to_gbp, axis=1)
-                    df_t212_positions['PandL GBP'] = df_t212_positions['Market Value GBP'] - df_t212_positions['Total Cost']
-
-                    t212_total_market_value_gbp = df_t212_positions['Market Value GBP'].sum()
-                    t212_total_cost = df_t212_positions['Total Cost'].sum()
-                    t212_total_pandl = t212_total_market_value_gbp - t212_total_cost
-
-                    col_val, col_cash = st.columns(2)
-                    col_val.metric(label="Trading 212 Total Portfolio Value", value=f"£{t212_total_market_value_gbp:,.2f}", delta=f"£{t212_total_pandl:,.2f}")
-                    col_cash.metric(label="Of which cash investment (delta interest earned)", value=f"£{total_deposit}", delta=f"£{interest}")
-                    df_t212_display = df_t212_positions[['Name', 'Quantity', 'Current Price', 'Currency', 'Market Value GBP', 'PandL GBP']]
-                    st.dataframe(df_t212_display.style.format({
-                        'Quantity': '{:,.4f}',
-                        'Current Price': '{:,.2f}',
-                        'Market Value GBP': '£{:,.2f}',
-                        'PandL GBP': '£{:,.2f}'
-                    }).map(color_green_red, subset=['PandL GBP']), height=400)
-                else:
-                    st.info("No open positions found in Trading 212 history.")
-
-                # ============ TRADING 212 SINGLE INSTRUMENT TRADE HISTORY ============
-                st.subheader("Trading 212 – Instrument Trade History")
-                t212_unique = df_t212_trades[['Ticker', 'Name']].drop_duplicates().sort_values('Ticker')
-                t212_options = [f"{row['Ticker']}  —  {row['Name']}" for _, row in t212_unique.iterrows()]
-                selected_t212 = st.selectbox("Select an instrument to view trades", options=t212_options, key="t212_instrument_select")
-                if selected_t212:
-                    selected_t212_ticker = selected_t212.split("  —  ")[0]
-                    df_t212_selected = df_t212_trades[df_t212_trades['Ticker'] == selected_t212_ticker].sort_values('Time', ascending=False)
-                    st.table(df_t212_selected[['Time', 'Action', 'Name', 'Ticker', 'No. of shares', 'Price / share', 'Currency (Price / share)', 'Total']])
-            else:
-                st.info("No trade actions found in the uploaded Trading 212 file.")
 
+                # --- Check for benchmarks from Transaction file if uploaded ---
+                benchmark_values = {}
+                df_cashIn_for_bench = None
+                for tmp_f in uploaded_file:
+                    if tmp_f.name.startswith("Transaction") and tmp_f.name.endswith(".csv"):
+                        df_cashIn_for_bench = dag.stage("cash_in", read_ig_cash_in, tmp_f.getvalue())
+                        break
+
+                if df_cashIn_for_bench is not None and not df_cashIn_for_bench.empty:
+                    st.write("Compare with benchmarks:")
+                    col_sp500, col_ndx = st.columns(2)
+                    show_sp500 = col_sp500.checkbox("S&P 500", value=False, key=f"bench_sp500_{account_id}")
+                    show_ndx = col_ndx.checkbox("Nasdaq 100", value=False, key=f"bench_ndx_{account_id}")
+
+                    if show_sp500:
+                        try:
+                            benchmark_values['S&P 500'] = dag.stage("bench_sp500", ig_benchmark_value, "^SPX", df_cashIn_for_bench)
+                        except Exception as e:
+                            st.warning(f"⚠️ Could not fetch S&P 500 data: {e}")
+
+                    if show_ndx:
+                        try:
+                            benchmark_values['Nasdaq 100'] = dag.stage("bench_ndx", ig_benchmark_value, "^NDX", df_cashIn_for_bench)
+                        except Exception as e:
+                            st.warning(f"⚠️ Could not fetch Nasdaq 100 data: {e}")
+
+                # zooming re-downsamples the selected range to the same point budget (finer detail)
+                value_range = None
+                value_dates = pd.to_datetime(df_portfolio_history['Date'])
+                if value_dates.nunique() > 1:
+                    first_day, last_day = value_dates.min().date(), value_dates.max().date()
+                    value_range = st.slider(
+                        "Zoom", min_value=first_day, max_value=last_day, value=(first_day, last_day),
+                        format="YYYY-MM-DD", key=f"value_range_{account_id}"
+                    )
+                fig_portfolio = dag.stage(
+                    "value_chart", ppw.portfolio_value_over_time, df_portfolio_history, account_id, benchmark_values, value_range
+                )
+                st.plotly_chart(fig_portfolio, width="stretch")
+
+                # Date Range Slider
+                # today_date = datetime.now().date()
+                # one_year_ago = today_date - pd.DateOffset(years=1)
+                # two_years_ago = today_date - pd.DateOffset(years=2)
+
+                # selected_date_range = st.slider(
+                #     "Select Date Range",
+                #     min_value=two_years_ago.date(),
+                #     max_value=today_date,
+                #     value=(one_year_ago.date(), today_date),
+                #     format="YYYY-MM-DD"
+                # )
+                # start_date_selected, end_date_selected = selected_date_range
+                # st.write(f"Showing data from {start_date_selected} to {end_date_selected}")
+
+
+
+                selected_date = None
+                st.write("Select a time period to view portfolio value on that date:")
+                left1, left2, middle1, middle2, right1, right2 = st.columns(6)
+                if left1.button("1y", width="stretch", key=f"period_1y_{account_id}"):
+                    selected_date = calculate_past_date("1y")
+                if left2.button("6m", width="stretch", key=f"period_6m_{account_id}"):
+                    selected_date = calculate_past_date("6m")
+                if middle1.button("3m", width="stretch", key=f"period_3m_{account_id}"):
+                    selected_date = calculate_past_date("3m")
+                if middle2.button("1m", width="stretch", key=f"period_1m_{account_id}"):
+                    selected_date = calculate_past_date("1m")
+                if right1.button("1w", width="stretch", key=f"period_1w_{account_id}"):
+                    selected_date = calculate_past_date("1w")
+                if right2.button("1d", width="stretch", key=f"period_1d_{account_id}"):
+                    selected_date = calculate_past_date("1d")
+
+                if selected_date:
+                    Total_value_in_GBP_selected_date = calculate_portfolio_value_on_date(
+                    target_date=selected_date,
+                    df_trade_history=df_trade_history_ticker_updated,
+                    df_market_historical_data=market_compact,
+                    fx_rates=fx_rates
+                    )
 
+                    diff = Total_market_value_gbp - Total_value_in_GBP_selected_date
+                    st.markdown(f"Total value in GBP on {selected_date.date()}: **£{Total_value_in_GBP_selected_date:,.2f}**, value today: **£{Total_market_value_gbp:,.2f}**")
+                    st.markdown(f"Value difference between {selected_date.date()} and today: **<span style='color:{'green' if diff > 0 else 'red'}'>£{diff:,.2f}</span>**", unsafe_allow_html=True)
+
+            elif f.name.startswith("Transaction") and f.name.endswith(".csv"):
+                # same cached parse as the benchmark block above (keyed by file content)
+                df_transactions = ig_ingest.read_transactions(f.getvalue())
+                df_cashIn = ig_ingest.cash_in(df_transactions)
+                st.metric(label="Total Cash Invested", value=f"£{df_cashIn['PL Amount'].sum():,.2f}")
+                net_cashflow = df_transactions.groupby('Summary', observed=True)['PL Amount'].sum().to_dict()
+                st.write(net_cashflow)
+                fig = ppw.plot_cashflow(net_cashflow)
+                st.plotly_chart(fig, width="stretch")
+
+
+
+
+            # ============ TRADING 212 analyze manually downloaded history file ============
+            elif f.name.startswith("from") and f.name.endswith(".csv"):
+                df_trading212_history = pd.read_csv(f)
+                t212_csv_histories[f.name] = df_trading212_history
+                print(df_trading212_history.head())
+                print(df_trading212_history.tail())
+
+                # ============ TRADING 212 PORTFOLIO POSITIONS & CURRENT VALUE ============
+                st.subheader("Trading 212 Portfolio Positions")
+
+                # Filter to trade actions only (buy/sell)
+                trade_actions = ['Market buy', 'Market sell', 'Limit buy', 'Limit sell']
+                df_t212_trades = df_trading212_history[df_trading212_history['Action'].isin(trade_actions)].copy()
+
+                if not df_t212_trades.empty:
+                    # calculate total invested cash & interest from unfiltered history
+                    total_deposit = df_trading212_history.loc[df_trading212_history['Action'] == 'Deposit', 'Total'].sum()
+                    interest = df_trading212_history.loc[df_trading212_history['Action'] == 'Interest on cash', 'Total'].sum()
+
+                    # Assign signed quantity: buys are positive, sells are negative
+                    df_t212_trades['Signed Shares'] = df_t212_trades['No. of shares']
+                    sell_mask = df_t212_trades['Action'].isin(['Market sell', 'Limit sell'])
+                    df_t212_trades.loc[sell_mask, 'Signed Shares'] = -df_t212_trades.loc[sell_mask, 'No. of shares']
+
+                    # Calculate current positions by grouping on Ticker
+                    df_t212_positions = df_t212_trades.groupby('Ticker').agg({
+                        'Signed Shares': 'sum',
+                        'Name': 'last',
+                        'Total': 'sum',
+                        'Currency (Price / share)': 'last',
+                        'ISIN': 'last'
+                    }).rename(columns={
+                        'Signed Shares': 'Quantity',
+                        'Total': 'Total Cost',
+                        'Currency (Price / share)': 'Currency'
+                    })
 
+                    # Keep only positions with non-zero quantity (still held)
+                    df_t212_positions = df_t212_positions[df_t212_positions['Quantity'].abs() > 1e-9]
+
+                    if not df_t212_positions.empty:
+                        us_tickers = df_t212_positions[df_t212_positions['Currency'] == 'USD'].index.tolist()
+                        uk_tickers = df_t212_positions[df_t212_positions['Currency'] == 'GBX'].index.tolist()
+                        eu_tickers = df_t212_positions[df_t212_positions['Currency'] == 'EUR'].index.tolist()
+
+                        uk_tickers = [ticker+'.L' for ticker in uk_tickers]
+
+                        us_prices = getEODpriceUSA(us_tickers)
+                        uk_prices = getEODpriceUK(uk_tickers)
+                        # eu_prices = getEODpriceEU(eu_tickers)
+
+                        # Fallback: if getEODpriceUSA failed for any US ticker, retry via getEODpriceISIN
+                        failed_us_tickers = [t for t in us_tickers if us_prices.get(t) is None]
+                        if failed_us_tickers:
+                            print(f"getEODpriceUSA failed for {failed_us_tickers}, retrying with getEODpriceISIN...")
+                            failed_isins = df_t212_positions.loc[failed_us_tickers, 'ISIN'].tolist()
+                            fallback_prices = getEODpriceISIN(failed_isins)
+                            # Map ISIN-based prices back to ticker
+                            for ticker in failed_us_tickers:
+                                isin = df_t212_positions.loc[ticker, 'ISIN']
+                                if fallback_prices.get(isin) is not None:
+                                    us_prices[ticker] = fallback_prices[isin]
+
+                        # Merge all prices by ticker (strip .L suffix from uk_prices keys to match index)
+                        uk_prices_remapped = {k.replace('.L', ''): v for k, v in uk_prices.items()}
+                        # all_prices = {**us_prices, **uk_prices_remapped, **eu_prices}
+                        all_prices = {**us_prices, **uk_prices_remapped}
+                        df_t212_positions['Current Price'] = pd.to_numeric(df_t212_positions.index.map(all_prices), errors='coerce')
+                        df_t212_positions['Market Value'] = df_t212_positions['Quantity'] * df_t212_positions['Current Price']
+
+                        # Convert market value to GBP
+                        # Fetch FX rates if not already available
+                        t212_min_date = pd.to_datetime(df_t212_trades['Time']).min().strftime('%Y-%m-%d')
+                        t212_fx = get_historical_fx(t212_min_date)
+                        t212_GBPUSD = t212_fx['GBPUSD=X']
+                        t212_GBPEUR = t212_fx['GBPEUR=X']
+
+
+                        df_t212_positions['Market Value GBP'] = df_t212_positions.apply(lambda r: t212_convert_to_gbp(r, t212_GBPUSD.iloc[-1], t212_GBPEUR.iloc[-1]), axis=1)
+                        df_t212_positions['PandL GBP'] = df_t212_positions['Market Value GBP'] - df_t212_positions['Total Cost']
+
+                        t212_total_market_value_gbp = df_t212_positions['Market Value GBP'].sum()
+                        t212_total_cost = df_t212_positions['Total Cost'].sum()
+                        t212_total_pandl = t212_total_market_value_gbp - t212_total_cost
+
+                        col_val, col_cash = st.columns(2)
+                        col_val.metric(label="Trading 212 Total Portfolio Value", value=f"£{t212_total_market_value_gbp:,.2f}", delta=f"£{t212_total_pandl:,.2f}")
+                        col_cash.metric(label="Of which cash investment (delta interest earned)", value=f"£{total_deposit}", delta=f"£{interest}")
+                        df_t212_display = df_t212_positions[['Name', 'Quantity', 'Current Price', 'Currency', 'Market Value GBP', 'PandL GBP']]
+                        st.dataframe(df_t212_display.style.format({
+                            'Quantity': '{:,.4f}',
+                            'Current Price': '{:,.2f}',
+                            'Market Value GBP': '£{:,.2f}',
+                            'PandL GBP': '£{:,.2f}'
+                        }).map(color_green_red, subset=['PandL GBP']), height=400)
+                    else:
+                        st.info("No open positions found in Trading 212 history.")
+
+                    # ============ TRADING 212 SINGLE INSTRUMENT TRADE HISTORY ============
+                    st.subheader("Trading 212 – Instrument Trade History")
+                    t212_unique = df_t212_trades[['Ticker', 'Name']].drop_duplicates().sort_values('Ticker')
+                    t212_options = [f"{row['Ticker']}  —  {row['Name']}" for _, row in t212_unique.iterrows()]
+                    selected_t212 = st.selectbox("Select an instrument to view trades", options=t212_options, key="t212_instrument_select")
+                    if selected_t212:
+                        selected_t212_ticker = selected_t212.split("  —  ")[0]
+                        df_t212_selected = df_t212_trades[df_t212_trades['Ticker'] == selected_t212_ticker].sort_values('Time', ascending=False)
+                        st.table(df_t212_selected[['Time', 'Action', 'Name', 'Ticker', 'No. of shares', 'Price / share', 'Currency (Price / share)', 'Total']])
+                else:
+                    st.info("No trade actions found in the uploaded Trading 212 file.")
+
+        # ============ ALL IG ACCOUNTS (consolidated) ============
+        if len(ig_accounts) > 1 and not df_account_values.empty:
+            st.header("All IG Accounts")
+            latest = df_account_values.iloc[-1]
+            metric_cols = st.columns(len(ig_accounts) + 1)
+            metric_cols[0].metric("Total", f"£{latest[portfolio_engine.TOTAL_COLUMN]:,.2f}")
+            for col, account_id in zip(metric_cols[1:], ig_accounts):
+                col.metric(account_id, f"£{latest[account_id]:,.2f}")
+            fig_household = household.stage("chart", ppw.accounts_value_over_time, df_account_values)
+            st.plotly_chart(fig_household, width="stretch")
+
+
+
+    # ═══════════════════════════════════════════════════════════════════════
+    # TRADING 212 PORTFOLIO ANALYSIS (API-driven)
+    # ═══════════════════════════════════════════════════════════════════════
+    st.divider()
+    st.header("📊 Trading 212 Portfolio Analysis")
+
+    # ─── API Authentication ───────────────────────────────────────────────
+    # API key is stored in secrets.toml; API secret must be entered manually
+    t212_api_key = st.secrets.get("api_keys", {}).get("trading212", "")
+    if not t212_api_key:
+        st.warning("⚠️ Trading 212 API key not found in `.streamlit/secrets.toml` under `[api_keys]`.")
+
+    t212_api_secret = st.text_input(
+        "🔑 Enter Trading 212 API Secret to start analysis",
+        type="password",
+        help="Your API secret is never stored. It's combined with the API key from secrets.toml to authenticate.",
+        key="t212_api_secret_input"
+    )
 
-# ═══════════════════════════════════════════════════════════════════════
-# TRADING 212 PORTFOLIO ANALYSIS (API-driven)
-# ═══════════════════════════════════════════════════════════════════════
-st.divider()
-st.header("📊 Trading 212 Portfolio Analysis")
 
-# ─── API Authentication ───────────────────────────────────────────────
-# API key is stored in secrets.toml; API secret must be entered manually
-t212_api_key = st.secrets.get("api_keys", {}).get("trading212", "")
-if not t212_api_key:
-    st.warning("⚠️ Trading 212 API key not found in `.streamlit/secrets.toml` under `[api_keys]`.")
 
-t212_api_secret = st.text_input(
-    "🔑 Enter Trading 212 API Secret to start analysis",
-    type="password",
-    help="Your API secret is never stored. It's combined with the API key from secrets.toml to authenticate.",
-    key="t212_api_secret_input"
-)
 
+    if t212_api_secret:
+        try:
+            t212_client = Trading212API(api_key=t212_api_key, api_secret=t212_api_secret)
 
+            # ============ ACCOUNT SUMMARY ============
+            with st.spinner("Fetching account summary..."):
+                try:
+                    account_summary = t212_client.get_account_summary()
+                except Exception as e:
+                    st.error(f"Failed to authenticate with Trading212 API. Please check your API Key and Secret. Error: {e}")
+                    st.stop()
+
+            account_id = account_summary.get("id", "N/A")
+            account_currency = account_summary.get("currency", "GBP")
+            total_value = account_summary.get("totalValue", 0)
+            cash_info = account_summary.get("cash", {})
+            investments_info = account_summary.get("investments", {})
+
+            st.subheader(f"Account Summary (ID: {account_id})")
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Total Account Value", f"£{total_value:,.2f}")
+            col2.metric("Cash Available", f"£{cash_info.get('availableToTrade', 0):,.2f}")
+            col3.metric(
+                "Investments Value",
+                f"£{investments_info.get('currentValue', 0):,.2f}",
+                delta=f"£{investments_info.get('unrealizedProfitLoss', 0):,.2f}"
+            )
 
+            col_cost, col_realised = st.columns(2)
+            col_cost.metric("Total Cost Basis", f"£{investments_info.get('totalCost', 0):,.2f}")
+            col_realised.metric("Realised P&L (All Time)", f"£{investments_info.get('realizedProfitLoss', 0):,.2f}")
 
-if t212_api_secret:
-    try:
-        t212_client = Trading212API(api_key=t212_api_key, api_secret=t212_api_secret)
+            # ============ OPEN POSITIONS (from API - includes live prices) ============
+            with st.spinner("Fetching open positions..."):
+                positions_raw = t212_client.get_open_positions()
 
-        # ============ ACCOUNT SUMMARY ============
-        with st.spinner("Fetching account summary..."):
-            try:
-                account_summary = t212_client.get_account_summary()
-            except Exception as e:
-                st.error(f"Failed to authenticate with Trading212 API. Please check your API Key and Secret. Error: {e}")
-                st.stop()
+            if positions_raw:
+                st.subheader("📈 Current Open Positions")
 
-        account_id = account_summary.get("id", "N/A")
-        account_currency = account_summary.get("currency", "GBP")
-        total_value = account_summary.get("totalValue", 0)
-        cash_info = account_summary.get("cash", {})
-        investments_info = account_summary.get("investments", {})
+                rows = []
+                for pos in positions_raw:
+                    instrument = pos.get("instrument", {})
+                    wallet = pos.get("walletImpact", {})
+                    rows.append({
+                        "Ticker": instrument.get("ticker", ""),
+                        "Name": instrument.get("name", ""),
+                        "ISIN": instrument.get("isin", ""),
+                        "Currency": instrument.get("currency", ""),
+                        "Quantity": pos.get("quantity", 0),
+                        "Avg Price Paid": pos.get("averagePricePaid", 0),
+                        "Current Price": pos.get("currentPrice", 0),
+                        "Total Cost (£)": wallet.get("totalCost", 0),
+                        "Current Value (£)": wallet.get("currentValue", 0),
+                        "Unrealised P&L (£)": wallet.get("unrealizedProfitLoss", 0),
+                        "FX Impact (£)": wallet.get("fxImpact", 0),
+                        "Opened": pos.get("createdAt", ""),
+                    })
 
-        st.subheader(f"Account Summary (ID: {account_id})")
-        col1, col2, col3 = st.columns(3)
-        col1.metric("Total Account Value", f"£{total_value:,.2f}")
-        col2.metric("Cash Available", f"£{cash_info.get('availableToTrade', 0):,.2f}")
-        col3.metric(
-            "Investments Value",
-            f"£{investments_info.get('currentValue', 0):,.2f}",
-            delta=f"£{investments_info.get('unrealizedProfitLoss', 0):,.2f}"
-        )
+                df_t212_positions = pd.DataFrame(rows)
+
+                # Summary metrics
+                t212_total_value = df_t212_positions["Current Value (£)"].sum()
+                t212_total_cost = df_t212_positions["Total Cost (£)"].sum()
+                t212_total_pnl = df_t212_positions["Unrealised P&L (£)"].sum()
+                t212_total_fx = df_t212_positions["FX Impact (£)"].sum()
+
+                col_val, col_pnl, col_fx = st.columns(3)
+                col_val.metric("Positions Total Value", f"£{t212_total_value:,.2f}")
+                col_pnl.metric("Unrealised P&L", f"£{t212_total_pnl:,.2f}",
+                               delta=f"{t212_total_pnl/t212_total_cost*100:.1f}%" if t212_total_cost else "")
+                col_fx.metric("FX Impact", f"£{t212_total_fx:,.2f}")
+
+                # Portfolio weights pie chart
+                st.plotly_chart(
+                    ppw.pie_chart_equity_by_currency(
+                        df_t212_positions[df_t212_positions['Currency'] == 'USD']['Current Value (£)'].sum(),
+                        df_t212_positions[df_t212_positions['Currency'] == 'EUR']['Current Value (£)'].sum(),
+                        df_t212_positions[df_t212_positions['Currency'].isin(['GBP', 'GBX'])]['Current Value (£)'].sum(),
+                        t212_total_value
+                    )
+                )
 
-        col_cost, col_realised = st.columns(2)
-        col_cost.metric("Total Cost Basis", f"£{investments_info.get('totalCost', 0):,.2f}")
-        col_realised.metric("Realised P&L (All Time)", f"£{investments_info.get('realizedProfitLoss', 0):,.2f}")
-
-        # ============ OPEN POSITIONS (from API - includes live prices) ============
-        with st.spinner("Fetching open positions..."):
-            positions_raw = t212_client.get_open_positions()
-
-        if positions_raw:
-            st.subheader("📈 Current Open Positions")
-
-            rows = []
-            for pos in positions_raw:
-                instrument = pos.get("instrument", {})
-                wallet = pos.get("walletImpact", {})
-                rows.append({
-                    "Ticker": instrument.get("ticker", ""),
-                    "Name": instrument.get("name", ""),
-                    "ISIN": instrument.get("isin", ""),
-                    "Currency": instrument.get("currency", ""),
-                    "Quantity": pos.get("quantity", 0),
-                    "Avg Price Paid": pos.get("averagePricePaid", 0),
-                    "Current Price": pos.get("currentPrice", 0),
-                    "Total Cost (£)": wallet.get("totalCost", 0),
-                    "Current Value (£)": wallet.get("currentValue", 0),
-                    "Unrealised P&L (£)": wallet.get("unrealizedProfitLoss", 0),
-                    "FX Impact (£)": wallet.get("fxImpact", 0),
-                    "Opened": pos.get("createdAt", ""),
-                })
-
-            df_t212_positions = pd.DataFrame(rows)
-
-            # Summary metrics
-            t212_total_value = df_t212_positions["Current Value (£)"].sum()
-            t212_total_cost = df_t212_positions["Total Cost (£)"].sum()
-            t212_total_pnl = df_t212_positions["Unrealised P&L (£)"].sum()
-            t212_total_fx = df_t212_positions["FX Impact (£)"].sum()
-
-            col_val, col_pnl, col_fx = st.columns(3)
-            col_val.metric("Positions Total Value", f"£{t212_total_value:,.2f}")
-            col_pnl.metric("Unrealised P&L", f"£{t212_total_pnl:,.2f}",
-                           delta=f"{t212_total_pnl/t212_total_cost*100:.1f}%" if t212_total_cost else "")
-            col_fx.metric("FX Impact", f"£{t212_total_fx:,.2f}")
-
-            # Portfolio weights pie chart
-            st.plotly_chart(
-                ppw.pie_chart_equity_by_currency(
-                    df_t212_positions[df_t212_positions['Currency'] == 'USD']['Current Value (£)'].sum(),
-                    df_t212_positions[df_t212_positions['Currency'] == 'EUR']['Current Value (£)'].sum(),
-                    df_t212_positions[df_t212_positions['Currency'].isin(['GBP', 'GBX'])]['Current Value (£)'].sum(),
-                    t212_total_value
+                # Positions table
+                st.dataframe(
+                    df_t212_positions[['Name', 'Quantity', 'Avg Price Paid', 'Current Price',
+                                       'Currency', 'Current Value (£)', 'Unrealised P&L (£)', 'FX Impact (£)']]
+                    .style.format({
+                        'Quantity': lambda x: f"{x:,.0f}" if x == int(x) else f"{x:,.4f}",
+                        'Avg Price Paid': '{:,.4f}',
+                        'Current Price': '{:,.2f}',
+                        'Current Value (£)': '£{:,.2f}',
+                        'Unrealised P&L (£)': '£{:,.2f}',
+                        'FX Impact (£)': '£{:,.2f}',
+                    }).map(color_green_red, subset=['Unrealised P&L (£)', 'FX Impact (£)']),
                 )
-            )
+            else:
+                st.info("No open positions found.")
 
-            # Positions table
-            st.dataframe(
-                df_t212_positions[['Name', 'Quantity', 'Avg Price Paid', 'Current Price',
-                                   'Currency', 'Current Value (£)', 'Unrealised P&L (£)', 'FX Impact (£)']]
-                .style.format({
-                    'Quantity': lambda x: f"{x:,.0f}" if x == int(x) else f"{x:,.4f}",
-                    'Avg Price Paid': '{:,.4f}',
-                    'Current Price': '{:,.2f}',
-                    'Current Value (£)': '£{:,.2f}',
-                    'Unrealised P&L (£)': '£{:,.2f}',
-                    'FX Impact (£)': '£{:,.2f}',
-                }).map(color_green_red, subset=['Unrealised P&L (£)', 'FX Impact (£)']),
-            )
-        else:
-            st.info("No open positions found.")
+            # ============ HISTORICAL ORDERS (Trade History) ============        
+            st.subheader("🔎 Single Instrument Trade History")
 
-        # ============ HISTORICAL ORDERS (Trade History) ============        
-        st.subheader("🔎 Single Instrument Trade History")
-        
-        with st.spinner("Fetching historical order metadata to build dropdown... (may take a moment initially)"):
-            all_orders = get_cached_t212_all_orders(t212_api_key, t212_api_secret)
-
-        # Build options from all historically traded instruments
-        t212_options = [""]
-        if all_orders:
-            traded_instruments = {}
-            for item in all_orders:
-                order = item.get("order", {})
-                if order.get("status") == "FILLED":
-                    tkr = order.get("ticker", "")
-                    name = order.get("instrument", {}).get("name", "")
-                    if tkr and name:
-                        traded_instruments[tkr] = name
-            
-            # Sort by ticker name
-            sorted_tickers = sorted(traded_instruments.items(), key=lambda x: x[0])
-            t212_options += [f"{tkr}  —  {name}" for tkr, name in sorted_tickers]
-            
-        selected_t212 = st.selectbox("Select an instrument you have traded to view history:", options=t212_options, key="t212_api_instrument_select")
-        manual_ticker = st.text_input("Or enter a Ticker directly (e.g., AAPL_US_EQ):", key="t212_manual_ticker")
-        
-        target_ticker = manual_ticker.strip().upper() if manual_ticker.strip() else (selected_t212.split("  —  ")[0] if selected_t212 else None)
-        
-        if target_ticker:
-            # Efficiently filter from the already-fetched and cached all_orders
-            instrument_orders = [
-                item for item in all_orders 
-                if item.get("order", {}).get("ticker") == target_ticker
-            ]
-            
-            if instrument_orders:
-                order_rows = []
-                for item in instrument_orders:
+            with st.spinner("Fetching historical order metadata to build dropdown... (may take a moment initially)"):
+                all_orders = get_cached_t212_all_orders(t212_api_key, t212_api_secret)
+            t212_api_orders = all_orders
+
+            # Build options from all historically traded instruments
+            t212_options = [""]
+            if all_orders:
+                traded_instruments = {}
+                for item in all_orders:
                     order = item.get("order", {})
-                    if order.get("status") != "FILLED":
-                        continue
-                    fill = item.get("fill", {})
-                    instrument = order.get("instrument", {})
-                    wallet = fill.get("walletImpact", {})
-                    order_rows.append({
-                        "Date": fill.get("filledAt", order.get("createdAt", "")),
-                        "Side": order.get("side", ""),
-                        "Type": order.get("type", ""),
-                        "Ticker": order.get("ticker", ""),
+                    if order.get("status") == "FILLED":
+                        tkr = order.get("ticker", "")
+                        name = order.get("instrument", {}).get("name", "")
+                        if tkr and name:
+                            traded_instruments[tkr] = name
+
+                # Sort by ticker name
+                sorted_tickers = sorted(traded_instruments.items(), key=lambda x: x[0])
+                t212_options += [f"{tkr}  —  {name}" for tkr, name in sorted_tickers]
+
+            selected_t212 = st.selectbox("Select an instrument you have traded to view history:", options=t212_options, key="t212_api_instrument_select")
+            manual_ticker = st.text_input("Or enter a Ticker directly (e.g., AAPL_US_EQ):", key="t212_manual_ticker")
+
+            target_ticker = manual_ticker.strip().upper() if manual_ticker.strip() else (selected_t212.split("  —  ")[0] if selected_t212 else None)
+
+            if target_ticker:
+                # Efficiently filter from the already-fetched and cached all_orders
+                instrument_orders = [
+                    item for item in all_orders 
+                    if item.get("order", {}).get("ticker") == target_ticker
+                ]
+
+                if instrument_orders:
+                    order_rows = []
+                    for item in instrument_orders:
+                        order = item.get("order", {})
+                        if order.get("status") != "FILLED":
+                            continue
+                        fill = item.get("fill", {})
+                        instrument = order.get("instrument", {})
+                        wallet = fill.get("walletImpact", {})
+                        order_rows.append({
+                            "Date": fill.get("filledAt", order.get("createdAt", "")),
+                            "Side": order.get("side", ""),
+                            "Type": order.get("type", ""),
+                            "Ticker": order.get("ticker", ""),
+                            "Name": instrument.get("name", ""),
+                            "Quantity": order.get("filledQuantity", order.get("quantity", 0)),
+                            "Price": fill.get("price", 0),
+                            "Currency": order.get("currency", ""),
+                            "Net Value (£)": wallet.get("netValue", 0),
+                            "Realised P&L (£)": wallet.get("realisedProfitLoss", 0),
+                            "FX Rate": wallet.get("fxRate", 0),
+                            "Status": order.get("status", ""),
+                            "Source": order.get("initiatedFrom", ""),
+                        })
+
+                    df_t212_orders = pd.DataFrame(order_rows)
+                    df_t212_orders["Date"] = pd.to_datetime(df_t212_orders["Date"], errors="coerce")
+                    df_t212_orders.sort_values("Date", ascending=False, inplace=True)
+
+                    st.write(f"Loaded **{len(df_t212_orders)}** historical orders for **{target_ticker}**.")
+                    st.dataframe(
+                        df_t212_orders[['Date', 'Side', 'Type', 'Name', 'Quantity', 'Price', 'Currency', 'Net Value (£)']]
+                        .style.format({
+                            'Quantity': lambda x: f"{x:,.0f}" if x == int(x) else f"{x:,.4f}",
+                            'Price': '{:,.4f}',
+                            'Net Value (£)': '£{:,.2f}',
+                        })
+                    )
+                else:
+                    st.info(f"No historical orders found for {target_ticker}.")
+            else:
+                st.info("Select or enter an instrument to load its trade history.")
+
+            # ============ DIVIDENDS ============
+            st.subheader("💸 Dividends")
+            with st.spinner("Fetching dividends..."):
+                all_dividends = fetch_all_paginated(t212_client.get_dividends, label="dividends", delay=10.0)
+
+            if all_dividends:
+                div_rows = []
+                for div in all_dividends:
+                    instrument = div.get("instrument", {})
+                    div_rows.append({
+                        "Paid On": div.get("paidOn", ""),
+                        "Ticker": div.get("ticker", ""),
                         "Name": instrument.get("name", ""),
-                        "Quantity": order.get("filledQuantity", order.get("quantity", 0)),
-                        "Price": fill.get("price", 0),
-                        "Currency": order.get("currency", ""),
-                        "Net Value (£)": wallet.get("netValue", 0),
-                        "Realised P&L (£)": wallet.get("realisedProfitLoss", 0),
-                        "FX Rate": wallet.get("fxRate", 0),
-                        "Status": order.get("status", ""),
-                        "Source": order.get("initiatedFrom", ""),
+                        "Amount (£)": div.get("amount", 0),
+                        "Quantity": div.get("quantity", 0),
+                        "Gross/Share": div.get("grossAmountPerShare", 0),
+                        "Type": div.get("type", ""),
+                        "Currency": div.get("tickerCurrency", ""),
                     })
 
-                df_t212_orders = pd.DataFrame(order_rows)
-                df_t212_orders["Date"] = pd.to_datetime(df_t212_orders["Date"], errors="coerce")
-                df_t212_orders.sort_values("Date", ascending=False, inplace=True)
+                df_t212_dividends = pd.DataFrame(div_rows)
+                # Use utc=True to handle mixed timezones and then strip timezone info
+                df_t212_dividends["Paid On"] = pd.to_datetime(df_t212_dividends["Paid On"], utc=True, errors="coerce").dt.tz_localize(None)
+                df_t212_dividends.sort_values("Paid On", ascending=False, inplace=True)
+
+                # Filter out interest items to be "dividends only"
+                df_t212_dividends = df_t212_dividends[~df_t212_dividends['Type'].str.contains('INTEREST', case=False, na=False)]
+
+                total_dividends = df_t212_dividends["Amount (£)"].sum()
+                st.metric("Total Dividends Received", f"£{total_dividends:,.2f}")
 
-                st.write(f"Loaded **{len(df_t212_orders)}** historical orders for **{target_ticker}**.")
                 st.dataframe(
-                    df_t212_orders[['Date', 'Side', 'Type', 'Name', 'Quantity', 'Price', 'Currency', 'Net Value (£)']]
-                    .style.format({
-                        'Quantity': lambda x: f"{x:,.0f}" if x == int(x) else f"{x:,.4f}",
-                        'Price': '{:,.4f}',
-                        'Net Value (£)': '£{:,.2f}',
+                    df_t212_dividends.style.format({
+                        'Amount (£)': '£{:,.2f}',
+                        'Quantity': '{:,.4f}',
+                        'Gross/Share': '{:,.6f}',
                     })
                 )
             else:
-                st.info(f"No historical orders found for {target_ticker}.")
-        else:
-            st.info("Select or enter an instrument to load its trade history.")
-
-        # ============ DIVIDENDS ============
-        st.subheader("💸 Dividends")
-        with st.spinner("Fetching dividends..."):
-            all_dividends = fetch_all_paginated(t212_client.get_dividends, label="dividends", delay=10.0)
-
-        if all_dividends:
-            div_rows = []
-            for div in all_dividends:
-                instrument = div.get("instrument", {})
-                div_rows.append({
-                    "Paid On": div.get("paidOn", ""),
-                    "Ticker": div.get("ticker", ""),
-                    "Name": instrument.get("name", ""),
-                    "Amount (£)": div.get("amount", 0),
-                    "Quantity": div.get("quantity", 0),
-                    "Gross/Share": div.get("grossAmountPerShare", 0),
-                    "Type": div.get("type", ""),
-                    "Currency": div.get("tickerCurrency", ""),
-                })
-
-            df_t212_dividends = pd.DataFrame(div_rows)
-            # Use utc=True to handle mixed timezones and then strip timezone info
-            df_t212_dividends["Paid On"] = pd.to_datetime(df_t212_dividends["Paid On"], utc=True, errors="coerce").dt.tz_localize(None)
-            df_t212_dividends.sort_values("Paid On", ascending=False, inplace=True)
-            
-            # Filter out interest items to be "dividends only"
-            df_t212_dividends = df_t212_dividends[~df_t212_dividends['Type'].str.contains('INTEREST', case=False, na=False)]
-
-            total_dividends = df_t212_dividends["Amount (£)"].sum()
-            st.metric("Total Dividends Received", f"£{total_dividends:,.2f}")
-
-            st.dataframe(
-                df_t212_dividends.style.format({
-                    'Amount (£)': '£{:,.2f}',
-                    'Quantity': '{:,.4f}',
-                    'Gross/Share': '{:,.6f}',
-                })
+                st.info("No dividends found.")
+
+            # ============ PORTFOLIO VALUE OVER TIME ============
+            st.subheader("📈 Trading 212 – Portfolio Value Over Time")
+
+            # The logic is to fetch all historical orders, then aggregate them by fills
+            order_aggregates = {}
+            seen_fill_ids = set()  
+
+            if all_orders:
+                for item in all_orders:
+                    order = item.get("order", {})
+                    if order.get("status") != "FILLED":
+                        continue
+                    order_id = order.get("id")
+                    fill = item.get("fill", {})
+
+                    fill_id = fill.get("id")
+                    if fill_id and fill_id in seen_fill_ids:
+                        continue # skip duplicate fills
+                    if fill_id:
+                        seen_fill_ids.add(fill_id)
+
+
+                    instrument = order.get("instrument", {})
+                    side = order.get("side", "")
+                    qty = fill.get("quantity", order.get("filledQuantity", order.get("quantity", 0)))
+
+                    if order_id not in order_aggregates:
+                        order_aggregates[order_id] = {
+                            "Date": pd.to_datetime(fill.get("filledAt", order.get("createdAt", "")), utc=True, errors="coerce"),
+                            "Ticker_T212": order.get("ticker", ""),
+                            "Currency": instrument.get("currency", order.get("currency", "")),
+                            "Quantity": 0,
+                            "Price": fill.get("price", 0),
+                            "Side": side,
+                        }
+                    order_aggregates[order_id]["Quantity"] += qty
+                    if fill.get("price"):
+                        order_aggregates[order_id]["Price"] = fill.get("price", 0)
+
+                trade_rows = []
+                for order_id, data in order_aggregates.items():
+                    signed_qty = data["Quantity"] if data["Side"] == "BUY" else -data["Quantity"] # never sold, so won't know if this is correct
+                    trade_rows.append({
+                        "Date": data["Date"],
+                        "Ticker_T212": data["Ticker_T212"],
+                        "Currency": data["Currency"],
+                        "Signed_Qty": signed_qty,
+                        "Price": data["Price"],
+                        "Side": data['Side'],
+                    })
+                df_all_trades = pd.DataFrame(trade_rows)
+                df_all_trades.sort_values("Date", inplace=True)
+
+                df_all_trades['Date'] = df_all_trades['Date'].dt.normalize() 
+                df_daily_trades = df_all_trades.pivot_table(
+                    index='Date', 
+                    columns='Ticker_T212',
+                    values='Signed_Qty', 
+                    aggfunc='sum'
+                ).fillna(0)
+
+                df_fill_positions = df_daily_trades.cumsum()
+                # st.table(df_fill_positions.tail(5))
+                if company_name_to_ticker: # TODO: if company_name_to_ticker contains all the mapping from Ticker_T212 to Yahoo_Ticker
+                    df_positions_yahoo = df_fill_positions.rename(columns=company_name_to_ticker)
+                else:
+                    print("company_name_to_ticker is empty, cannot rename columns, portfolio value over time will fail")
+
+
+
+                # ── Missing T212 Symbols Check ──
+                missing_t212 = [t for t in df_all_trades['Ticker_T212'].unique() if t not in company_name_to_ticker]
+                if missing_t212:
+                    st.warning("⚠️ Some Trading 212 tickers need to be mapped to Yahoo Finance tickers before proceeding.")
+
+                    # Pre-populate with the same ticker as a default suggestion
+                    resolved_t212 = {t: t for t in missing_t212}
+
+                    st.subheader("Review and edit T212 mappings:")
+                    edited_t212 = {}
+                    for market_name, ticker in resolved_t212.items():
+                        col1, col2, col3 = st.columns([2, 2, 1])
+                        col1.write(f"**{market_name}**")
+                        edited_ticker = col2.text_input(
+                            label="Ticker",
+                            value=ticker,
+                            key=f"t212_ticker_{market_name}",
+                            label_visibility="collapsed"
+                        )
+                        edited_t212[market_name] = edited_ticker
+                        if col3.checkbox("✓ Include", key=f"t212_include_{market_name}", value=True):
+                            pass
+
+                    col_save, col_cancel = st.columns(2)
+                    if col_save.button("✅ Save to company_name_to_ticker.json", key="t212_save"):
+                        confirmed_mappings = {
+                            k: v for k, v in edited_t212.items() 
+                            if v.strip() and st.session_state.get(f"t212_include_{k}", False)
+                        }
+                        if confirmed_mappings:
+                            ticker_store.update(confirmed_mappings)
+                            st.success(f"✅ Saved {len(confirmed_mappings)} new mappings!")
+                            st.rerun()
+                        else:
+                            st.error("No valid mappings to save.")
+
+                    if col_cancel.button("❌ Cancel", key="t212_cancel"):
+                        st.info("Cancelled. No changes made.")
+
+                    st.stop()  # Halt execution until mappings are resolved
+
+                # ── Yahoo finance all historical data for instruments ──
+                df_all_trades['Yahoo_Ticker'] = df_all_trades['Ticker_T212'].map(company_name_to_ticker)
+
+                all_prices = []
+
+                for ticker in df_all_trades['Yahoo_Ticker'].dropna().unique():
+                    df1tickrt = df_all_trades[df_all_trades['Yahoo_Ticker']== ticker]
+                    startDate = min(df1tickrt['Date']).date()
+                    new_data = OHLC_YahooFinance(ticker, start_date=startDate.strftime("%Y-%m-%d")).yahooDataV8()
+                    new_data['ticker'] = ticker
+                    all_prices.append(new_data)
+
+                price_data = pd.concat(all_prices, ignore_index=True) # Combine everything at once
+                price_data = price_data[['ticker', 'Date', 'close']]
+                price_data['Date'] = pd.to_datetime(price_data['Date'])
+                price_data['Currency'] = price_data['ticker'].map(lambda x: df_all_trades[df_all_trades['Yahoo_Ticker'] == x]['Currency'].iloc[0])
+
+                # get FX rate by checking if GBPUSD and GBPEUR variables already ready and waiting
+                if 'GBPUSD' not in locals() or min(GBPUSD.index) <= price_data[price_data['Currency'] == 'USD']['Date'].min(): # TO_TEST, and GBPUSD only for now
+                    GBPUSD = get_historical_fx(price_data[price_data['Currency'] == 'USD']['Date'].min().strftime("%Y-%m-%d"))['GBPUSD=X']
+
+                price_data['GBP_Close'] = price_data.apply(lambda row: row['close'] / GBPUSD.asof(row['Date']) if row['Currency'] == 'USD' else row['close']/100 if row['Currency'] == 'GBX' else row['close'], axis=1)
+
+                # ====== Pivot price_data to wide format matching df_positions (Date × Yahoo_Ticker) ======
+                price_wide = price_data.pivot_table(index='Date', columns='ticker', values='GBP_Close')
+
+                # Align price_data dates to timezone-aware to match df_positions index
+                price_wide.index = price_wide.index.tz_localize('UTC')
+
+                # Reindex price_wide to match df_positions dates, forward-fill prices for weekends/holidays
+                price_wide = price_wide.reindex(df_positions_yahoo.index).ffill()
+
+                # Only use columns present in both DataFrames
+                common_tickers = df_positions_yahoo.columns.intersection(price_wide.columns)
+                # print(f"Common tickers: {common_tickers.tolist()}")
+                # print(f"Positions-only: {df_positions_yahoo.columns.difference(price_wide.columns).tolist()}")
+                # print(f"Prices-only: {price_wide.columns.difference(df_positions_yahoo.columns).tolist()}")
+                # Element-wise: quantity × unit price (GBP)
+                market_values = df_positions_yahoo[common_tickers] * price_wide[common_tickers]
+                # Sum across instruments for total portfolio value per day
+                market_values['total_value'] = market_values.sum(axis=1)
+
+                # === plot the total portfolio value over time ===
+                fig_t212 = ppw.t212_portfolio_value_over_time(df_all_trades, market_values)
+                st.plotly_chart(fig_t212)
+
+
+        except Exception as e:
+            st.error(f"❌ Trading 212 API Error: {e}"); import traceback; traceback.print_exc()
+            st.info("Please check your API key and secret are correct.")
+
+    # ═══════════════════════════════════════════════════════════════════════
+    # COMBINED PORTFOLIO (IG + Trading 212 + manual, from the unified ledger)
+    # ═══════════════════════════════════════════════════════════════════════
+    st.divider()
+    st.header("🧾 Combined Portfolio (all brokers)")
+    owner = (user or {}).get("email")
+    combined = SessionDAG(st.session_state, "combined")
+
+    with st.expander("➕ Add a manual trade"):
+        with st.form("manual_trade", clear_on_submit=True):
+            col_date, col_ticker, col_qty, col_price, col_ccy = st.columns(5)
+            manual_date = col_date.date_input("Date")
+            manual_ticker = col_ticker.text_input("Yahoo ticker", placeholder="e.g. AAPL or VOD.L")
+            manual_qty = col_qty.number_input("Quantity (negative to sell)", value=0.0, format="%.4f")
+            manual_price = col_price.number_input("Price", min_value=0.0, format="%.4f")
+            manual_ccy = col_ccy.selectbox("Currency", ["USD", "GBX", "EUR"])
+            if st.form_submit_button("Add to ledger") and manual_ticker.strip() and manual_qty:
+                ledger.get_ledger_store(owner).upsert(ledger.from_manual(pd.DataFrame([{
+                    'Date': manual_date, 'Ticker': manual_ticker.strip().upper(), 'Quantity': manual_qty,
+                    'Price': manual_price, 'Currency': manual_ccy,
+                }])))
+                combined.invalidate("ledger")
+                st.rerun()
+
+    sources = combined.stage("sources", ledger_sources, ig_accounts, t212_csv_histories, t212_api_orders, company_name_to_ticker)
+    df_ledger = combined.stage("ledger", sync_ledger, owner, sources)
+    df_dropped = sources['dropped']
+    if not df_dropped.empty:
+        st.warning(f"⚠️ {len(df_dropped)} trade(s) are left out of the combined portfolio: "
+                   "their date could not be read or their company name has no ticker yet.")
+        with st.expander("Trades left out"):
+            st.dataframe(df_dropped[['Source', 'Account', 'Date', 'Name', 'Quantity', 'Price', 'Currency', 'Reason']])
+    if df_ledger.empty:
+        st.info("Upload IG / Trading 212 files, connect the Trading 212 API or add a manual trade to build the combined ledger.")
+    else:
+        ledger_accounts = combined.stage("accounts", ledger.ledger_accounts, df_ledger)
+        fx_combined = combined.stage("fx", get_historical_fx, df_ledger['Date'].min().strftime('%Y-%m-%d'))
+        fx_rates_combined = {'GBPUSD': fx_combined['GBPUSD=X'], 'GBPEUR': fx_combined['GBPEUR=X']}
+        market_combined = combined.stage("market_data", market_data_for_accounts, ledger_accounts)
+        df_combined_values = combined.stage(
+            "values", ledger.combined_value_series, df_ledger, market_combined, fx_rates_combined
+        )
+
+        if not df_combined_values.empty:
+            st.metric("Combined value", f"£{df_combined_values[portfolio_engine.TOTAL_COLUMN].iloc[-1]:,.2f}")
+            fig_combined = combined.stage(
+                "chart", ppw.accounts_value_over_time, df_combined_values,
+                title='Portfolio Value Over Time (All Brokers)'
             )
-        else:
-            st.info("No dividends found.")
-
-        # ============ PORTFOLIO VALUE OVER TIME ============
-        st.subheader("📈 Trading 212 – Portfolio Value Over Time")
-
-        # The logic is to fetch all historical orders, then aggregate them by fills
-        order_aggregates = {}
-        seen_fill_ids = set()  
-
-        if all_orders:
-            for item in all_orders:
-                order = item.get("order", {})
-                if order.get("status") != "FILLED":
-                    continue
-                order_id = order.get("id")
-                fill = item.get("fill", {})
-
-                fill_id = fill.get("id")
-                if fill_id and fill_id in seen_fill_ids:
-                    continue # skip duplicate fills
-                if fill_id:
-                    seen_fill_ids.add(fill_id)
-
-
-                instrument = order.get("instrument", {})
-                side = order.get("side", "")
-                qty = fill.get("quantity", order.get("filledQuantity", order.get("quantity", 0)))
-                
-                if order_id not in order_aggregates:
-                    order_aggregates[order_id] = {
-                        "Date": pd.to_datetime(fill.get("filledAt", order.get("createdAt", "")), utc=True, errors="coerce"),
-                        "Ticker_T212": order.get("ticker", ""),
-                        "Currency": instrument.get("currency", order.get("currency", "")),
-                        "Quantity": 0,
-                        "Price": fill.get("price", 0),
-                        "Side": side,
-                    }
-                order_aggregates[order_id]["Quantity"] += qty
-                if fill.get("price"):
-                    order_aggregates[order_id]["Price"] = fill.get("price", 0)
-
-            trade_rows = []
-            for order_id, data in order_aggregates.items():
-                signed_qty = data["Quantity"] if data["Side"] == "BUY" else -data["Quantity"] # never sold, so won't know if this is correct
-                trade_rows.append({
-                    "Date": data["Date"],
-                    "Ticker_T212": data["Ticker_T212"],
-                    "Currency": data["Currency"],
-                    "Signed_Qty": signed_qty,
-                    "Price": data["Price"],
-                    "Side": data['Side'],
-                })
-            df_all_trades = pd.DataFrame(trade_rows)
-            df_all_trades.sort_values("Date", inplace=True)
-
-            df_all_trades['Date'] = df_all_trades['Date'].dt.normalize() 
-            df_daily_trades = df_all_trades.pivot_table(
-                index='Date', 
-                columns='Ticker_T212',
-                values='Signed_Qty', 
-                aggfunc='sum'
-            ).fillna(0)
-
-            df_fill_positions = df_daily_trades.cumsum()
-            # st.table(df_fill_positions.tail(5))
-            if company_name_to_ticker: # TODO: if company_name_to_ticker contains all the mapping from Ticker_T212 to Yahoo_Ticker
-                df_positions_yahoo = df_fill_positions.rename(columns=company_name_to_ticker)
-            else:
-                print("company_name_to_ticker is empty, cannot rename columns, portfolio value over time will fail")
-
-
-
-            # ── Missing T212 Symbols Check ──
-            missing_t212 = [t for t in df_all_trades['Ticker_T212'].unique() if t not in company_name_to_ticker]
-            if missing_t212:
-                st.warning("⚠️ Some Trading 212 tickers need to be mapped to Yahoo Finance tickers before proceeding.")
-                
-                # Pre-populate with the same ticker as a default suggestion
-                resolved_t212 = {t: t for t in missing_t212}
-                
-                st.subheader("Review and edit T212 mappings:")
-                edited_t212 = {}
-                for market_name, ticker in resolved_t212.items():
-                    col1, col2, col3 = st.columns([2, 2, 1])
-                    col1.write(f"**{market_name}**")
-                    edited_ticker = col2.text_input(
-                        label="Ticker",
-                        value=ticker,
-                        key=f"t212_ticker_{market_name}",
-                        label_visibility="collapsed"
-                    )
-                    edited_t212[market_name] = edited_ticker
-                    if col3.checkbox("✓ Include", key=f"t212_include_{market_name}", value=True):
-                        pass
-
-                col_save, col_cancel = st.columns(2)
-                if col_save.button("✅ Save to company_name_to_ticker.json", key="t212_save"):
-                    confirmed_mappings = {
-                        k: v for k, v in edited_t212.items() 
-                        if v.strip() and st.session_state.get(f"t212_include_{k}", False)
-                    }
-                    if confirmed_mappings:
-                        company_name_to_ticker.update(confirmed_mappings)
-                        pwd = os.path.dirname(os.path.realpath(__file__))
-                        reference_data_json_file = pwd + '/company_name_to_ticker.json'
-                        with open(reference_data_json_file, 'w') as json_file:
-                            json.dump(company_name_to_ticker, json_file, indent=2)
-                        st.success(f"✅ Saved {len(confirmed_mappings)} new mappings!")
-                        st.rerun()
-                    else:
-                        st.error("No valid mappings to save.")
-                
-                if col_cancel.button("❌ Cancel", key="t212_cancel"):
-                    st.info("Cancelled. No changes made.")
-                
-                st.stop()  # Halt execution until mappings are resolved
-
-            # ── Yahoo finance all historical data for instruments ──
-            df_all_trades['Yahoo_Ticker'] = df_all_trades['Ticker_T212'].map(company_name_to_ticker)
-            
-            all_prices = []
-
-            for ticker in df_all_trades['Yahoo_Ticker'].dropna().unique():
-                df1tickrt = df_all_trades[df_all_trades['Yahoo_Ticker']== ticker]
-                startDate = min(df1tickrt['Date']).date()
-                new_data = OHLC_YahooFinance(ticker, start_date=startDate.strftime("%Y-%m-%d")).yahooDataV8()
-                new_data['ticker'] = ticker
-                all_prices.append(new_data)
-
-            price_data = pd.concat(all_prices, ignore_index=True) # Combine everything at once
-            price_data = price_data[['ticker', 'Date', 'close']]
-            price_data['Date'] = pd.to_datetime(price_data['Date'])
-            price_data['Currency'] = price_data['ticker'].map(lambda x: df_all_trades[df_all_trades['Yahoo_Ticker'] == x]['Currency'].iloc[0])
-
-            # get FX rate by checking if GBPUSD and GBPEUR variables already ready and waiting
-            if 'GBPUSD' not in locals() or min(GBPUSD.index) <= price_data[price_data['Currency'] == 'USD']['Date'].min(): # TO_TEST, and GBPUSD only for now
-                GBPUSD = get_historical_fx(price_data[price_data['Currency'] == 'USD']['Date'].min().strftime("%Y-%m-%d"))['GBPUSD=X']
-            
-            price_data['GBP_Close'] = price_data.apply(lambda row: row['close'] / GBPUSD.asof(row['Date']) if row['Currency'] == 'USD' else row['close']/100 if row['Currency'] == 'GBX' else row['close'], axis=1)
-            
-            # ====== Pivot price_data to wide format matching df_positions (Date × Yahoo_Ticker) ======
-            price_wide = price_data.pivot_table(index='Date', columns='ticker', values='GBP_Close')
-
-            # Align price_data dates to timezone-aware to match df_positions index
-            price_wide.index = price_wide.index.tz_localize('UTC')
-
-            # Reindex price_wide to match df_positions dates, forward-fill prices for weekends/holidays
-            price_wide = price_wide.reindex(df_positions_yahoo.index).ffill()
-
-            # Only use columns present in both DataFrames
-            common_tickers = df_positions_yahoo.columns.intersection(price_wide.columns)
-            # print(f"Common tickers: {common_tickers.tolist()}")
-            # print(f"Positions-only: {df_positions_yahoo.columns.difference(price_wide.columns).tolist()}")
-            # print(f"Prices-only: {price_wide.columns.difference(df_positions_yahoo.columns).tolist()}")
-            # Element-wise: quantity × unit price (GBP)
-            market_values = df_positions_yahoo[common_tickers] * price_wide[common_tickers]
-            # Sum across instruments for total portfolio value per day
-            market_values['total_value'] = market_values.sum(axis=1)
-            
-            # === plot the total portfolio value over time ===
-            fig_t212 = ppw.t212_portfolio_value_over_time(df_all_trades, market_values)
-            st.plotly_chart(fig_t212)
+            st.plotly_chart(fig_combined, width="stretch")
+        st.dataframe(
+            combined.stage("positions", ledger.combined_positions, df_ledger).style.format({
+                'Quantity': '{:,.4f}',
+                'Cost GBP': '£{:,.2f}',
+            })
+        )
 
 
-    except Exception as e:
-        st.error(f"❌ Trading 212 API Error: {e}"); import traceback; traceback.print_exc()
-        st.info("Please check your API key and secret are correct.")
\ No newline at end of file
+if __name__ == "__main__":
+    # `streamlit run rewrite_tab_1.py` renders the dashboard without the login page
+    render()
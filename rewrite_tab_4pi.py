@@ -13,6 +13,7 @@ import glob, socket, platform
 
 from trading212.t212dec import lss
 from trading212_api import Trading212API
+from reference_data import get_ticker_store
 
 
 
@@ -396,10 +397,8 @@ if files_to_process:
             df_trade_history['Date'] = pd.to_datetime(df_trade_history['TextDate'], errors='coerce', dayfirst=True)
             
             # add ticker to trade history table
-            pwd = os.path.dirname(os.path.realpath(__file__))
-            reference_data_json_file = pwd + '/company_name_to_ticker.json'
-            with open(reference_data_json_file, 'r') as json_file: # TODO: move this to a database instead
-                company_name_to_ticker = json.load(json_file)
+            ticker_store = get_ticker_store()
+            company_name_to_ticker = ticker_store.mapping
             df_trade_history['Ticker'] = df_trade_history['Market'].map(company_name_to_ticker)
             
             ## find missing symbols
@@ -448,9 +447,7 @@ if files_to_process:
                     }
                     
                     if confirmed_mappings:
-                        company_name_to_ticker.update(confirmed_mappings)
-                        with open(reference_data_json_file, 'w') as json_file:
-                            json.dump(company_name_to_ticker, json_file, indent=2)
+                        ticker_store.update(confirmed_mappings)
                         st.success(f"✅ Saved {len(confirmed_mappings)} new mappings!")
                         st.rerun()
                         # check if trade history dataframe has no missing tickers now
@@ -521,14 +518,7 @@ if files_to_process:
                 key="select_company_ticker"
             )
 
-            if selected_company in company_name_to_ticker.values():
-                selected_ticker = selected_company
-            else:
-                selected_ticker = company_name_to_ticker[selected_company]
-                # check if the ticker itself is a key in the map (chained mapping)
-                if selected_ticker in company_name_to_ticker:
-                     selected_ticker = company_name_to_ticker[selected_ticker]
-                print(selected_ticker)
+            selected_ticker = ticker_store.resolve(selected_company)
     
             if selected_company:
                 df_ticker_trade_history = df_trade_history_ticker_updated[
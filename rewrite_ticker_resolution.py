@@ -1,37 +1,177 @@
+import json
+import os
+import re
+from collections import defaultdict
+
 import requests
 
+SEC_TICKERS_URL = "https://www.sec.gov/files/company_tickers.json"
+SEC_CACHE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), ".cache")
+
+# Legal-form / venue words that say nothing about which company it is:
+# "Apple Inc." and "Apple Incorporated" must score as the same name.
+_STOP_WORDS = {
+    "the", "and", "of", "inc", "incorporated", "corp", "corporation", "co", "company",
+    "ltd", "limited", "plc", "llc", "lp", "sa", "ag", "nv", "se", "holdings", "holding",
+    "group", "class", "cl", "com", "new", "all", "sessions", "us", "adr", "ads",
+}
+_NON_WORD = re.compile(r"[^a-z0-9 ]+")
+_BRACKETS = re.compile(r"\(.*?\)")
+
+
+def normalise_company_name(name: str) -> list[str]:
+    """Split a company / IG market name into identity-bearing tokens.
+
+    IG decorates names with venue suffixes, e.g. "Barrick Gold Corp - US (All Sessions)",
+    so anything in brackets or after " - " is dropped before tokenising.
+    """
+    name = _BRACKETS.sub(" ", str(name)).split(" - ")[0].lower().replace("&", " and ")
+    tokens = _NON_WORD.sub(" ", name.replace(".", "")).split()
+    return [t for t in tokens if t not in _STOP_WORDS] or tokens
+
+
+def _trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SecTickerResolver:
+    """Resolve company names to US tickers using the SEC company_tickers.json file.
+
+    The SEC file (~10k companies) is cached on disk and revalidated with its ETag, so
+    a warm start costs a single 304 round trip. An inverted token index narrows each
+    query to the handful of titles sharing a word with it, and those candidates are
+    ranked by token-set overlap plus character trigram similarity.
+
+    eg. SecTickerResolver().resolve(["Apple Incorporated"])
+        -> {'Apple Incorporated': [('AAPL', 'Apple Inc.', 1.0), ...]}
+    """
+
+    def __init__(self, cache_dir: str = SEC_CACHE_DIR, session: requests.Session = None):
+        self.cache_dir = cache_dir
+        self.session = session or requests.Session()
+        self.session.headers.update({
+            "User-Agent": "MyApp/1.0 (contact: you@example.com) Mozilla/5.0 (Macintosh)",
+            "Accept": "application/json, text/javascript, */*; q=0.01",
+            "Referer": "https://www.sec.gov/",
+            "Accept-Language": "en-US,en;q=0.9",
+        })
+        self._entries = []  # list of (ticker, title, token set, trigram set)
+        self._token_index = defaultdict(set)  # token -> entry positions
+
+    @property
+    def _data_path(self) -> str:
+        return os.path.join(self.cache_dir, "sec_company_tickers.json")
+
+    @property
+    def _etag_path(self) -> str:
+        return os.path.join(self.cache_dir, "sec_company_tickers.etag")
+
+    def _load_sec_file(self) -> dict:
+        """Return the SEC payload, downloading it only when the cached ETag is stale."""
+        cached = os.path.exists(self._data_path)
+        headers = {}
+        if cached and os.path.exists(self._etag_path):
+            with open(self._etag_path, "r") as f:
+                headers["If-None-Match"] = f.read().strip()
+
+        try:
+            resp = self.session.get(SEC_TICKERS_URL, headers=headers, timeout=10, allow_redirects=True)
+            if resp.status_code == 304 and cached:
+                print("SEC company tickers unchanged, using disk cache")
+            else:
+                resp.raise_for_status()
+                os.makedirs(self.cache_dir, exist_ok=True)
+                tmp_path = self._data_path + ".tmp"
+                with open(tmp_path, "w") as f:
+                    f.write(resp.text)
+                os.replace(tmp_path, self._data_path)
+                if resp.headers.get("ETag"):
+                    with open(self._etag_path, "w") as f:
+                        f.write(resp.headers["ETag"])
+                return resp.json()
+        except requests.RequestException as e:
+            if not cached:
+                raise
+            print(f"SEC revalidation failed ({e}), using disk cache")
+
+        with open(self._data_path, "r") as f:
+            return json.load(f)
+
+    def load(self) -> "SecTickerResolver":
+        """Fetch (or revalidate) the SEC file and build the inverted token index."""
+        sec_raw_dict = self._load_sec_file()
+        # sec_raw_dict looks like this (roughly ordered by market cap):
+        #     {'0': {'cik_str': 1045810, 'ticker': 'NVDA', 'title': 'NVIDIA CORP'},
+        #   '1': {'cik_str': 320193, 'ticker': 'AAPL', 'title': 'Apple Inc.'},
+        self._entries = []
+        self._token_index = defaultdict(set)
+        for item in sec_raw_dict.values():
+            tokens = normalise_company_name(item["title"])
+            pos = len(self._entries)
+            self._entries.append((item["ticker"], item["title"], set(tokens), _trigrams(" ".join(tokens))))
+            for token in tokens:
+                self._token_index[token].add(pos)
+        return self
+
+    def candidates(self, name: str, limit: int = 5) -> list[tuple[str, str, float]]:
+        """Return up to `limit` (ticker, title, score) tuples ranked best first, score in [0, 1]."""
+        if not self._entries:
+            self.load()
+        tokens = normalise_company_name(name)
+        if not tokens:
+            return []
+        query_tokens = set(tokens)
+        query_trigrams = _trigrams(" ".join(tokens))
+
+        positions = set()
+        for token in query_tokens:
+            positions |= self._token_index.get(token, set())
+
+        scored = []
+        for pos in positions:
+            ticker, title, title_tokens, title_trigrams = self._entries[pos]
+            token_score = 2 * len(query_tokens & title_tokens) / (len(query_tokens) + len(title_tokens))
+            trigram_score = len(query_trigrams & title_trigrams) / len(query_trigrams | title_trigrams)
+            score = 0.6 * token_score + 0.4 * trigram_score
+            # SEC order is a good popularity prior, so ties go to the earlier entry
+            scored.append((-round(score, 4), pos, ticker, title))
+
+        scored.sort()
+        return [(ticker, title, -neg_score) for neg_score, _, ticker, title in scored[:limit]]
+
+    def resolve(self, names: list[str], limit: int = 5) -> dict:
+        """Return ranked candidates for each name: {name: [(ticker, title, score), ...]}."""
+        return {name: self.candidates(name, limit) for name in names}
+
+    def best_matches(self, names: list[str], min_score: float = 0.5) -> dict:
+        """Return {name: ticker}, with None where no candidate reaches `min_score`."""
+        best = {}
+        for name, ranked in self.resolve(names, limit=1).items():
+            best[name] = ranked[0][0] if ranked and ranked[0][2] >= min_score else None
+        return best
+
+
+_resolver = None
+
+
+def get_sec_resolver() -> SecTickerResolver:
+    """Process-wide resolver, so the SEC file is loaded and indexed once per process."""
+    global _resolver
+    if _resolver is None:
+        _resolver = SecTickerResolver().load()
+    return _resolver
+
+
 def use_sec_site(missing_symobols: list[str]) -> dict:
-    url = "https://www.sec.gov/files/company_tickers.json"
-    session = requests.Session()
-    session.headers.update({
-        "User-Agent": "MyApp/1.0 (contact: you@example.com) Mozilla/5.0 (Macintosh)",
-        "Accept": "application/json, text/javascript, */*; q=0.01",
-        "Referer": "https://www.sec.gov/",
-        "Accept-Language": "en-US,en;q=0.9",
-    })
-
-    # retries = Retry(total=3, backoff_factor=0.5, status_forcelist=[429,500,502,503,504])
-    # session.mount("https://", HTTPAdapter(max_retries=retries))
-
-    resp = session.get(url, timeout=10, allow_redirects=True)
-    print(resp.status_code)
-    resp.raise_for_status()
-    sec_raw_dict = resp.json()
-    # sec_raw_dict looks like this:
-    #     {'0': {'cik_str': 1045810, 'ticker': 'NVDA', 'title': 'NVIDIA CORP'},
-    #   '1': {'cik_str': 320193, 'ticker': 'AAPL', 'title': 'Apple Inc.'},
-    #   '2': {'cik_str': 1652044, 'ticker': 'GOOGL', 'title': 'Alphabet Inc.'},
-    sec_symbols = {item['ticker']: item['title'] for item in sec_raw_dict.values()}
-
-    potential_match = {}
-    for i in missing_symobols:
-        first_word_from_missing_symbol = i.split(" ")[0]
-        # search all sec_symbols values that contain i
-        matches = {k: v for k, v in sec_symbols.items() if first_word_from_missing_symbol.lower() in v.lower()}
-        potential_match[i] = next(iter(matches), None) # first (key, value) pair
-    return potential_match
+    """Best SEC ticker for each IG market name, None when nothing scores well enough.
+
+    The result is reviewed in the dashboard before being saved to company_name_to_ticker.json.
+    """
+    return get_sec_resolver().best_matches(missing_symobols)
+
 
 if __name__ == "__main__":
     missing_symbols = ["Apple Incorporated", "Alphabet Company", "Microsoft Corp", "Tesla Motors", "RTX Corporation (All Sessions)", "Barrick Gold Corp - US (All Sessions)" ]
-    result = use_sec_site(missing_symbols)
-    print(result)
\ No newline at end of file
+    for name, ranked in get_sec_resolver().resolve(missing_symbols, limit=3).items():
+        print(name, "->", ranked)
@@ -0,0 +1,111 @@
+import hashlib
+import pickle
+from typing import Any, Callable, MutableMapping
+
+import numpy as np
+import pandas as pd
+
+
+class SessionDAG:
+    """Memoised pipeline stages kept in a session-state mapping (eg. st.session_state).
+
+    Each stage stores (input key, output). On a rerun a stage only recomputes when the
+    key of its inputs changed; otherwise the stored output object is returned as is, so
+    a widget that only feeds the last stage leaves every upstream stage untouched.
+
+    Inputs that are themselves the output of an earlier stage, of this or any other
+    SessionDAG in the same state (eg. per-account DAGs feeding a household one), are keyed
+    by that stage's key instead of being re-hashed, so chaining stages costs nothing per rerun.
+
+    eg. dag = SessionDAG(st.session_state, "ig_QX2B3")
+        df = dag.stage("parse", parse_csv, uploaded.getvalue())
+        positions = dag.stage("positions", current_positions, df)
+        fig = dag.stage("chart", plot, positions, selected_ticker)  # only this reruns on selectbox change
+
+    Stage outputs are shared between reruns: treat them as read-only.
+    """
+
+    PREFIX = "_session_dag_"
+
+    def __init__(self, state: MutableMapping, namespace: str):
+        self._state = state
+        self._stages = state.setdefault(f"{self.PREFIX}{namespace}", {})
+        self.recomputed = []  # stage names recomputed during this rerun, for debugging
+
+    def _all_stages(self):
+        """Stored (key, output) pairs of every SessionDAG namespace in the state, this one first."""
+        yield from self._stages.values()
+        for name in list(self._state.keys()):
+            stages = self._state[name]
+            if isinstance(name, str) and name.startswith(self.PREFIX) and stages is not self._stages:
+                yield from stages.values()
+
+    def _key_of(self, value: Any) -> str:
+        for key, output in self._all_stages():
+            if output is value:
+                return key
+        # containers of stage outputs, eg. {account_id: df}, are keyed item by item
+        if isinstance(value, dict):
+            return fingerprint({k: self._key_of(v) for k, v in value.items()})
+        if isinstance(value, (list, tuple)):
+            return fingerprint([self._key_of(v) for v in value])
+        return fingerprint(value)
+
+    def stage(self, name: str, fn: Callable, *inputs, **kw_inputs):
+        """Return fn(*inputs, **kw_inputs), recomputing only if the inputs changed since last run."""
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(getattr(fn, "__qualname__", repr(fn)).encode())
+        for value in inputs:
+            digest.update(self._key_of(value).encode())
+        for k in sorted(kw_inputs):
+            digest.update(k.encode())
+            digest.update(self._key_of(kw_inputs[k]).encode())
+        key = digest.hexdigest()
+
+        cached = self._stages.get(name)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        output = fn(*inputs, **kw_inputs)
+        self._stages[name] = (key, output)
+        self.recomputed.append(name)
+        return output
+
+    def invalidate(self, *names: str):
+        """Drop stored outputs (all stages if no names given)."""
+        for name in names or list(self._stages):
+            self._stages.pop(name, None)
+
+
+def fingerprint(value: Any) -> str:
+    """Content hash of DataFrames, Series, arrays, bytes and (nested) builtin containers."""
+    digest = hashlib.blake2b(digest_size=16)
+    _update(digest, value)
+    return digest.hexdigest()
+
+
+def _update(digest, value):
+    digest.update(type(value).__name__.encode())
+    if isinstance(value, pd.DataFrame):
+        digest.update(repr(list(value.columns)).encode())
+        digest.update(repr(list(value.dtypes.astype(str))).encode())
+        digest.update(pd.util.hash_pandas_object(value, index=True).values.tobytes())
+    elif isinstance(value, (pd.Series, pd.Index)):
+        digest.update(str(value.dtype).encode())
+        digest.update(pd.util.hash_pandas_object(value).values.tobytes())
+    elif isinstance(value, np.ndarray):
+        digest.update(str(value.dtype).encode())
+        digest.update(np.ascontiguousarray(value).tobytes())
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        digest.update(value)
+    elif isinstance(value, dict):
+        for k in sorted(value, key=repr):
+            _update(digest, k)
+            _update(digest, value[k])
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = sorted(value, key=repr) if isinstance(value, (set, frozenset)) else value
+        for item in items:
+            _update(digest, item)
+    elif value is None or isinstance(value, (str, int, float, bool, np.generic, pd.Timestamp)):
+        digest.update(repr(value).encode())
+    else:
+        digest.update(pickle.dumps(value))
@@ -0,0 +1,240 @@
+"""
+Cold-start instrumentation and lazy imports for the Streamlit container.
+
+Set STARTUP_PROFILE=1 to record, once per process:
+  - per-module import time (self and cumulative) of everything imported by the app script
+  - time from process start to the first completed page render ("first paint")
+Each process keeps one JSON line in STARTUP_PROFILE_FILE (default startup_metrics.jsonl),
+rewritten on every mark so later marks (eg. dashboard_rendered) are kept too, and
+cold-start latency can be compared across deployments.
+
+Regression check (run in CI or before a deploy):
+    python startup_profile.py --budget-ms 1500
+imports the login-critical modules in a fresh interpreter and exits non-zero when the
+import time exceeds the budget.
+"""
+
+import importlib
+import importlib.abc
+import importlib.util
+import json
+import os
+import sys
+import threading
+import time
+import types
+from datetime import datetime, timezone
+
+ENABLED = os.environ.get("STARTUP_PROFILE", "0").lower() not in ("", "0", "false", "no")
+METRICS_FILE = os.environ.get("STARTUP_PROFILE_FILE", "startup_metrics.jsonl")
+
+# Modules the login page cannot render without; everything else should be lazy.
+LOGIN_CRITICAL_MODULES = ["streamlit", "streamlit_oauth"]
+
+
+def _process_start_epoch() -> float:
+    """Wall-clock time the process started (Linux /proc), falling back to this module's import."""
+    try:
+        with open("/proc/self/stat", "r") as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat", "r") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except Exception:
+        return time.time()
+
+
+PROCESS_START = _process_start_epoch()
+
+_lock = threading.Lock()
+_import_times = {}  # module name -> [cumulative seconds, self seconds]
+_local = threading.local()  # .stack: [module name, seconds spent in child imports] per importing thread
+_marks = {}
+_printed_imports = False
+PROCESS_ID = f"{os.getpid()}@{PROCESS_START:.0f}"
+
+
+def _import_stack() -> list:
+    """This thread's stack of in-progress imports; Streamlit script threads import concurrently."""
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class _TimedLoader(importlib.abc.Loader):
+    """Wrap a real loader and time its exec_module."""
+
+    def __init__(self, loader):
+        self._loader = loader
+
+    def __getattr__(self, name):
+        return getattr(self._loader, name)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        name = module.__name__
+        stack = _import_stack()
+        stack.append([name, 0.0])
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            elapsed = time.perf_counter() - start
+            _, child_time = stack.pop()
+            if stack:
+                stack[-1][1] += elapsed
+            with _lock:
+                _import_times[name] = [elapsed, elapsed - child_time]
+
+
+class _ImportTimer(importlib.abc.MetaPathFinder):
+    """Meta path hook that finds the real spec and swaps in a timing loader."""
+
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader)
+                return spec
+        return None
+
+
+def install():
+    """Start timing imports (no-op unless STARTUP_PROFILE is set). Safe to call on every rerun."""
+    if ENABLED and not any(isinstance(f, _ImportTimer) for f in sys.meta_path):
+        sys.meta_path.insert(0, _ImportTimer())
+
+
+def mark(event: str):
+    """Record the first time `event` happens in this process, e.g. 'login_page_rendered'.
+
+    The first mark is treated as first paint; every new mark rewrites the process's report.
+    """
+    if not ENABLED:
+        return
+    with _lock:
+        if event in _marks:
+            return
+        _marks[event] = time.time() - PROCESS_START
+    report()
+
+
+def _persist(metrics: dict):
+    """Replace this process's line in METRICS_FILE (other processes' lines are kept)."""
+    lines = []
+    if os.path.exists(METRICS_FILE):
+        with open(METRICS_FILE, "r") as f:
+            for line in f:
+                try:
+                    if json.loads(line).get("process") == PROCESS_ID:
+                        continue
+                except ValueError:
+                    pass
+                lines.append(line if line.endswith("\n") else line + "\n")
+    lines.append(json.dumps(metrics) + "\n")
+    tmp_path = f"{METRICS_FILE}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.writelines(lines)
+    os.replace(tmp_path, METRICS_FILE)
+
+
+def report(top: int = 25) -> dict:
+    """Print and persist the slowest imports and the marks recorded so far in this process."""
+    global _printed_imports
+    with _lock:
+        slowest = sorted(_import_times.items(), key=lambda kv: kv[1][0], reverse=True)[:top]
+        metrics = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "process": PROCESS_ID,
+            "revision": os.environ.get("K_REVISION", "local"),
+            "first_paint_s": round(min(_marks.values()), 3) if _marks else None,
+            "marks_s": {k: round(v, 3) for k, v in _marks.items()},
+            "imports": {name: {"cumulative_ms": round(c * 1000, 1), "self_ms": round(s * 1000, 1)}
+                        for name, (c, s) in slowest},
+        }
+        print_imports, _printed_imports = not _printed_imports, True
+
+        if print_imports:
+            print(f"⏱️ Startup: first paint {metrics['first_paint_s']}s after process start")
+            for name, t in metrics["imports"].items():
+                print(f"   {t['cumulative_ms']:>8.1f} ms  (self {t['self_ms']:>7.1f} ms)  {name}")
+        else:
+            print(f"⏱️ Startup marks: {metrics['marks_s']}")
+        try:
+            _persist(metrics)
+        except OSError as e:
+            print(f"⚠️ Could not write startup metrics to {METRICS_FILE}: {e}")
+    return metrics
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy that performs the real import on first attribute access.
+
+    eg. ppw = lazy_import("rewrite_plot_portfolio_weights")  # plotly not imported yet
+        ppw.plot_cashflow(...)                              # imported here
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self):
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name: str) -> types.ModuleType:
+    """Return the module if already imported, otherwise a LazyModule proxy for it."""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def is_available(name: str) -> bool:
+    """True if `name` can be imported, without importing it."""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _measure_cold_import(modules: list) -> float:
+    """Import `modules` in a fresh interpreter and return the wall time in ms."""
+    import subprocess
+    code = "import time; t = time.perf_counter(); " + "; ".join(f"import {m}" for m in modules) + \
+           "; print((time.perf_counter() - t) * 1000)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Measure cold import time of the login-critical modules")
+    parser.add_argument("--modules", nargs="+", default=LOGIN_CRITICAL_MODULES)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--budget-ms", type=float, default=None, help="fail if the median exceeds this")
+    args = parser.parse_args()
+
+    samples = sorted(_measure_cold_import(args.modules) for _ in range(args.runs))
+    median = samples[len(samples) // 2]
+    print(f"cold import of {', '.join(args.modules)}: median {median:.0f} ms over {args.runs} runs {samples}")
+    with open(METRICS_FILE, "a") as f:
+        f.write(json.dumps({"timestamp": datetime.now(timezone.utc).isoformat(), "modules": args.modules,
+                            "cold_import_ms": round(median, 1)}) + "\n")
+    if args.budget_ms is not None and median > args.budget_ms:
+        print(f"❌ over budget ({args.budget_ms:.0f} ms)")
+        sys.exit(1)
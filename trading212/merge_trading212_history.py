@@ -1,37 +1,177 @@
 import pandas as pd
 import os
+import glob
+import hashlib
+import sqlite3
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Compacted store of every merged transaction, keyed by the Trading212 `ID`.
+# Source files are remembered by content hash, so each export is only read once.
+DEFAULT_DB_NAME = "trading212_history.sqlite"
+
+
+def _file_hash(file_path: str) -> str:
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Columns that identify a transaction without an ID (deposits, interest, ...). Hashing only
+# these keeps the synthetic ID stable across exports that differ in their extra columns.
+IDENTITY_COLUMNS = ["Action", "Time", "Ticker", "No. of shares", "Total", "Currency (Total)"]
+NUMERIC_IDENTITY_COLUMNS = ["No. of shares", "Total"]
+
+
+def _normalise(df: pd.DataFrame) -> pd.DataFrame:
+    """Unify export schemas and make sure every row has an ID."""
+    # some exports have 'Currency (Result)' instead of 'Currency (Total)'
+    if "Currency (Result)" in df.columns and "Currency (Total)" not in df.columns:
+        df = df.rename(columns={"Currency (Result)": "Currency (Total)"})
+    if "ID" not in df.columns:
+        df["ID"] = None
+    missing_id = df["ID"].isna()
+    if missing_id.any():
+        # rows without an ID get a stable one derived from their identity columns; true repeats
+        # within one export (eg. two equal deposits at the same time) are numbered, as in ledger._finalise
+        identity = df.loc[missing_id].reindex(columns=IDENTITY_COLUMNS)
+        for col in IDENTITY_COLUMNS:
+            if col in NUMERIC_IDENTITY_COLUMNS:
+                identity[col] = pd.to_numeric(identity[col], errors="coerce").astype("float64")
+            else:
+                identity[col] = identity[col].astype("string").str.strip()
+        content = pd.util.hash_pandas_object(identity, index=False).astype(str)
+        df.loc[missing_id, "ID"] = "row:" + content + "-" + content.groupby(content).cumcount().astype(str)
+    df["ID"] = df["ID"].astype(str)
+    return df
+
+
+class Trading212HistoryStore:
+    """SQLite store of Trading212 transactions with an ID primary key and a source file manifest.
+
+    eg. store = Trading212HistoryStore("trading212/trading212_history.sqlite")
+        store.merge_folder("trading212")   # reads only files it has not seen before
+        df_all = store.load_all()
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS transactions ("ID" TEXT PRIMARY KEY NOT NULL, "Time" TEXT)')
+            conn.execute('CREATE INDEX IF NOT EXISTS transactions_time ON transactions ("Time")')
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS source_files ("
+                "sha256 TEXT PRIMARY KEY, name TEXT, rows INTEGER, new_rows INTEGER, merged_at TEXT)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Connection that commits on success and is always closed."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _columns(self, conn: sqlite3.Connection) -> list:
+        return [row[1] for row in conn.execute("PRAGMA table_info(transactions)")]
+
+    def is_merged(self, file_hash: str) -> bool:
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM source_files WHERE sha256 = ?", (file_hash,)).fetchone() is not None
+
+    def append(self, df: pd.DataFrame) -> int:
+        """Insert rows whose ID is not stored yet; returns how many were new."""
+        df = _normalise(df.copy())
+        with self._connect() as conn:
+            existing = set(self._columns(conn))
+            for col in df.columns:
+                if col not in existing:
+                    conn.execute(f'ALTER TABLE transactions ADD COLUMN "{col}"')
+            columns = ", ".join(f'"{c}"' for c in df.columns)
+            placeholders = ", ".join("?" for _ in df.columns)
+            rows = df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+            before = conn.total_changes
+            conn.executemany(f"INSERT OR IGNORE INTO transactions ({columns}) VALUES ({placeholders})", rows)
+            return conn.total_changes - before
+
+    def merge_file(self, file_path: str) -> int:
+        """Merge one export unless a file with the same content was merged before."""
+        file_hash = _file_hash(file_path)
+        if self.is_merged(file_hash):
+            return 0
+        df = pd.read_csv(file_path)
+        new_rows = self.append(df)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO source_files VALUES (?, ?, ?, ?, ?)",
+                (file_hash, os.path.basename(file_path), len(df), new_rows, datetime.now(timezone.utc).isoformat())
+            )
+        print(f"Merged {os.path.basename(file_path)}: {new_rows} new of {len(df)} rows")
+        return new_rows
+
+    def merge_folder(self, path: str, pattern: str = "from*.csv") -> int:
+        """Merge every not-yet-seen export in `path`; returns the number of new transactions."""
+        return sum(self.merge_file(f) for f in sorted(glob.glob(os.path.join(path, pattern))))
+
+    def load_all(self) -> pd.DataFrame:
+        """Every stored transaction sorted by Time, with Time parsed."""
+        with self._connect() as conn:
+            df = pd.read_sql_query('SELECT * FROM transactions ORDER BY "Time"', conn)
+        df["Time"] = pd.to_datetime(df["Time"], errors="coerce")
+        return df
+
+    def source_files(self) -> pd.DataFrame:
+        with self._connect() as conn:
+            return pd.read_sql_query("SELECT * FROM source_files ORDER BY merged_at", conn)
+
+
+def merge_trading212_history(path: str, incremental: bool = True) -> pd.DataFrame:
+    """Merge every from*.csv export in `path` and return the deduplicated history.
+
+    Incremental (default): new exports are appended to `path`/trading212_history.sqlite,
+    skipping files already merged (by content hash) and IDs already stored.
+    incremental=False: re-read every file and write a single merged from_<min>_to_<max>_trading212.csv.
+    """
+    if incremental:
+        store = Trading212HistoryStore(os.path.join(path, DEFAULT_DB_NAME))
+        store.merge_folder(path)
+        return store.load_all()
 
-def merge_trading212_history(path: str) -> pd.DataFrame:
     files = [f for f in os.listdir(path) if f.endswith('.csv') and f.startswith("from")]
     if not files:
         print(f"No matching CSV files found in {path}")
         return pd.DataFrame()
-    
+
     df = pd.concat([pd.read_csv(os.path.join(path, f)) for f in files])
-    
+
     # Convert Time to datetime to allow min() and max() to work correctly
     df['Time'] = pd.to_datetime(df['Time'])
-    
+
     df_trading212 = df.drop_duplicates(subset=['ID'], keep='first')
-    
+
     # Sort by Time for consistency
     df_trading212 = df_trading212.sort_values(by='Time')
-    
+
     min_date = df_trading212['Time'].min().strftime('%Y-%m-%d')
     max_date = df_trading212['Time'].max().strftime('%Y-%m-%d')
     filename = f"from_{min_date}_to_{max_date}_trading212.csv"
-    
+
     output_path = os.path.join(path, filename)
     df_trading212.to_csv(output_path, index=False)
     print(f"Merged history saved to {output_path}")
     return df_trading212
 
 if __name__ == "__main__":
-    # Use the directory where the script is located
+    # Use the directory where the script is located; pass --full for a single merged CSV instead
     script_dir = os.path.dirname(os.path.abspath(__file__))
-    df_trading212 = merge_trading212_history(script_dir)
-    
+    df_trading212 = merge_trading212_history(script_dir, incremental="--full" not in sys.argv)
+
     if not df_trading212.empty:
         print(df_trading212.head())
         print(df_trading212.tail())
-        print(f"Total records: {len(df_trading212)}")
\ No newline at end of file
+        print(f"Total records: {len(df_trading212)}")
@@ -0,0 +1,137 @@
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+
+# Add parent directory to path so we can import shared modules
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from getEODprice import getEODpriceUK, getEODpriceUSA
+from market_data_api import OHLC_YahooFinance
+
+# Per-ticker probe results, kept next to the Trading212 exports.
+DEFAULT_HEALTH_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "ticker_health.json")
+DEFAULT_MAX_AGE = timedelta(hours=24)
+DEFAULT_MAX_WORKERS = 8
+
+STATUS_COLUMNS = ["Yahoo Ticker", "Yahoo Historical", "Last Close (Yahoo)", "EOD Price", "EOD Value", "Checked At"]
+
+
+def probe_yahoo_historical(ticker: str) -> dict:
+    """Fetch the last week of daily bars through market_data_api."""
+    try:
+        start = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
+        data = OHLC_YahooFinance(ticker, start).yahooDataV8()
+        return {"Yahoo Historical": "✅", "Last Close (Yahoo)": round(float(data["close"].iloc[-1]), 4)}
+    except Exception as e:
+        return {"Yahoo Historical": f"❌ {e}", "Last Close (Yahoo)": None}
+
+
+def probe_eod_price(ticker: str) -> dict:
+    """Fetch the EOD price through getEODprice (UK path for .L/.DE, 12data otherwise)."""
+    try:
+        if ticker.endswith(".L") or ticker.endswith(".DE"):
+            prices = getEODpriceUK([ticker])
+        else:
+            prices = getEODpriceUSA([ticker])
+        eod = prices.get(ticker)
+        if eod is None:
+            # a failure, so needs_probe() checks it again on the next run
+            return {"EOD Price": "❌ no price", "EOD Value": None}
+        return {"EOD Price": "✅", "EOD Value": float(eod)}
+    except Exception as e:
+        return {"EOD Price": f"❌ {e}", "EOD Value": None}
+
+
+class TickerHealthStore:
+    """Accessibility status of every Yahoo ticker, persisted as JSON with a check timestamp.
+
+    Both probes of every ticker run concurrently on a bounded thread pool, and only tickers
+    that were never checked, are older than `max_age`, or failed a probe last time are
+    probed again.
+
+    eg. store = TickerHealthStore("trading212/ticker_health.json")
+        df_check = store.check(["AMZN", "VOD.L"])   # network only for stale/failed tickers
+    """
+
+    def __init__(self, path: str = DEFAULT_HEALTH_FILE, max_age: timedelta = DEFAULT_MAX_AGE,
+                 max_workers: int = DEFAULT_MAX_WORKERS):
+        self.path = path
+        self.max_age = max_age
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+
+    def load(self) -> dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable ticker health file {self.path}: {e}")
+            return {}
+
+    def _save(self, statuses: dict):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(statuses, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def needs_probe(self, status: dict, now: datetime = None) -> bool:
+        """True when a ticker has no usable result: never checked, stale, or failing."""
+        if not status:
+            return True
+        if status.get("Yahoo Historical") != "✅" or status.get("EOD Price") != "✅":
+            return True
+        now = now or datetime.now(timezone.utc)
+        try:
+            checked_at = datetime.fromisoformat(status["Checked At"])
+        except (KeyError, TypeError, ValueError):
+            return True
+        return now - checked_at > self.max_age
+
+    def probe(self, tickers: list) -> dict:
+        """Run both probes for every ticker on the pool and return {ticker: status}."""
+        if not tickers:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, 2 * len(tickers))) as pool:
+            futures = {
+                ticker: (pool.submit(probe_yahoo_historical, ticker), pool.submit(probe_eod_price, ticker))
+                for ticker in tickers
+            }
+            results = {}
+            for ticker, (historical, eod) in futures.items():
+                checked_at = datetime.now(timezone.utc).isoformat()
+                results[ticker] = {**historical.result(), **eod.result(), "Checked At": checked_at}
+        return results
+
+    def check(self, tickers: list, force: bool = False) -> pd.DataFrame:
+        """Status of `tickers`, probing only those that need it (all of them when `force`)."""
+        tickers = list(dict.fromkeys(tickers))
+        with self._lock:
+            statuses = self.load()
+            now = datetime.now(timezone.utc)
+            to_probe = [t for t in tickers if force or self.needs_probe(statuses.get(t), now)]
+            if to_probe:
+                print(f"Probing {len(to_probe)} of {len(tickers)} tickers")
+                statuses.update(self.probe(to_probe))
+                self._save(statuses)
+        return self.to_frame(statuses, tickers)
+
+    def cached(self, tickers: list) -> pd.DataFrame:
+        """Last known status of `tickers` without any network calls; unchecked tickers have NaN."""
+        return self.to_frame(self.load(), tickers)
+
+    @staticmethod
+    def to_frame(statuses: dict, tickers: list) -> pd.DataFrame:
+        rows = [{"Yahoo Ticker": t, **statuses.get(t, {})} for t in tickers]
+        return pd.DataFrame(rows).reindex(columns=STATUS_COLUMNS)
+
+
+def check_ticker_accessibility(yahoo_tickers: list, force: bool = False,
+                               path: str = DEFAULT_HEALTH_FILE) -> pd.DataFrame:
+    """Accessibility of each Yahoo ticker via market_data_api and getEODprice, from the health store."""
+    return TickerHealthStore(path).check(yahoo_tickers, force=force)
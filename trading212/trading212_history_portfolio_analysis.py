@@ -1,14 +1,18 @@
+import numpy as np
 import pandas as pd
 import streamlit as st
 import os
 import sys
 import glob
-from datetime import datetime, timedelta
+from datetime import datetime
 
 # Add parent directory to path so we can import shared modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from getEODprice import getEODpriceUK, getEODpriceUSA
 from market_data_api import OHLC_YahooFinance, HistoricalMarketData
+from merge_trading212_history import Trading212HistoryStore, DEFAULT_DB_NAME
+from ticker_health import TickerHealthStore
+from ledger import t212_yahoo_ticker
 
 
 # ─── Ticker Mapping ───────────────────────────────────────────────────
@@ -19,6 +23,7 @@ from market_data_api import OHLC_YahooFinance, HistoricalMarketData
 #   - Currency is GBX or GBP and ISIN is GB*/IE* → LSE, append .L
 #   - Currency is EUR → likely Xetra, append .DE
 # This heuristic covers the majority of cases; override via TICKER_OVERRIDES.
+# The rules live in ledger.t212_yahoo_ticker, shared with the cross-broker ledger.
 
 TICKER_OVERRIDES = {
     # Add manual overrides here if needed, e.g.:
@@ -26,71 +31,30 @@ TICKER_OVERRIDES = {
 }
 
 
-def map_to_yahoo_ticker(row: pd.Series) -> str:
-    """Convert a Trading212 ticker to a Yahoo Finance compatible ticker."""
-    ticker = row.get("Ticker")
-    if pd.isna(ticker) or ticker == "":
-        return None
-
-    # Check manual overrides first
-    if ticker in TICKER_OVERRIDES:
-        return TICKER_OVERRIDES[ticker]
-
-    isin = str(row.get("ISIN", ""))
-    currency = str(row.get("Currency (Price / share)", ""))
-
-    # GBX / GBP with GB or IE ISIN → London Stock Exchange
-    if currency in ("GBX", "GBP") or (isin.startswith("GB") and currency not in ("USD", "EUR")):
-        return f"{ticker}.L"
-
-    # EUR currency → Xetra
-    if currency == "EUR":
-        return f"{ticker}.DE"
-
-    # US or CA ISINs traded in USD → use as-is (NYSE / NASDAQ)
-    if isin.startswith("US") or isin.startswith("CA"):
-        return ticker
-
-    # IE ISINs with USD → could be LSE-listed ETF priced in USD, try .L first
-    if isin.startswith("IE"):
-        return f"{ticker}.L"
-
-    # Default: use as-is
-    return ticker
+def map_to_yahoo_tickers(df: pd.DataFrame) -> pd.Series:
+    """Convert Trading212 tickers to Yahoo Finance compatible tickers, for every row at once."""
+    ticker = df["Ticker"].astype("string")
+    isin = df["ISIN"] if "ISIN" in df.columns else pd.Series("", index=df.index)
+    yahoo = t212_yahoo_ticker(ticker, isin, df["Currency (Price / share)"])
+    # manual overrides win; missing / empty tickers map to None
+    yahoo = ticker.map(TICKER_OVERRIDES).fillna(yahoo)
+    return yahoo.where(ticker.notna() & ticker.ne(""), None)
 
 
 # ─── Data Loading ─────────────────────────────────────────────────────
 
 @st.cache_data
 def load_all_csv_files(folder: str) -> pd.DataFrame:
-    """Read all from_202*.csv files, unify schemas, concatenate, and deduplicate by ID."""
-    csv_files = sorted(glob.glob(os.path.join(folder, "from_202*.csv")))
-    if not csv_files:
-        return pd.DataFrame()
-
-    frames = []
-    for f in csv_files:
-        df = pd.read_csv(f)
-        # Normalise: some files have 'Currency (Result)' column, some don't
-        if "Currency (Result)" in df.columns and "Currency (Total)" not in df.columns:
-            df.rename(columns={"Currency (Result)": "Currency (Total)"}, inplace=True)
-        frames.append(df)
+    """Merge any new from_202*.csv files into the folder's history store and load all unique transactions.
 
-    df_all = pd.concat(frames, ignore_index=True)
-
-    # Deduplicate on `ID` column (unique transaction identifier from Trading212)
-    before = len(df_all)
-    df_all.drop_duplicates(subset=["ID"], keep="first", inplace=True)
-    after = len(df_all)
-    if before != after:
-        st.info(f"ℹ️ Removed **{before - after}** duplicate rows (by ID). Kept {after} unique transactions.")
-
-    # Parse datetime
-    df_all["Time"] = pd.to_datetime(df_all["Time"], errors="coerce")
-    df_all.sort_values("Time", inplace=True)
-    df_all.reset_index(drop=True, inplace=True)
-
-    return df_all
+    Files already merged (same content hash) are not re-read and transactions are
+    deduplicated by `ID` in the store, so the cost no longer grows with every export.
+    """
+    store = Trading212HistoryStore(os.path.join(folder, DEFAULT_DB_NAME))
+    new_rows = store.merge_folder(folder, pattern="from_202*.csv")
+    if new_rows:
+        st.info(f"ℹ️ Merged **{new_rows}** new transactions into the history store.")
+    return store.load_all()
 
 
 # ─── Helpers ──────────────────────────────────────────────────────────
@@ -110,13 +74,13 @@ def filter_trades(df: pd.DataFrame) -> pd.DataFrame:
     return df[df["Action"].isin(TRADE_ACTIONS)].copy()
 
 
-def calculate_direction(action: str) -> int:
-    """Return +1 for buys, -1 for sells."""
-    if "buy" in action.lower():
-        return 1
-    elif "sell" in action.lower():
-        return -1
-    return 0
+def calculate_direction(actions: pd.Series) -> pd.Series:
+    """Return +1 for buys, -1 for sells, 0 otherwise."""
+    actions = actions.fillna("").str.lower()
+    return pd.Series(
+        np.select([actions.str.contains("buy"), actions.str.contains("sell")], [1, -1], default=0),
+        index=actions.index,
+    )
 
 
 @st.cache_data
@@ -146,58 +110,19 @@ def get_historical_fx(start_date: str) -> dict:
     return fx_data
 
 
-def convert_to_gbp(row, gbpusd_rate, gbpeur_rate):
-    """Convert market value to GBP based on ticker suffix."""
-    ticker = row.name  # index is Yahoo ticker
-    mv = row["Market Value"]
-    if ticker.endswith(".L"):
-        return mv  # already in GBP (or GBX → handled elsewhere)
-    elif ticker.endswith(".DE"):
-        return mv / gbpeur_rate
-    else:
-        return mv / gbpusd_rate
-
+def convert_to_gbp(df_positions: pd.DataFrame, gbpusd_rate: float, gbpeur_rate: float) -> pd.Series:
+    """Market value in GBP for positions indexed by Yahoo ticker.
 
-# ─── Market Data Accessibility Check ─────────────────────────────────
-
-@st.cache_data
-def check_ticker_accessibility(yahoo_tickers: list) -> pd.DataFrame:
+    .L is already GBP except GBX-priced instruments, which are in pence; .DE is EUR; anything else USD.
     """
-    For each Yahoo ticker, test:
-      1. Whether OHLC_YahooFinance can fetch historical data
-      2. Whether getEODprice can fetch the EOD price
-    Returns a summary DataFrame.
-    """
-    results = []
-    for ticker in yahoo_tickers:
-        row = {"Yahoo Ticker": ticker}
-
-        # Test 1: Yahoo Finance historical data (market_data_api)
-        try:
-            start = (datetime.now() - timedelta(days=7)).strftime("%Y-%m-%d")
-            data = OHLC_YahooFinance(ticker, start).yahooDataV8()
-            row["Yahoo Historical"] = "✅"
-            row["Last Close (Yahoo)"] = round(data["close"].iloc[-1], 4)
-        except Exception as e:
-            row["Yahoo Historical"] = f"❌ {e}"
-            row["Last Close (Yahoo)"] = None
-
-        # Test 2: EOD price (getEODprice)
-        try:
-            if ticker.endswith(".L") or ticker.endswith(".DE"):
-                prices = getEODpriceUK([ticker])
-            else:
-                prices = getEODpriceUSA([ticker])
-            eod = prices.get(ticker)
-            row["EOD Price"] = "✅"
-            row["EOD Value"] = eod
-        except Exception as e:
-            row["EOD Price"] = f"❌ {e}"
-            row["EOD Value"] = None
-
-        results.append(row)
-
-    return pd.DataFrame(results)
+    tickers = df_positions.index.to_series()
+    mv = df_positions["Market Value"]
+    divisor = np.select(
+        [df_positions["Currency"].eq("GBX").to_numpy(), tickers.str.endswith(".L"), tickers.str.endswith(".DE")],
+        [100.0, 1.0, gbpeur_rate],
+        default=gbpusd_rate,
+    )
+    return mv / divisor
 
 
 # ─── Trading Summary ─────────────────────────────────────────────────
@@ -205,9 +130,8 @@ def check_ticker_accessibility(yahoo_tickers: list) -> pd.DataFrame:
 def symbol_trading_summary(df_trades: pd.DataFrame) -> pd.DataFrame:
     """Summarise first buy date, current quantity, and last date per ticker."""
     df = df_trades.copy()
-    df["Signed Qty"] = df.apply(
-        lambda r: r["No. of shares"] * calculate_direction(r["Action"]), axis=1
-    )
+    if "Signed Qty" not in df.columns:
+        df["Signed Qty"] = df["No. of shares"] * calculate_direction(df["Action"])
     g = df.groupby("Yahoo Ticker")
 
     out = pd.DataFrame({
@@ -246,11 +170,11 @@ with st.expander("📋 Raw Transaction Data", expanded=False):
 
 # ─── Filter Trades Only ──────────────────────────────────────────────
 df_trades = filter_trades(df_all)
-df_trades["Direction"] = df_trades["Action"].apply(calculate_direction)
+df_trades["Direction"] = calculate_direction(df_trades["Action"])
 df_trades["Signed Qty"] = df_trades["No. of shares"] * df_trades["Direction"]
 
 # Map to Yahoo tickers
-df_trades["Yahoo Ticker"] = df_trades.apply(map_to_yahoo_ticker, axis=1)
+df_trades["Yahoo Ticker"] = map_to_yahoo_tickers(df_trades)
 
 st.header("🔄 Trades Overview")
 st.write(f"Found **{len(df_trades)}** trade transactions across **{df_trades['Ticker'].nunique()}** instruments.")
@@ -263,6 +187,11 @@ with st.expander("🗺️ Ticker Mapping (Trading212 → Yahoo Finance)", expand
         .sort_values("Ticker")
         .reset_index(drop=True)
     )
+    # last known accessibility from the health store; no network calls here
+    ticker_status = TickerHealthStore().cached(ticker_map["Yahoo Ticker"].dropna().unique().tolist())
+    ticker_map = ticker_map.merge(
+        ticker_status[["Yahoo Ticker", "Yahoo Historical", "EOD Price", "Checked At"]], on="Yahoo Ticker", how="left"
+    )
     st.dataframe(ticker_map, width="stretch")
 
 # ─── Market Data Accessibility Check ─────────────────────────────────
@@ -271,9 +200,10 @@ st.write("Testing whether each ticker's EOD price and historical data can be acc
 
 unique_yahoo_tickers = df_trades["Yahoo Ticker"].dropna().unique().tolist()
 
+recheck_all = st.checkbox("Re-check every ticker (default: only new, stale or failing ones)", value=False)
 if st.button("🧪 Run Accessibility Check", type="primary"):
     with st.spinner("Checking tickers... this may take a moment."):
-        df_check = check_ticker_accessibility(unique_yahoo_tickers)
+        df_check = TickerHealthStore().check(unique_yahoo_tickers, force=recheck_all)
     st.dataframe(
         df_check.style.map(
             lambda v: "background-color: #d4edda" if v == "✅" else ("background-color: #f8d7da" if isinstance(v, str) and v.startswith("❌") else ""),
@@ -349,15 +279,8 @@ else:
         if GBPUSD is not None and GBPEUR is not None:
             gbpusd_rate = GBPUSD.iloc[-1]
             gbpeur_rate = GBPEUR.iloc[-1]
-            df_positions["Market Value GBP"] = df_positions.apply(
-                lambda r: convert_to_gbp(r, gbpusd_rate, gbpeur_rate), axis=1
-            )
-
-            # For GBX-priced instruments, values are in pence → divide by 100
-            for idx in df_positions.index:
-                orig_currency = df_trades[df_trades["Yahoo Ticker"] == idx]["Currency (Price / share)"].iloc[0] if len(df_trades[df_trades["Yahoo Ticker"] == idx]) > 0 else ""
-                if orig_currency == "GBX":
-                    df_positions.loc[idx, "Market Value GBP"] = df_positions.loc[idx, "Market Value GBP"] / 100
+            # GBX-priced instruments are in pence → divided by 100 inside convert_to_gbp
+            df_positions["Market Value GBP"] = convert_to_gbp(df_positions, gbpusd_rate, gbpeur_rate)
 
             total_gbp = df_positions["Market Value GBP"].sum()
             st.metric("Total Portfolio Value (GBP)", f"£{total_gbp:,.2f}")